@@ -16,18 +16,47 @@ import sys
 import os
 import re
 from datetime import datetime as dt
+from datetime import timedelta
 import traceback
 import importlib
 import importlib.machinery as ilmac
 import importlib.util as ilutil
 import logging
+import json
+import time
+import io
+import locale
+import hashlib
+import threading
+import socket
+import uuid
+import zipfile
+import marshal
+import types
+import importlib.abc as ilabc
+from array import array
 
 # columns in the migrations table
 VALID_COLUMNS = [
     'version', 'applied_ts', 'migration_file', 'migration_action', 'migration_type',
-    'migration_user', 'db_user', 'is_current', 'is_baseline'
+    'migration_user', 'db_user', 'is_current', 'is_baseline', 'checksum'
 ]
-VALID_ACTIONS = {'upgrade', 'downgrade', 'baseline', 'info', 'verify', 'log'}
+# columns added to the migrations table later; tables created without them are still accepted (see upgrade_migration_table())
+OPTIONAL_COLUMNS = {'checksum'}
+VALID_ACTIONS = {'upgrade', 'downgrade', 'baseline', 'info', 'verify', 'log', 'plan', 'compact', 'checksums'}
+OFFLINE_ACTIONS = {'plan'}
+READONLY_ACTIONS = {'info', 'verify', 'log', 'checksums'}
+JOURNAL_STATES = ('pending', 'running', 'done', 'failed')
+TRANSACTION_MODES = ('script', 'batch', 'savepoint')
+MIGRATION_FILE_TYPES = ('sql', 'py', 'csv', 'ndjson')
+LOG_FORMATS = ('table', 'csv', 'ndjson')
+COMPRESSION_TYPES = ('gz', 'bz2', 'xz')
+BUNDLE_INDEX_NAME = 'index.json'
+BUNDLE_FORMAT_VERSION = 1
+PLAN_MAGIC = 'pydbvolve-plan'
+PLAN_FORMAT_VERSION = 1
+STATUS_FORMAT_VERSION = 1
+JOURNAL_FORMAT_VERSION = 1
 LATEST_VERSION = '\x00LATEST\x00'
 CURRENT_VERSION = '\x00CURRENT\x00'
 BASELINE_VERSION = '\x00BASELINE\x00'
@@ -35,7 +64,7 @@ BASELINE_VERSION = '\x00BASELINE\x00'
 LOG_FORMAT = '%(asctime)s %(levelname)s %(migration_user)s: %(message)s'
 LOG_ECHO_FORMAT = '%(asctime)s: %(message)s'
 
-_BASE_VALUE_LENGTHS = [10, 28, 25, 8, 7, 15, 15, 5, 5]
+_BASE_VALUE_LENGTHS = [10, 28, 25, 8, 7, 15, 15, 5, 5, 12]
 COLUMN_LENGTHS = [max((_BASE_VALUE_LENGTHS[i], len(VALID_COLUMNS[i]))) for i in range(len(VALID_COLUMNS))]
 
 
@@ -116,6 +145,33 @@ def post_statement(config, migration, statement):
 # End post_statement
 
 
+def check_database_pressure(config):
+    """
+    Called by throttle() between SQL migration statements and between batches of the batch helpers.
+    Returns True if the database is overloaded (e.g. lock waits or replication lag are too high) and the 
+    migration should pause. Default is False.
+    Accepts config dict as an argument.
+    Overide this function in your config file to probe your database.
+    """
+    
+    return False
+# End check_database_pressure
+
+
+def load_data_batch(config, migration, table, columns, rows):
+    """
+    Called on data migrations only. Loads one batch (a list of value tuples) into the target table.
+    Default is an executemany of the insert statement from get_data_insert_sql().
+    Overide this function in your config file to use a bulk path of your database module (e.g. COPY).
+    """
+    
+    with config['conn'].cursor() as cur:
+        cur.executemany(get_data_insert_sql(config, table, columns), rows)
+    
+    return None
+# End load_data_batch
+
+
 def get_migration_user(config):
     """
     Returns the username of the program executor.
@@ -173,6 +229,54 @@ def get_migration_downgrade_dir(migration_base_dir):
 # End get_migration_downgrade_dir
 
 
+def get_migration_repeatable_dir(migration_base_dir):
+    """
+    Returns the directory of the repeatable migrations (see get_repeatable_migrations()) or None. 
+    Default is get_migration_base_dir() + '/repeatables'.
+    Overide this function in your config file to set a custom directory.
+    """
+    
+    return os.path.join(migration_base_dir, "repeatables")
+# End get_migration_repeatable_dir
+
+
+def get_migration_bundle_file(migration_base_dir):
+    """
+    Returns the path of a zip bundle of migrations or None. Default is None (migrations are read from 
+    the upgrade and downgrade directories).
+    When set, migrations are discovered from the bundle's index and read straight from the archive 
+    members without extraction. See write_migration_bundle().
+    Overide this function in your config file to set a bundle file.
+    """
+    
+    return None
+# End get_migration_bundle_file
+
+
+def get_migration_support_path(migration_base_dir):
+    """
+    Returns the path of a migration support module (a .py file or a package directory) or None. Default is None.
+    The support module is imported once per run and injected into the namespace of every Python migration 
+    as 'migration_support', along with the run-scoped cache dict 'run_cache'.
+    Overide this function in your config file to set a support module.
+    """
+    
+    return None
+# End get_migration_support_path
+
+
+def get_migration_plan_file(migration_base_dir):
+    """
+    Returns the path of the precompiled migration plan (see compile_migration_plan()). 
+    Default is get_migration_base_dir() + '/migrations.plan'.
+    If the plan file does not exist or is stale, migrations are read from the loose files (or bundle).
+    Overide this function in your config file to set a custom path or return None to never use a plan.
+    """
+    
+    return os.path.join(migration_base_dir, 'migrations.plan')
+# End get_migration_plan_file
+
+
 def get_log_dir(base_dir):
     """
     Returns the base directory for the migrations. Default is get_base_dir() + '/logs'.
@@ -183,6 +287,39 @@ def get_log_dir(base_dir):
 # End get_log_dir
 
 
+def get_cache_dir(base_dir):
+    """
+    Returns the directory for pydbvolve caches (ex: compiled bytecode of Python migrations) or None. 
+    Default is None (no disk caches). Return a directory (ex: get_base_dir() + '/cache') to enable caching.
+    Overide this function in your config file to set a custom directory.
+    """
+    
+    return None
+# End get_cache_dir
+
+
+def get_status_file(base_dir):
+    """
+    Returns None or the path of the status snapshot file written after every successful upgrade, downgrade 
+    and baseline. Default is None (no status file).
+    Overide this function in your config file to let probes verify the version without a database connection.
+    """
+    
+    return None
+# End get_status_file
+
+
+def get_status_file_max_age():
+    """
+    Returns the age (seconds) after which the status file is no longer trusted and the database is used. Default is 60.0.
+    None means the status file never expires.
+    Overide this function in your config file to set a different value.
+    """
+    
+    return 60.0
+# End get_status_file_max_age
+
+
 def get_migration_table_name():
     """
     Returns the name of the table that will store the migration run records. Default is '__migrations__'.
@@ -194,6 +331,67 @@ def get_migration_table_name():
 # End get_migration_table_name
 
 
+def get_migration_checkpoint_table_name():
+    """
+    Returns the name of the table that will store the checkpoints of SQL migrations with commit points. 
+    Default is '__migration_checkpoints__'. The table is created in the migration table schema when it is first needed.
+    Overide this function in your config file to set a custom name.
+    """
+    
+    return '__migration_checkpoints__'
+# End get_migration_checkpoint_table_name
+
+
+def get_migration_archive_table_name():
+    """
+    Returns the name of the table that archived migration records are moved to (see compact_migration_history()). 
+    Default is '__migrations_archive__'.
+    Overide this function in your config file to set a different value.
+    """
+    
+    return '__migrations_archive__'
+# End get_migration_archive_table_name
+
+
+def get_history_retention():
+    """
+    Returns a dict of settings used to compact the migration history (see compact_migration_history()):
+        keep_days    : records applied within this many days are kept. None for no age limit.
+        keep_rows    : this many of the newest records are kept. None for no row limit; 0 keeps none of them.
+        batch_size   : records moved to the archive table per transaction
+        auto_compact : compact after every successful upgrade and downgrade
+    The current and baseline records are always kept. If both keep_days and keep_rows are None, nothing is archived.
+    Overide this function in your config file to set different values.
+    """
+    
+    return {'keep_days': 90, 'keep_rows': 1000, 'batch_size': 1000, 'auto_compact': False}
+# End get_history_retention
+
+
+def get_migration_lock_table_name():
+    """
+    Returns the name of the table that holds the migration lock (see get_migration_lock_settings()). Default is '__migration_lock__'.
+    Overide this function in your config file to set a different value.
+    """
+    
+    return '__migration_lock__'
+# End get_migration_lock_table_name
+
+
+def get_migration_lock_settings():
+    """
+    Returns None or the settings of the migration lock that lets only one runner at a time apply migrations:
+        lease         : seconds a lock is held without a heartbeat before other runners may take it over
+        poll_interval : seconds between attempts of a waiting runner
+        max_wait      : seconds a runner waits for the lock before giving up (None waits forever)
+    Default is None (no migration lock).
+    Overide this function in your config file to enable the migration lock.
+    """
+    
+    return None
+# End get_migration_lock_settings
+
+
 def get_migration_table_schema():
     """
     Returns the name of the schema in which to create/use the migrations table. Default is 'public'.
@@ -216,6 +414,83 @@ def get_positional_variable_marker():
 # End get_positional_variable_marker
 
 
+def get_transaction_mode():
+    """
+    Returns the transaction mode used when applying a chain of migrations. Default is 'script'.
+        'script': Each migration is applied and recorded in its own transaction.
+        'batch':  The whole chain is applied in a single transaction. All migration records are written with 
+                  one executemany and the current flag is moved once at the end. Any failure rolls back the 
+                  entire chain. Only use this mode with engines that support transactional DDL.
+        'savepoint': Like 'batch', but each migration runs inside a SAVEPOINT and the outer transaction is 
+                  committed at the interval returned by get_commit_interval(). A failure only rolls back to 
+                  the last savepoint; the migrations that succeeded are recorded and committed.
+    Overide this function in your config file to set a different mode.
+    """
+    
+    return 'script'
+# End get_transaction_mode
+
+
+def get_commit_interval():
+    """
+    Returns a tuple of (migrations, seconds) used by the 'savepoint' transaction mode. 
+    The outer transaction is committed after that many migrations or once that many seconds have passed since 
+    the last commit, whichever comes first. Either value can be None to disable it. Default is (50, 30.0).
+    Overide this function in your config file to set a different interval.
+    """
+    
+    return (50, 30.0)
+# End get_commit_interval
+
+
+def get_batch_settings():
+    """
+    Returns a dict of settings for the batch helpers available to Python migrations (see run_keyset_batches()).
+        batch_size:     initial number of rows per batch
+        min_batch_size: smallest batch size allowed by adaptive sizing
+        max_batch_size: largest batch size allowed by adaptive sizing
+        target_latency: target time in seconds to fetch and process one batch. Set to None to disable adaptive sizing.
+        use_numpy:      use NumPy arrays for column batches (see run_column_batches()) when NumPy is installed
+    Overide this function in your config file to set different values.
+    """
+    
+    return {'batch_size': 1000, 'min_batch_size': 10, 'max_batch_size': 100000, 'target_latency': 0.5, 'use_numpy': True}
+# End get_batch_settings
+
+
+def get_python_migration_isolation():
+    """
+    Returns None or a dict of settings to run each Python migration in an isolated worker process. Default is None.
+        memory_limit: address space limit (RLIMIT_AS) of the worker in bytes. None for no limit.
+        cpu_limit:    CPU time limit (RLIMIT_CPU) of the worker in seconds. None for no limit.
+        timeout:      wall time in seconds after which the worker is killed. None for no limit.
+    The worker opens its own database connection (see get_db_connection()) and commits its work before the 
+    migration record is written by the main process. Its write_log messages are sent back to the main process.
+    Isolation is only allowed in the 'script' transaction mode. Requires the 'fork' start method (POSIX).
+    Overide this function in your config file to enable isolation.
+    """
+    
+    return None
+# End get_python_migration_isolation
+
+
+def get_throttle_settings():
+    """
+    Returns a dict of settings used by throttle() to limit the load a migration puts on a live database.
+        duty_cycle:             fraction of wall time spent executing (e.g. 0.5 sleeps as long as each statement ran). 
+                                None disables it.
+        max_statements_per_sec: maximum rate of statements (or batches for the batch helpers). None disables it.
+        pressure_wait:          seconds to sleep while check_database_pressure() reports overload
+        max_pressure_wait:      total seconds to wait for the pressure to clear before raising MigrationError. 
+                                None waits forever.
+    Default is no throttling.
+    Overide this function in your config file to set different values.
+    """
+    
+    return {'duty_cycle': None, 'max_statements_per_sec': None, 'pressure_wait': 5.0, 'max_pressure_wait': None}
+# End get_throttle_settings
+
+
 def set_log_file_name(config):
     """
     Returns a formatted log file name using values from the config (log_dir, version, migration_action) and current datetime
@@ -229,7 +504,11 @@ def set_log_file_name(config):
     elif version == BASELINE_VERSION:
         version = 'baseline'
     
-    config['log_file_name'] = os.path.join(config.get('log_dir', '.'), '.'.join((version.replace(' ', '_'), config['migration_action'].replace(' ', '_'), dt.now().strftime('%Y-%m-%d_%H:%M:%S'), 'log')))
+    parts = [version.replace(' ', '_'), config['migration_action'].replace(' ', '_'), dt.now().strftime('%Y-%m-%d_%H:%M:%S'), 'log']
+    if config.get('target'):
+        parts.insert(0, re.sub('[^A-Za-z0-9_.-]+', '_', str(config['target'])))
+    
+    config['log_file_name'] = os.path.join(config.get('log_dir', '.'), '.'.join(parts))
     
     return config
 # End set_log_file_name
@@ -325,16 +604,46 @@ def setup_stream_logger(config):
 # End setup_root_logger
 
 
+def setup_readonly_logger(config):
+    """
+    Setup a logger for a read-only run that does not create a log file and set it in the config dict.
+    Only warnings and errors are written (by the error handler) unless config['verbose'] is set.
+    """
+    
+    logger = logging.getLogger(config.get('logger_name', 'pydbvolve'))
+    logger.setLevel(logging.INFO)
+    
+    # Verbosity logger
+    if config.get('verbose'):
+        formatter = logging.Formatter(LOG_ECHO_FORMAT)
+        log_handler = logging.StreamHandler()
+        log_handler.setFormatter(formatter)
+        log_handler.setLevel(logging.INFO)
+        logger.addHandler(log_handler)
+    
+    config['logger'] = logger
+    setup_error_log_handler(config)
+    
+    return config
+# End setup_readonly_logger
+
+
 def setup_log(config):
     """
     Sets the config for logging and creates the logger instance for pydbvolve
+    A read-only run (see config['read_only']) never creates a log file.
     """
     
-    set_log_file_name(config)
+    if config.get('read_only'):
+        config['log_file_name'] = None
+    else:
+        set_log_file_name(config)
     set_log_level(config)
     set_logger_name(config)
     
-    if config.get('log_file_name'):
+    if config.get('read_only'):
+        setup_readonly_logger(config)
+    elif config.get('log_file_name'):
         setup_file_logger(config)
     else:
         setup_stream_logger(config)
@@ -348,9 +657,9 @@ def close_log(config):
     Flush and close the handlers
     """
     
-    log = config.get('log')
+    log = config.get('logger')
     if log:
-        for h in log.handlers:
+        for h in list(log.handlers):
             h.flush()
             h.close()
             log.removeHandler(h)
@@ -384,6 +693,17 @@ def get_db_credentials(config):
 # End get_db_credentials
 
 
+def get_db_readonly_credentials(config):
+    """
+    Returns the credentials (dict) used by the read-only actions (info, verify, log) or None. Default is None.
+    If None is returned, get_db_credentials() is used.
+    Overide this function in your config file to use a database user with read-only privileges for these actions.
+    """
+    
+    return None
+# End get_db_readonly_credentials
+
+
 def get_db_connection(config, credentials):
     """
     Override this function to use the credentials to establish a connection to your database.
@@ -396,17 +716,41 @@ def get_db_connection(config, credentials):
 # End get_db_connection    
 
 
+def get_migration_targets(config):
+    """
+    Returns a list of target names (str) for a multi-target (fleet) run. Default is an empty list.
+    Before connecting, each target name is set in config['target'] so get_db_credentials() can resolve 
+    the credentials for that target database.
+    Overide this function in your config file to run a migration action against many databases.
+    """
+    
+    return []
+# End get_migration_targets
+
+
 def get_filename_regex():
     """
     Returns a regex instance (re.compile() result) that will be used to parse the filenames 
     to get version, description, and type information (in that exact order).
+    SQL and data files may have a compression suffix ('.gz', '.bz2', '.xz') as part of the type.
     Overide this function in your config file to set a custom regex.
     """
     
-    return re.compile('^([^_]+)_([^.]+).(sql|py)$')
+    return re.compile('^([^_]+)_([^.]+).((?:sql|csv|ndjson)(?:\\.(?:gz|bz2|xz))?|py)$')
 # End get_file_regex
 
 
+def get_repeatable_filename_regex():
+    """
+    Returns a regex instance (re.compile() result) that will be used to parse the filenames of repeatable migrations 
+    to get name and type information (in that exact order). Files that do not match are ignored.
+    Overide this function in your config file to set a custom regex.
+    """
+    
+    return re.compile('^R_([^.]+).(sql(?:\\.(?:gz|bz2|xz))?|py)$')
+# End get_repeatable_filename_regex
+
+
 def get_sort_version(config, version):
     """
     Returns a form of the version obtained from the execution of get_migration_filename_info() call that can be properly sorted.
@@ -423,7 +767,8 @@ def get_migration_filename_info(config, fileName):
     {
         version: # version string
         description: # description
-        filetype: # file type. Currently only '.sql' and '.py' filetypes are supported.
+        filetype: # file type. Currently '.sql', '.py', '.csv' and '.ndjson' filetypes are supported.
+        compression: # compression suffix of the file type ('gz', 'bz2', 'xz') or None
         filename: input filename,
         sort_version: form of the version string that is sortable (See get_sort_version())
     }
@@ -438,7 +783,9 @@ def get_migration_filename_info(config, fileName):
         values = values[0]
     if len(values) == len(keys):
         info = dict(zip(keys, values))
-        info['filetype'] = info['filetype'].lower()
+        info['filetype'], _, info['compression'] = info['filetype'].lower().partition('.')
+        if info['compression'] not in COMPRESSION_TYPES:
+            info['compression'] = None
         info['filename'] = fileName
         info['sort_version'] = get_sort_version(config, info['version'])
         return info
@@ -474,11 +821,29 @@ def run_config(config):
         'migration_dir': migration_dir,
         'migration_upgrade_dir': get_migration_upgrade_dir(migration_dir),
         'migration_downgrade_dir': get_migration_downgrade_dir(migration_dir),
+        'migration_repeatable_dir': get_migration_repeatable_dir(migration_dir),
+        'migration_bundle_file': get_migration_bundle_file(migration_dir),
+        'migration_plan_file': get_migration_plan_file(migration_dir),
+        'migration_support_path': get_migration_support_path(migration_dir),
         'log_dir': get_log_dir(base_dir),
+        'cache_dir': get_cache_dir(base_dir),
+        'status_file': get_status_file(base_dir),
+        'status_file_max_age': get_status_file_max_age(),
         'migration_table_schema': schema,
         'filename_regex': get_filename_regex(),
+        'repeatable_filename_regex': get_repeatable_filename_regex(),
         'migration_table_name': get_migration_table_name(),
-        'positional_variable_marker': get_positional_variable_marker()
+        'migration_checkpoint_table_name': get_migration_checkpoint_table_name(),
+        'migration_lock_table_name': get_migration_lock_table_name(),
+        'migration_archive_table_name': get_migration_archive_table_name(),
+        'history_retention': get_history_retention(),
+        'migration_lock_settings': get_migration_lock_settings(),
+        'positional_variable_marker': get_positional_variable_marker(),
+        'transaction_mode': get_transaction_mode(),
+        'commit_interval': get_commit_interval(),
+        'batch_settings': get_batch_settings(),
+        'throttle_settings': get_throttle_settings(),
+        'python_migration_isolation': get_python_migration_isolation()
     })
     
     return config
@@ -491,67 +856,247 @@ def confirm_dirs(config):
     """
     
     for k, v in config.items():
-        if k.endswith('_dir'):
+        if k.endswith('_dir') and v:
             os.makedirs(v, mode=0o755, exist_ok=True)
 # End confirm_dirs
 
 
+# In-process cache of compiled code objects keyed by content hash (see get_code())
+_CODE_CACHE = {}
+
+
+def get_code(source, fileName, cacheDir=None):
+    """
+    Returns a code object.
+    Compiles Python source (bytes) unless the code object is already cached. Code objects are cached in-process 
+    and, if cacheDir is given, as marshal files in cacheDir. The cache key is the SHA-256 of the source, 
+    the file name and the Python bytecode magic number, so a changed file or Python version is always recompiled.
+    Errors writing the cache file are ignored.
+    """
+    
+    key = hashlib.sha256(b'\0'.join((source, fileName.encode('utf-8'), ilutil.MAGIC_NUMBER))).hexdigest()
+    code = _CODE_CACHE.get(key)
+    if code is not None:
+        return code
+    
+    cacheFileName = os.path.join(cacheDir, key + '.code') if cacheDir else None
+    if cacheFileName:
+        try:
+            with open(cacheFileName, 'rb') as cacheFile:
+                code = marshal.load(cacheFile)
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None
+    
+    if code is None:
+        code = compile(source, fileName, 'exec', dont_inherit=True)
+        if cacheFileName:
+            tmpFileName = '{}.{}.tmp'.format(cacheFileName, os.getpid())
+            try:
+                os.makedirs(cacheDir, mode=0o755, exist_ok=True)
+                with open(tmpFileName, 'wb') as cacheFile:
+                    marshal.dump(code, cacheFile)
+                os.replace(tmpFileName, cacheFileName)
+            except OSError:
+                pass
+    
+    _CODE_CACHE[key] = code
+    return code
+# End get_code
+
+
 def load_config(configFileName):
     """
     Load and execute the config Python file.
+    The compiled config is only cached in-process (see get_code()): the cache directory comes from the config itself.
     """
     
-    with open(configFileName, 'r') as configFile:
-        co = compile(configFile.read(), configFileName, 'exec')
+    with open(configFileName, 'rb') as configFile:
+        source = configFile.read()
+    co = get_code(source, configFileName)
     
     if co:
         exec(co, globals(), globals())
 # End load_config
 
 
+class MigrationState(object):
+    """
+    Per-run cache of the migration table state: the current and baseline records.
+    Loaded with a single query by check_migration_table() and kept up to date as migration records are written 
+    (see add_migration_record()). Any rollback of migration work invalidates it (see rollback_migration()) 
+    and the next read queries the database again. Only created by run_migration() (see config['migration_state']).
+    """
+    
+    def __init__(self):
+        self.loaded = False
+        self.current = {}
+        self.baseline = {}
+    
+    def load(self, records):
+        self.current = next((dict(r) for r in records if r['is_current'] == 1), {})
+        self.baseline = next((dict(r) for r in records if r['is_baseline'] == 1), {})
+        self.loaded = True
+    
+    def set_record(self, record):
+        if record.get('is_current') == 1:
+            self.current = dict(record)
+        if record.get('is_baseline') == 1:
+            self.baseline = dict(record)
+    
+    def invalidate(self):
+        self.loaded = False
+# End class MigrationState
+
+
+def get_migration_state(config):
+    """
+    Returns a MigrationState instance or None
+    Returns the loaded migration state of the run or None if there is no state or it has been invalidated.
+    """
+    
+    state = config.get('migration_state')
+    return state if (state is not None and state.loaded) else None
+# End get_migration_state
+
+
+def rollback_migration(config):
+    """
+    Roll back the migration transaction and invalidate the cached migration state.
+    """
+    
+    config['conn'].rollback()
+    state = config.get('migration_state')
+    if state is not None:
+        state.invalidate()
+# End rollback_migration
+
+
+def get_migration_table_columns(config):
+    """
+    Returns list
+    Returns the columns of the migrations table: VALID_COLUMNS less any OPTIONAL_COLUMNS that an older table lacks.
+    """
+    
+    return config.get('migration_table_columns') or VALID_COLUMNS
+# End get_migration_table_columns
+
+
+def upgrade_migration_table(config):
+    """
+    Returns bool
+    Adds the OPTIONAL_COLUMNS that the migrations table or the migration archive table (if it exists) lacks and commits. 
+    Returns False on error.
+    """
+    
+    columnTypes = {'checksum': 'varchar(64)'}
+    conn = config['conn']
+    schema = config.get('migration_table_schema', '')
+    tables = [(config['migration_table_name'], get_migration_table_columns(config), 'migration_table_columns')]
+    if check_archive_table(config):
+        tables.append((config['migration_archive_table_name'], config['migration_archive_columns'], 'migration_archive_columns'))
+    
+    for tableName, columns, configKey in tables:
+        missing = [c for c in VALID_COLUMNS if c not in columns]
+        if not missing:
+            continue
+        
+        write_log(config, 'Adding column(s) {} to the {}"{}" table'.format(', '.join(missing), schema, tableName))
+        try:
+            with conn.cursor() as cur:
+                for column in missing:
+                    cur.execute('alter table {}"{}" add column {} {};'.format(schema, tableName, column, columnTypes[column]))
+        except Exception as e:
+            write_log(config, 'EXCEPTION:: Upgrading the {}"{}" table: {}'.format(schema, tableName, e), level=logging.ERROR)
+            conn.rollback()
+            return False
+        
+        conn.commit()
+        config[configKey] = VALID_COLUMNS
+    # End table loop
+    
+    return True
+# End upgrade_migration_table
+
+
+# Migration table statement text keyed by table, marker and statement name (see get_state_sql())
+_STATE_SQL = {}
+
+
+def get_state_sql(config, name):
+    """
+    Returns str
+    Returns the SQL text of a migration table statement by name ('state', 'structure', 'current', 'baseline', 'clear_current', 
+    'clear_baseline', 'insert'). The text is built once per table and reused so drivers can reuse their prepared statements.
+    """
+    
+    table = '{}"{}"'.format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    key = (table, config.get('positional_variable_marker'), name, tuple(get_migration_table_columns(config)))
+    sql = _STATE_SQL.get(key)
+    if sql is None:
+        if name == 'state':
+            sql = "select * from {} where is_current = 1 or is_baseline = 1".format(table)
+        elif name == 'structure':
+            sql = "select * from {} where 1 = 0".format(table)
+        elif name in ('current', 'baseline'):
+            sql = "select * from {} where is_{} = 1".format(table, name)
+        elif name in ('clear_current', 'clear_baseline'):
+            flag = name.replace('clear_', 'is_')
+            sql = """
+update {0}
+   set {1} = 0
+ where {1} = 1;
+""".format(table, flag)
+        elif name == 'insert':
+            sql = get_migration_insert_sql(config)
+        else:
+            raise MigrationError("Unknown migration table statement {}".format(name))
+        _STATE_SQL[key] = sql
+    
+    return sql
+# End get_state_sql
+
+
 def check_migration_table(config):
     """
     Returns bool
     Verifies existence, structure, and unique record flags of migrations table and its data.
+    The current and baseline records are fetched with a single query. If the config has a migration state 
+    (see MigrationState), it is loaded from the same query.
+    A table that lacks only OPTIONAL_COLUMNS is accepted. The columns found are set in config['migration_table_columns'].
     """
     
     conn = config['conn']
     validCols = set(VALID_COLUMNS)
-    sql = """
-select * 
-  from {}"{}"
- where 1 = 0;
-""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    sql = get_state_sql(config, 'state')
     
     with conn.cursor() as cur:
         try:
-            write_log(config, "Checking existence of migrations table")
-            cur.execute(sql)
+            write_log(config, "Checking migrations table")
+            try:
+                cur.execute(sql)
+            except Exception as e:
+                # Either the table does not exist or its structure lacks the flag columns
+                conn.rollback()
+                cur.execute(get_state_sql(config, 'structure'))
+                records = []
+            else:
+                records = cur.fetchall()
         except Exception as e:
             write_log(config, 'The {}"{}" table does not exist'.format(config.get('schema', ''), config['migration_table_name']))
             rc = False
         else:
-            write_log(config, "Checking migrations table structure")
             gotCols = {c[0] for c in cur.description}
-            if gotCols != validCols:
+            if gotCols != validCols and gotCols != (validCols - OPTIONAL_COLUMNS):
                 raise MigrationTableOutOfSync('The {}"{}" table structure is out-of-date: cols=({}); valid=({})'.format(config.get('migration_table_schema', ''), config['migration_table_name'], sorted(gotCols), sorted(validCols)))
             
-            sql = """
-select count(*) as "count"
-  from {}"{}"
- where is_current = 1;
-""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
-            write_log(config, "Checking migrations table data")
-            cur.execute(sql)
-            res = cur.fetchone()
-            if res['count'] > 1:
-                raise MigrationTableConstraintError('The {}"{}" table data has violated a constraint. There are {} current versions when there should only be 1'.format(config.get('schema', ''), config['migration_table_name'], res['count']))
+            for flag in ('current', 'baseline'):
+                count = sum(1 for r in records if r['is_' + flag] == 1)
+                if count > 1:
+                    raise MigrationTableConstraintError('The {}"{}" table data has violated a constraint. There are {} {} versions when there should only be 1'.format(config.get('schema', ''), config['migration_table_name'], count, flag))
             
-            sql = sql.replace('current', 'baseline')
-            cur.execute(sql)
-            res = cur.fetchone()
-            if res['count'] > 1:
-                raise MigrationTableConstraintError('The {}"{}" table data has violated a constraint. There are {} baseline versions when there should only be 1'.format(config.get('schema', ''), config['migration_table_name'], res['count']))
+            if config.get('migration_state') is not None:
+                config['migration_state'].load(records)
+            config['migration_table_columns'] = [c for c in VALID_COLUMNS if c in gotCols]
             
             rc = True
         finally:
@@ -567,11 +1112,16 @@ def get_baseline(config):
     Returns a dict representing the baseline migration record or empty dict if none exist.
     """
     
+    state = get_migration_state(config)
+    if state is not None:
+        write_log(config, "Getting baseline version (cached)")
+        return dict(state.baseline)
+    
     conn = config['conn']
     try:
         write_log(config, "Getting baseline version")
         with conn.cursor() as cur:
-            cur.execute("""select * from {}"{}" where is_baseline = 1""".format(config.get('migration_table_schema', ''), config['migration_table_name']))
+            cur.execute(get_state_sql(config, 'baseline'))
             res = cur.fetchone()
             if res is None:
                 res = {}
@@ -588,12 +1138,13 @@ def clear_baseline(config):
     Unset the baseline flag on the baseline record
     """
     
+    state = get_migration_state(config)
+    if state is not None and not state.baseline:
+        write_log(config, "No baseline version to clear")
+        return True
+    
     conn = config['conn']
-    sql = """
-update {}"{}"
-   set is_baseline = 0
- where is_baseline = 1;
-""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    sql = get_state_sql(config, 'clear_baseline')
     
     write_log(config, "Clearing baseline version")
     with conn.cursor() as cur:
@@ -603,6 +1154,8 @@ update {}"{}"
             write_log(config, "EXCEPTION:: reset of baseline flag failed! {}\n Stmt:\n{}".format(e, sql), level=logging.ERROR)
             return False
         else:
+            if state is not None:
+                state.baseline = {}
             return True
 # End clear_baseline
 
@@ -645,11 +1198,16 @@ def get_current(config):
     Returns a dict representing the baseline migration record or empty dict if none exist.
     """
     
+    state = get_migration_state(config)
+    if state is not None:
+        write_log(config, "Getting current version (cached)")
+        return dict(state.current)
+    
     conn = config['conn']
     try:
         write_log(config, "Getting current version")
         with conn.cursor() as cur:
-            cur.execute("""select * from {}"{}" where is_current = 1""".format(config.get('migration_table_schema', ''), config['migration_table_name']))
+            cur.execute(get_state_sql(config, 'current'))
             res = cur.fetchone()
             if res is None:
                 res = {}
@@ -666,12 +1224,13 @@ def clear_current(config):
     Unset the current flag on the baseline record
     """
     
+    state = get_migration_state(config)
+    if state is not None and not state.current:
+        write_log(config, "No current version to clear")
+        return True
+    
     conn = config['conn']
-    sql = """
-update {}"{}"
-   set is_current = 0
- where is_current = 1;
-""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    sql = get_state_sql(config, 'clear_current')
     
     write_log(config, "Clearing current version")
     with conn.cursor() as cur:
@@ -681,30 +1240,19 @@ update {}"{}"
             write_log(config, "EXCEPTION:: reset of current flag failed! {}\n Stmt:\n{}".format(e, sql), level=logging.ERROR)
             return False
         else:
+            if state is not None:
+                state.current = {}
             return True
 # End clear_baseline
 
 
-def add_migration_record(config, migration, current=0, baseline=0):
+def get_migration_insert_sql(config):
     """
-    Adds a migration record to the migrations table. 
-    If it is a baseline record, the existing baseline will be unset. 
-    If it is a current record, the existing current will be unset.
-    Returns bool
+    Returns str
+    Returns the parameterized insert statement for a migration record.
     """
     
-    if current == 1:
-        if not clear_current(config):
-            return False
-    if baseline == 1:
-        if not clear_baseline(config):
-            return False
-    if current == 0 and baseline == 0:
-        write_log(config, "ERROR:: The flags 'current' and 'baseline' cannot both be zero (0)", level=logging.ERROR)
-        return False
-        
-    conn = config['conn']
-    sql = """
+    return """
 insert 
   into {}"{}"
        (
@@ -713,7 +1261,17 @@ insert
 values (
          {}
        )
-""".format(config.get('migration_table_schema', ''), config['migration_table_name'], ', '.join(VALID_COLUMNS), ', '.join([config['positional_variable_marker']] * len(VALID_COLUMNS)))
+""".format(config.get('migration_table_schema', ''), config['migration_table_name'], ', '.join(get_migration_table_columns(config)), ', '.join([config['positional_variable_marker']] * len(get_migration_table_columns(config))))
+# End get_migration_insert_sql
+
+
+def get_migration_record(config, migration, current=0, baseline=0):
+    """
+    Returns dict
+    Builds the migration record for a migration (keyed by VALID_COLUMNS) from the config and the migration dict.
+    The checksum is the content checksum of the migration file (see get_migration_checksum()).
+    """
+    
     valuesd = dict.fromkeys(VALID_COLUMNS)
     for k in VALID_COLUMNS:
         valuesd[k] = config.get(k)
@@ -724,8 +1282,43 @@ values (
     valuesd['migration_file'] = os.path.basename(migration.get('filename', ''))[:256]
     valuesd['migration_type'] = migration.get('filetype', '')
     valuesd['version'] = migration.get('version', config['version'])
-    
-    values = tuple(valuesd[c] for c in VALID_COLUMNS)
+    valuesd['checksum'] = None
+    if migration.get('filename'):
+        try:
+            if 'file_checksum' not in migration:
+                migration['file_checksum'] = get_migration_checksum(config, migration)
+            valuesd['checksum'] = migration['file_checksum']
+        except Exception as e:
+            write_log(config, "Cannot get the checksum of {}: {}".format(migration['filename'], e), level=logging.WARNING)
+    
+    return valuesd
+# End get_migration_record
+
+
+def add_migration_record(config, migration, current=0, baseline=0):
+    """
+    Adds a migration record to the migrations table. 
+    If it is a baseline record, the existing baseline will be unset. 
+    If it is a current record, the existing current will be unset.
+    Returns bool
+    """
+    
+    if current == 1:
+        if not clear_current(config):
+            return False
+    if baseline == 1:
+        if not clear_baseline(config):
+            return False
+    if current == 0 and baseline == 0:
+        write_log(config, "ERROR:: The flags 'current' and 'baseline' cannot both be zero (0)", level=logging.ERROR)
+        return False
+    
+    # The record is committed with the migration work
+    check_migration_lock(config)
+    conn = config['conn']
+    sql = get_state_sql(config, 'insert')
+    valuesd = get_migration_record(config, migration, current, baseline)
+    values = tuple(valuesd[c] for c in get_migration_table_columns(config))
     
     write_log(config, "Adding migration record for version {}; baseline = {}; current = {}".format(valuesd['version'], valuesd['is_baseline'], valuesd['is_current']))
     with conn.cursor() as cur:
@@ -734,10 +1327,46 @@ values (
         except Exception as e:
             write_log(config, "EXCEPTION:: {}\nRunning statement\n{} {}".format(e, sql, values))
             raise e
+    
+    state = get_migration_state(config)
+    if state is not None:
+        state.set_record(valuesd)
     return True
 # End add_migration_record
 
 
+def add_migration_records(config, records):
+    """
+    Adds many migration records (dicts from get_migration_record()) to the migrations table with a single executemany call.
+    The current and baseline flags are written as they are set in the records. No flags are cleared.
+    Returns bool
+    """
+    
+    if not records:
+        return True
+    
+    # The records are committed with the migration work
+    check_migration_lock(config)
+    conn = config['conn']
+    sql = get_state_sql(config, 'insert')
+    values = [tuple(r[c] for c in get_migration_table_columns(config)) for r in records]
+    
+    write_log(config, "Adding {} migration records (versions {} to {})".format(len(records), records[0]['version'], records[-1]['version']))
+    with conn.cursor() as cur:
+        try:
+            cur.executemany(sql, values)
+        except Exception as e:
+            write_log(config, "EXCEPTION:: {}\nRunning statement\n{}".format(e, sql))
+            raise e
+    
+    state = get_migration_state(config)
+    if state is not None:
+        for record in records:
+            state.set_record(record)
+    return True
+# End add_migration_records
+
+
 def set_baseline(config):
     """
     Set a baseline record in the database. 
@@ -762,7 +1391,7 @@ def set_baseline(config):
             if config.get('chatty'):
                 print(msg)
             write_log(config, msg)
-            conn.rollback()
+            rollback_migration(config)
             return 0    # Exit with no error
         else:
             msg = "Setting baseline at version {}".format(config['version'])
@@ -773,14 +1402,14 @@ def set_baseline(config):
             addOK = add_migration_record(config, {}, baseline=1, current=(0 if bool(current) else 1))
     except Exception as e:
         write_log(config, "EXCEPTION:: set_baseline failed! {}".format(e), level=logging.ERROR)
-        conn.rollback()
+        rollback_migration(config)
         return 10
     
     if addOK:
         conn.commit()
         return 0
     else:
-        conn.rollback()
+        rollback_migration(config)
         return 11
 # End set_baseline
 
@@ -804,7 +1433,8 @@ create table {}"{}"
     migration_user   varchar(256) not null,  -- name of user running migration program
     db_user          varchar(256) not null,  -- name of database user applying sql statements
     is_current       integer not null check (is_current in (0, 1)), -- flag for current version
-    is_baseline      integer not null check (is_baseline in (0, 1)) -- flag for baseline version
+    is_baseline      integer not null check (is_baseline in (0, 1)), -- flag for baseline version
+    checksum         varchar(64)             -- sha256 of the migration file content
 );
 """.format(schema, tableName)
     
@@ -834,128 +1464,1657 @@ create table {}"{}"
 # End create_migration_table
 
 
-def import_arbitrary(fileName, modName):
+def check_lock_table(config):
     """
-    Returns a module reference.
-    This function acts like a Python import statement, but it will 
-    import an arbitrary Python file located at any path.
+    Returns bool
+    Checks if the migration lock table exists. If it does not, the current transaction is rolled back.
     """
     
-    importlib.invalidate_caches()
+    sql = """select * from {}"{}" where 1 = 0""".format(config.get('migration_table_schema', ''), config['migration_lock_table_name'])
+    try:
+        with config['conn'].cursor() as cur:
+            cur.execute(sql)
+    except Exception as e:
+        config['conn'].rollback()
+        return False
     
-    loader = ilmac.SourceFileLoader(modName.replace('.', '_'), fileName)
-    spec = ilutil.spec_from_loader(loader.name, loader)
-    mod = ilutil.module_from_spec(spec)
-    loader.exec_module(mod)
+    return True
+# End check_lock_table
+
+
+def create_lock_table(config):
+    """
+    Creates the migration lock table in the migration table schema and commits.
+    Another runner creating the table at the same time is not an error.
+    """
     
-    return mod
-# End import_arbitrary
+    sql = """
+create table {}"{}"
+(
+    lock_name        varchar(256) not null primary key, -- migration table the lock protects
+    lock_owner       varchar(256),                      -- runner holding the lock; null when free
+    expires_at       double precision,                  -- epoch seconds when the lease of the holder ends
+    catalog_hash     varchar(64)                        -- catalog hash of the last completed upgrade to latest
+);
+""".format(config.get('migration_table_schema', ''), config['migration_lock_table_name'])
+    
+    write_log(config, "Creating migration lock table")
+    try:
+        with config['conn'].cursor() as cur:
+            cur.execute(sql)
+    except Exception as e:
+        config['conn'].rollback()
+        if not check_lock_table(config):
+            raise
+    else:
+        config['conn'].commit()
+# End create_lock_table
 
 
-def run_python_migration(config, migration):
+def check_archive_table(config):
     """
-    Returns bool.
-    Loads and runs a Python migration as a module. 
-    The Python migration module should contain a function named 'run_config' 
-    that accepts two positional arguments for the config dict and the migration dict.
+    Returns bool
+    Checks if the migration archive table exists. If it does not, the current transaction is rolled back.
+    The VALID_COLUMNS found in the table are set in config['migration_archive_columns'].
     """
     
-    # Expose the write_log func to the migration
-    config['write_log'] = write_log
+    sql = """select * from {}"{}" where 1 = 0""".format(config.get('migration_table_schema', ''), config['migration_archive_table_name'])
+    try:
+        with config['conn'].cursor() as cur:
+            cur.execute(sql)
+            gotCols = {c[0] for c in cur.description}
+    except Exception as e:
+        config['conn'].rollback()
+        return False
     
-    # Expost pre/post statement JIC
-    config['pre_statement'] = pre_statement
-    config['post_statement'] = post_statement
+    config['migration_archive_columns'] = [c for c in VALID_COLUMNS if c in gotCols]
+    return True
+# End check_archive_table
+
+
+def create_archive_table(config):
+    """
+    Creates the migration archive table in the migration table schema and commits.
+    It has the columns of the migration table plus the time the record was archived.
+    """
     
-    # Expose the base migration exception to the migration
-    config['migration_exception'] = MigrationError
+    schema = config.get('migration_table_schema', '')
+    tableName = config['migration_archive_table_name']
+    sql = """
+create table {}"{}"
+(
+    version          varchar(256) not null,
+    applied_ts       timestamp not null,
+    migration_file   varchar(256) not null,
+    migration_action varchar(256) not null,
+    migration_type   varchar(256) not null,
+    migration_user   varchar(256) not null,
+    db_user          varchar(256) not null,
+    is_current       integer not null,
+    is_baseline      integer not null,
+    checksum         varchar(64),
+    archived_ts      timestamp not null      -- time the record was moved from the migration table
+);
+""".format(schema, tableName)
+    index = """create unique index ux01__migrations_archive__ on {}"{}" (version, applied_ts);""".format(schema, tableName)
     
-    write_log(config, 'Loading python migration "{}"'.format(migration['filename']))
-    migration_module_name = 'pv_mg_' + migration['version']
-    pymigration = import_arbitrary(migration['filename'], migration_module_name)
+    write_log(config, "Creating migration archive table")
+    with config['conn'].cursor() as cur:
+        cur.execute(sql)
+        cur.execute(index)
+    config['conn'].commit()
+    config['migration_archive_columns'] = VALID_COLUMNS
+# End create_archive_table
+
+
+def get_history_cutoffs(config, retention):
+    """
+    Returns list
+    Returns the applied_ts values that a record must be older than to be archived: one for keep_days and one for keep_rows 
+    (the applied_ts of the oldest of the newest keep_rows records). A keep_rows of 0 adds no cutoff. 
+    Returns None if nothing can be archived: no limit is set or there are not more than keep_rows records.
+    """
     
-    if hasattr(pymigration, 'run_migration'):
-        write_log(config, 'Running python migration (run_migration() call)'.format(migration['filename']))
-        rc = pymigration.run_migration(config, migration)
-    else:
-        write_log(config, "Migration was run at import-time")
-        rc = True
+    if retention.get('keep_days') is None and retention.get('keep_rows') is None:
+        return None
     
-    # unload migration
-    # This might be technically unnecessary, but I want to be explicit about this
-    # in case behavior changes in future
-    if migration_module_name in sys.modules:
-        del sys.modules[migration_module_name]
-    del pymigration
+    cutoffs = []
+    if retention.get('keep_days') is not None:
+        cutoffs.append(dt.now() - timedelta(days=retention['keep_days']))
     
-    return rc
-# End run_python_migration
+    if retention.get('keep_rows') is not None:
+        sql = """select applied_ts from {}"{}" order by applied_ts desc;""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+        with config['conn'].cursor() as cur:
+            cur.execute(sql)
+            newest = cur.fetchmany(retention['keep_rows']) if retention['keep_rows'] > 0 else []
+        config['conn'].rollback()
+        if len(newest) < retention['keep_rows']:
+            return None
+        if newest:
+            cutoffs.append(newest[-1]['applied_ts'])
+    
+    return cutoffs
+# End get_history_cutoffs
 
 
-def get_sql_statement_sep():
+def compact_migration_history(config):
     """
-    Returns SQL statement separator regex.
-    Default is '--run' on its own line.
+    Action function. Returns int.
+    Moves old migration records to the migration archive table in batches of the batch_size retention setting, 
+    one transaction per batch (see get_history_retention()). Current and baseline records are never moved, 
+    nor is the latest record of each repeatable migration (see run_repeatable_migrations()).
     """
     
-    return re.compile('^\s*--\s*run\s*$', flags=re.MULTILINE|re.IGNORECASE)
-# End get_sql_statement_sep
+    retention = config.get('history_retention') or {}
+    conn = config['conn']
+    schema = config.get('migration_table_schema', '')
+    table = '{}"{}"'.format(schema, config['migration_table_name'])
+    archive = '{}"{}"'.format(schema, config['migration_archive_table_name'])
+    marker = config['positional_variable_marker']
+    
+    write_log(config, "Compacting migration history")
+    try:
+        cutoffs = get_history_cutoffs(config, retention)
+        if cutoffs is None:
+            msg = "Migration history is within the retention limits"
+            if config.get('chatty'):
+                print(msg)
+            write_log(config, msg)
+            return 0
+        
+        if not check_archive_table(config):
+            create_archive_table(config)
+        columns = ', '.join(c for c in get_migration_table_columns(config) if c in config['migration_archive_columns'])
+        
+        selectSql = """
+select version, applied_ts
+  from {0} m
+ where is_current = 0
+   and is_baseline = 0{1}
+   and (migration_action != 'repeatable' or 
+        exists (select 1 
+                  from {0} n 
+                 where n.migration_action = 'repeatable' 
+                   and n.migration_file = m.migration_file 
+                   and n.applied_ts > m.applied_ts))
+ order 
+    by applied_ts
+ limit {2};
+""".format(table, ''.join('\n   and applied_ts < {}'.format(marker) for c in cutoffs), marker)
+        archiveSql = """insert into {0} ({1}, archived_ts) select {1}, {2} from {3} where version = {2} and applied_ts = {2};""".format(archive, columns, marker, table)
+        deleteSql = """delete from {} where version = {} and applied_ts = {};""".format(table, marker, marker)
+        
+        total = 0
+        while True:
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute(selectSql, tuple(cutoffs) + (retention.get('batch_size') or 1000,))
+                keys = [(r['version'], r['applied_ts']) for r in cur.fetchall()]
+                if not keys:
+                    break
+                archivedTs = dt.now()
+                cur.executemany(archiveSql, [(archivedTs,) + k for k in keys])
+                cur.executemany(deleteSql, keys)
+            check_migration_lock(config)
+            conn.commit()
+            total += len(keys)
+            write_log(config, "Archived {} migration records".format(total))
+            throttle(config, time.monotonic() - started)
+        # End batch loop
+    except Exception as e:
+        write_log(config, "EXCEPTION:: Compacting migration history: {}".format(e), level=logging.ERROR)
+        if config.get('verbose', False):
+            traceback.print_exc(file=sys.stderr)
+        rollback_migration(config)
+        return 80
+    finally:
+        conn.rollback()
+    
+    msg = "Moved {} migration records to {}".format(total, archive)
+    if config.get('chatty'):
+        print(msg)
+    write_log(config, msg)
+    
+    return 0
+# End compact_migration_history
 
 
-def get_statements(sqlFile):
+def get_lock_name(config):
     """
     Returns str
-    Reads 1-MiB chunks of a sql file and parses statements from each chunk. 
-    Each statement found is yielded so this function is a generator.
-    SQL migration statements are delimited by get_sql_statement_sep().
+    Returns the name of the migration lock. Runners share the lock when they share the migration table.
     """
     
-    readLimit = 1000000
-    stmtSep = get_sql_statement_sep()
+    return '{}"{}"'.format(config.get('migration_table_schema', ''), config['migration_table_name'])
+# End get_lock_name
+
+
+class MigrationLockHeartbeat(threading.Thread):
+    """
+    Renews the lease of the migration lock held by this run every lease / 3 seconds until stopped. Uses its own 
+    database connection so the renewals are committed independently of the migration transaction.
+    The lost event is set when another runner owns the lock or when no renewal has succeeded for a whole lease 
+    (the lock may have been taken over). See check_migration_lock().
+    """
     
-    buff = sqlFile.read(readLimit)
-    while buff:
-        start = 0
-        end = 0
-        for m in stmtSep.finditer(buff):
-            end = m.start()
-            stmt = buff[start:end]
-            start = m.end()
-            yield stmt
+    def __init__(self, config, lease):
+        super().__init__(name='pydbvolve-lock-heartbeat', daemon=True)
+        self.config = config
+        self.lease = lease
+        self.interval = lease / 3.0
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+    
+    def run(self):
+        conn = None
+        lastRenewed = time.monotonic()
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if conn is None:
+                        conn = get_db_connection(self.config, get_db_credentials(self.config))
+                    if not renew_migration_lock(self.config, conn):
+                        write_log(self.config, "The migration lock held by {} was lost".format(self.config['lock_owner']), level=logging.ERROR)
+                        self.lost.set()
+                        break
+                    lastRenewed = time.monotonic()
+                except Exception as e:
+                    write_log(self.config, "EXCEPTION:: Renewing the migration lock: {}".format(e), level=logging.WARNING)
+                    if conn is not None:
+                        try:
+                            conn.close()
+                        except Exception:
+                            pass
+                        conn = None
+                    if (time.monotonic() - lastRenewed) >= self.lease:
+                        write_log(self.config, "The migration lock held by {} could not be renewed for {} seconds and is considered lost".format(self.config['lock_owner'], self.lease), level=logging.ERROR)
+                        self.lost.set()
+                        break
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    def stop(self):
+        self.stopped.set()
+        self.join()
+# End class MigrationLockHeartbeat
+
+
+def check_migration_lock(config):
+    """
+    Raises MigrationError if this run took the migration lock and has lost it (see MigrationLockHeartbeat). 
+    Called before each migration and before migration work is committed, so a run stops changing the database 
+    as soon as another runner may hold the lock.
+    """
+    
+    heartbeat = config.get('lock_heartbeat')
+    if heartbeat is not None and heartbeat.lost.is_set():
+        raise MigrationError("The migration lock held by {} was lost".format(config.get('lock_owner')))
+# End check_migration_lock
+
+
+def renew_migration_lock(config, conn):
+    """
+    Returns bool
+    Extends the lease of the migration lock held by this run. Returns False if this run no longer holds the lock.
+    """
+    
+    sql = """
+update {0}"{1}"
+   set expires_at = {2}
+ where lock_name = {2}
+   and lock_owner = {2};
+""".format(config.get('migration_table_schema', ''), config['migration_lock_table_name'], config['positional_variable_marker'])
+    
+    with conn.cursor() as cur:
+        cur.execute(sql, (time.time() + config['migration_lock_settings'].get('lease', 60.0), get_lock_name(config), config['lock_owner']))
+        renewed = (cur.rowcount == 1)
+    conn.commit()
+    
+    return renewed
+# End renew_migration_lock
+
+
+def acquire_migration_lock(config):
+    """
+    Returns bool
+    Waits for and takes the migration lock (a row in the migration lock table) so only one runner applies migrations. 
+    A lock whose lease has expired is taken over. While it is held, a heartbeat thread renews the lease.
+    Returns False without taking the lock if this run upgrades to the latest version and the catalog hash stored by 
+    the last completed upgrade matches the local one (see get_catalog_hash()): there is nothing left to do.
+    Raises MigrationError if the lock cannot be taken within the max_wait setting.
+    """
+    
+    settings = config['migration_lock_settings']
+    lease = settings.get('lease', 60.0)
+    pollInterval = settings.get('poll_interval', 2.0)
+    maxWait = settings.get('max_wait', 600.0)
+    conn = config['conn']
+    table = '{}"{}"'.format(config.get('migration_table_schema', ''), config['migration_lock_table_name'])
+    marker = config['positional_variable_marker']
+    lockName = get_lock_name(config)
+    owner = '{}@{}:{}:{}'.format(config['migration_user'], socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+    catalogHash = get_catalog_hash(config) if (config['migration_action'] == 'upgrade' and config['version'] == LATEST_VERSION) else None
+    
+    if not check_lock_table(config):
+        create_lock_table(config)
+    
+    # The lock row may already exist
+    try:
+        with conn.cursor() as cur:
+            cur.execute("insert into {0} (lock_name) values ({1});".format(table, marker), (lockName,))
+    except Exception as e:
+        conn.rollback()
+    else:
+        conn.commit()
+    
+    selectSql = "select lock_owner, expires_at, catalog_hash from {0} where lock_name = {1};".format(table, marker)
+    takeSql = """
+update {0}
+   set lock_owner = {1},
+       expires_at = {1}
+ where lock_name = {1}
+   and (lock_owner is null or expires_at < {1});
+""".format(table, marker)
+    
+    waitStart = time.monotonic()
+    waiting = False
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(selectSql, (lockName,))
+            lock = cur.fetchone() or {}
+        conn.rollback()
         
-        buff = buff[start:]
-        newBuff = sqlFile.read(readLimit)
-        if len(newBuff) == 0:
+        if catalogHash and lock.get('catalog_hash') == catalogHash:
+            write_log(config, "The migration catalog {} has already been applied".format(catalogHash))
+            return False
+        
+        now = time.time()
+        with conn.cursor() as cur:
+            cur.execute(takeSql, (owner, now + lease, lockName, now))
+            taken = (cur.rowcount == 1)
+        if taken:
+            conn.commit()
             break
-        buff += newBuff
-        del newBuff
-    # End process loop
-# End get_statements
+        conn.rollback()
+        
+        if maxWait is not None and (time.monotonic() - waitStart) >= maxWait:
+            raise MigrationError("Timed out after {} seconds waiting for the migration lock held by {}".format(maxWait, lock.get('lock_owner')))
+        if not waiting:
+            write_log(config, "Waiting for the migration lock held by {}".format(lock.get('lock_owner')))
+            waiting = True
+        time.sleep(pollInterval)
+    # End lock loop
+    
+    write_log(config, "Acquired the migration lock as {}".format(owner))
+    config['lock_owner'] = owner
+    config['lock_heartbeat'] = MigrationLockHeartbeat(config, lease)
+    config['lock_heartbeat'].start()
+    
+    return True
+# End acquire_migration_lock
 
 
-def run_sql_migration(config, migration):
+def release_migration_lock(config, catalogHash=None):
     """
-    Returns bool
-    Runs all statements in a SQL migration file one-at-a-time. Uses get_statements as a generator in a loop.
+    Releases the migration lock if this run holds it and stores catalogHash (None after anything but a 
+    completed upgrade to the latest version). Any open migration transaction is rolled back first.
     """
     
+    owner = config.pop('lock_owner', None)
+    if not owner:
+        return
+    
+    config.pop('lock_heartbeat').stop()
+    
     conn = config['conn']
+    sql = """
+update {0}"{1}"
+   set lock_owner = null,
+       expires_at = null,
+       catalog_hash = {2}
+ where lock_name = {2}
+   and lock_owner = {2};
+""".format(config.get('migration_table_schema', ''), config['migration_lock_table_name'], config['positional_variable_marker'])
     
-    write_log(config, "SQL migration from file '{}'".format(migration['filename']))
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(sql, (catalogHash, get_lock_name(config), owner))
+        conn.commit()
+    except Exception as e:
+        write_log(config, "EXCEPTION:: Releasing the migration lock: {}".format(e), level=logging.WARNING)
+        conn.rollback()
+    else:
+        write_log(config, "Released the migration lock")
+# End release_migration_lock
+
+
+class BundleSourceLoader(ilabc.SourceLoader):
+    """
+    Loader for Python migrations stored as members of a zip bundle (see get_migration_bundle_file()).
+    """
+    
+    def __init__(self, name, bundle, memberName):
+        self.name = name
+        self.bundle = bundle
+        self.memberName = memberName
     
-    with open(migration['filename'], 'r') as sqlFile:
-        for stmt in get_statements(sqlFile):
-            write_log(config, "Executing statement:\n{}".format(stmt))
+    def get_filename(self, fullname):
+        return os.path.join(self.bundle.filename, self.memberName)
+    
+    def get_data(self, path):
+        return self.bundle.read(self.memberName)
+# End class BundleSourceLoader
+
+
+def import_arbitrary(fileName, modName, bundle=None, code=None, config=None, namespace=None):
+    """
+    Returns a module reference.
+    This function acts like a Python import statement, but it will 
+    import an arbitrary Python file located at any path.
+    If bundle (a zipfile.ZipFile) is given, fileName is the name of a member of the bundle.
+    If code (a code object from a migration plan) is given, it is executed instead of compiling the file.
+    If config is given and config['cache_dir'] is set, the compiled code is cached by content hash 
+    in the 'bytecode' subdirectory (see get_code()) and importlib caches are invalidated at most once per run.
+    The names in the namespace dict are set in the module before its code is executed.
+    """
+    
+    if code is None and config and config.get('cache_dir'):
+        if bundle is not None:
+            source = bundle.read(fileName)
+            fileName = os.path.join(bundle.filename, fileName)
+        else:
+            with open(fileName, 'rb') as pyFile:
+                source = pyFile.read()
+        code = get_code(source, fileName, os.path.join(config['cache_dir'], 'bytecode'))
+    
+    if code is not None:
+        mod = types.ModuleType(modName.replace('.', '_'))
+        mod.__file__ = fileName
+        mod.__dict__.update(namespace or {})
+        exec(code, mod.__dict__)
+        return mod
+    
+    if config is None or not config.get('import_caches_invalidated'):
+        importlib.invalidate_caches()
+        if config is not None:
+            config['import_caches_invalidated'] = True
+    
+    if bundle is not None:
+        loader = BundleSourceLoader(modName.replace('.', '_'), bundle, fileName)
+    else:
+        loader = ilmac.SourceFileLoader(modName.replace('.', '_'), fileName)
+    spec = ilutil.spec_from_loader(loader.name, loader)
+    mod = ilutil.module_from_spec(spec)
+    mod.__dict__.update(namespace or {})
+    loader.exec_module(mod)
+    
+    return mod
+# End import_arbitrary
+
+
+def throttle(config, elapsed=0.0):
+    """
+    Returns float (the number of seconds slept)
+    Pauses the migration according to config['throttle_settings'] (see get_throttle_settings()).
+    elapsed is the time in seconds spent executing the unit of work that just completed. 
+    Called after each SQL migration statement and after each batch of the batch helpers. 
+    Python migrations can call config['throttle'](config, elapsed) between their own units of work.
+    """
+    
+    settings = get_throttle_settings()
+    settings.update(config.get('throttle_settings') or {})
+    state = config.setdefault('throttle_state', {'last': None, 'slept': 0.0})
+    
+    wait = 0.0
+    if settings.get('duty_cycle') and 0 < settings['duty_cycle'] < 1 and elapsed > 0:
+        wait = elapsed * (1 - settings['duty_cycle']) / settings['duty_cycle']
+    
+    if settings.get('max_statements_per_sec') and state['last'] is not None:
+        wait = max(wait, (1.0 / settings['max_statements_per_sec']) - (time.monotonic() - state['last']))
+    
+    slept = 0.0
+    if wait > 0:
+        time.sleep(wait)
+        slept += wait
+    
+    pressureWait = 0.0
+    while check_database_pressure(config):
+        if pressureWait == 0.0:
+            write_log(config, "Database pressure reported. Pausing migration.", level=logging.WARNING)
+        if settings.get('max_pressure_wait') is not None and pressureWait >= settings['max_pressure_wait']:
+            raise MigrationError("Database pressure did not clear within {} seconds".format(settings['max_pressure_wait']))
+        time.sleep(settings['pressure_wait'])
+        pressureWait += settings['pressure_wait']
+    
+    if pressureWait:
+        write_log(config, "Database pressure cleared after {:.1f} seconds. Resuming migration.".format(pressureWait))
+        slept += pressureWait
+    
+    state['last'] = time.monotonic()
+    state['slept'] += slept
+    
+    return slept
+# End throttle
+
+
+def get_keyset_batch_sql(config, table, key, columns, where=None, first=False):
+    """
+    Returns str
+    Returns the parameterized query for one keyset batch. The parameters are (last key, *where params, batch size) 
+    or (*where params, batch size) for the first batch.
+    Overide this function in your config file if your database does not support 'limit'.
+    """
+    
+    marker = config['positional_variable_marker']
+    conditions = [] if first else ['{} > {}'.format(key, marker)]
+    if where:
+        conditions.append('({})'.format(where))
+    
+    return """
+select {}
+  from {}
+ where {}
+ order 
+    by {}
+ limit {};
+""".format(columns, table, ' and '.join(conditions) or '1 = 1', key, marker)
+# End get_keyset_batch_sql
+
+
+def get_keyset_batches(config, table, key, columns='*', where=None, params=(), batch_size=None):
+    """
+    Returns list
+    Iterates a table in key order using keyset pagination (key > last key) and yields each batch as a list of row dicts.
+    The key column must be unique. The time to fetch and process each batch (until the next batch is requested) 
+    is measured and the batch size is adapted toward config['batch_settings']['target_latency'].
+    columns can be '*' or a list of column names. where is an optional SQL condition using positional markers with its params.
+    """
+    
+    settings = get_batch_settings()
+    settings.update(config.get('batch_settings') or {})
+    size = batch_size or settings['batch_size']
+    if columns != '*':
+        columns = list(columns)
+        if key not in columns:
+            columns.insert(0, key)
+        columns = ', '.join(columns)
+    
+    lastKey = None
+    while True:
+        start = time.time()
+        sql = get_keyset_batch_sql(config, table, key, columns, where, first=(lastKey is None))
+        values = ([] if lastKey is None else [lastKey]) + list(params) + [size]
+        with config['conn'].cursor() as cur:
+            cur.execute(sql, tuple(values))
+            rows = cur.fetchall()
+        
+        if not rows:
+            break
+        
+        yield rows
+        
+        if len(rows) < size:
+            break
+        lastKey = rows[-1][key]
+        
+        elapsed = time.time() - start
+        if settings.get('target_latency') and elapsed > 0:
+            newSize = int(size * settings['target_latency'] / elapsed)
+            size = max(size // 2, min(size * 2, newSize))
+            size = max(settings['min_batch_size'], min(settings['max_batch_size'], size))
+        
+        throttle(config, elapsed)
+    # End batch loop
+# End get_keyset_batches
+
+
+def run_keyset_batches(config, table, key, callback, columns='*', where=None, params=(), batch_size=None, commit=True):
+    """
+    Returns int (the number of rows processed)
+    Iterates a table in keyset batches (see get_keyset_batches()) and calls callback(config, rows) for each batch.
+    If commit is True, the transaction is committed after each batch. This makes the migration NOT atomic 
+    and is only allowed in the 'script' transaction mode.
+    Progress (rows and rows/sec) is written to the log after each batch.
+    """
+    
+    if commit:
+        check_intra_migration_commit(config, "Keyset batches on {}".format(table))
+    
+    total = 0
+    start = time.time()
+    for rows in get_keyset_batches(config, table, key, columns, where, params, batch_size):
+        callback(config, rows)
+        if commit:
+            config['conn'].commit()
+        
+        total += len(rows)
+        elapsed = time.time() - start
+        write_log(config, "{}: {} rows processed; batch of {} ({:.0f} rows/sec)".format(table, total, len(rows), total / elapsed if elapsed > 0 else total))
+    
+    return total
+# End run_keyset_batches
+
+
+def get_numpy(config):
+    """
+    Returns the numpy module if it is installed and enabled by config['batch_settings']['use_numpy'], otherwise None.
+    """
+    
+    if not (config.get('batch_settings') or {}).get('use_numpy', True):
+        return None
+    
+    try:
+        import numpy
+    except ImportError:
+        return None
+    
+    return numpy
+# End get_numpy
+
+
+def get_column_arrays(config, rows, columns):
+    """
+    Returns dict
+    Converts a batch of row dicts into a dict of column arrays. NumPy arrays are used when available (see get_numpy()).
+    Otherwise integer columns become array('q'), float columns become array('d') and any other column becomes a list.
+    """
+    
+    numpy = get_numpy(config)
+    arrays = {}
+    for col in columns:
+        values = [r[col] for r in rows]
+        if numpy is not None:
+            arrays[col] = numpy.array(values)
+        elif all(type(v) is int for v in values):
+            arrays[col] = array('q', values)
+        elif all(type(v) is float for v in values):
+            arrays[col] = array('d', values)
+        else:
+            arrays[col] = values
+    
+    return arrays
+# End get_column_arrays
+
+
+def run_column_batches(config, table, key, columns, transform, where=None, params=(), batch_size=None, commit=True):
+    """
+    Returns int (the number of rows processed)
+    Iterates a table in keyset batches (see run_keyset_batches()) and converts each batch of the key and the 
+    columns to column arrays (see get_column_arrays()). transform(arrays) is called once per batch and must 
+    return a dict of {target column: sequence of new values} in the same row order. The new values are written 
+    back with a single executemany update per batch.
+    """
+    
+    marker = config['positional_variable_marker']
+    
+    def apply_transform(config, rows):
+        arrays = get_column_arrays(config, rows, [key] + [c for c in columns if c != key])
+        results = transform(arrays)
+        if not results:
+            return
+        
+        targets = list(results)
+        sql = """
+update {}
+   set {}
+ where {} = {};
+""".format(table, ', '.join('{} = {}'.format(c, marker) for c in targets), key, marker)
+        newValues = [results[c].tolist() if hasattr(results[c], 'tolist') else list(results[c]) for c in targets]
+        newValues.append(arrays[key].tolist() if hasattr(arrays[key], 'tolist') else list(arrays[key]))
+        if any(len(v) != len(rows) for v in newValues):
+            raise MigrationError("Column transform for {} must return one value per row for each target column".format(table))
+        
+        with config['conn'].cursor() as cur:
+            cur.executemany(sql, list(zip(*newValues)))
+    # End apply_transform
+    
+    return run_keyset_batches(config, table, key, apply_transform, columns, where, params, batch_size, commit)
+# End run_column_batches
+
+
+def get_migration_support(config):
+    """
+    Returns a module reference or None.
+    Imports the migration support module from config['migration_support_path'] once per run and registers it 
+    in sys.modules under its own name so that migrations can also import it (and its submodules) by name.
+    Modules already registered under that name (ex: a support file named like an installed module) are set aside 
+    and restored by unload_migration_support().
+    The module is kept in config['migration_support']. The run-scoped cache dict is config['run_cache'].
+    """
+    
+    config.setdefault('run_cache', {})
+    if config.get('migration_support') is not None or not config.get('migration_support_path'):
+        return config.get('migration_support')
+    
+    supportPath = os.path.abspath(config['migration_support_path'])
+    if os.path.isdir(supportPath):
+        modName = os.path.basename(supportPath)
+        spec = ilutil.spec_from_file_location(modName, os.path.join(supportPath, '__init__.py'), 
+                                              submodule_search_locations=[supportPath])
+    else:
+        modName = os.path.splitext(os.path.basename(supportPath))[0]
+        spec = ilutil.spec_from_file_location(modName, supportPath)
+    
+    write_log(config, 'Loading migration support module "{}" from {}'.format(modName, supportPath))
+    saved = {m: sys.modules.pop(m) for m in list(sys.modules) if m == modName or m.startswith(modName + '.')}
+    if saved:
+        write_log(config, 'The migration support module "{}" shadows an imported module of the same name until the run ends'.format(modName), level=logging.WARNING)
+    config['migration_support_shadowed'] = saved
+    
+    mod = ilutil.module_from_spec(spec)
+    sys.modules[modName] = mod
+    try:
+        spec.loader.exec_module(mod)
+    except:
+        remove_migration_support_modules(modName)
+        sys.modules.update(config.pop('migration_support_shadowed'))
+        raise
+    
+    config['migration_support'] = mod
+    return mod
+# End get_migration_support
+
+
+def remove_migration_support_modules(modName):
+    """
+    Removes a module and its submodules from sys.modules.
+    """
+    
+    for name in [m for m in sys.modules if m == modName or m.startswith(modName + '.')]:
+        del sys.modules[name]
+# End remove_migration_support_modules
+
+
+def unload_migration_support(config):
+    """
+    Removes the migration support module (and its submodules) from sys.modules, restores the modules it shadowed 
+    and drops the run cache.
+    """
+    
+    mod = config.pop('migration_support', None)
+    config.pop('run_cache', None)
+    if mod is not None:
+        remove_migration_support_modules(mod.__name__)
+        sys.modules.update(config.pop('migration_support_shadowed', None) or {})
+# End unload_migration_support
+
+
+class PipeLogHandler(logging.Handler):
+    """
+    Logging handler that sends (level, message) records over a multiprocessing connection.
+    Used by isolated Python migration workers to stream their log to the main process.
+    """
+    
+    def __init__(self, pipe):
+        super().__init__()
+        self.pipe = pipe
+    
+    def emit(self, record):
+        try:
+            self.pipe.send(('log', record.levelno, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+# End class PipeLogHandler
+
+
+def run_python_migration_worker(config, migration, pipe):
+    """
+    Entry point of an isolated Python migration worker process (see run_isolated_python_migration()).
+    Applies the resource limits, opens a new database connection, runs the migration and commits its work.
+    The result is sent over the pipe as ('result', rc) or ('error', exception type, message, traceback).
+    """
+    
+    import resource
+    
+    settings = config['python_migration_isolation']
+    if settings.get('memory_limit'):
+        resource.setrlimit(resource.RLIMIT_AS, (settings['memory_limit'], settings['memory_limit']))
+    if settings.get('cpu_limit'):
+        resource.setrlimit(resource.RLIMIT_CPU, (settings['cpu_limit'], settings['cpu_limit']))
+    
+    logger = logging.getLogger(config.get('logger_name', 'pydbvolve') + '.worker')
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+    logger.addHandler(PipeLogHandler(pipe))
+    
+    # Never touch the connection of the main process
+    config = dict(config, logger=logger, conn=None)
+    try:
+        config['conn'] = get_db_connection(config, get_db_credentials(config))
+        rc = run_python_migration_module(config, migration)
+        if rc:
+            config['conn'].commit()
+        else:
+            config['conn'].rollback()
+    except BaseException as e:
+        if config.get('conn'):
+            try:
+                config['conn'].rollback()
+            except Exception:
+                pass
+        pipe.send(('error', type(e).__name__, str(e), traceback.format_exc()))
+    else:
+        pipe.send(('result', bool(rc)))
+    finally:
+        if config.get('conn'):
+            config['conn'].close()
+        pipe.close()
+# End run_python_migration_worker
+
+
+def run_isolated_python_migration(config, migration):
+    """
+    Returns bool.
+    Runs a Python migration in a forked worker process with its own database connection and the resource limits 
+    from config['python_migration_isolation']. Log messages of the worker are written to the log of the main process.
+    Memory used by the migration is fully reclaimed when the worker exits. A worker that is killed (memory or CPU 
+    limit, timeout) or raises an exception fails the migration with a MigrationError.
+    """
+    
+    import multiprocessing
+    import signal
+    
+    check_intra_migration_commit(config, "Isolated Python migration {}".format(os.path.basename(migration['filename'])))
+    settings = config['python_migration_isolation']
+    
+    # Load the support module once in the main process so every worker inherits it
+    get_migration_support(config)
+    
+    ctx = multiprocessing.get_context('fork')
+    recvPipe, sendPipe = ctx.Pipe(duplex=False)
+    worker = ctx.Process(target=run_python_migration_worker, args=(config, migration, sendPipe), 
+                         name='pv_mg_' + migration['version'], daemon=True)
+    
+    write_log(config, 'Starting isolated worker for python migration "{}"'.format(migration['filename']))
+    start = time.monotonic()
+    worker.start()
+    sendPipe.close()
+    
+    result = None
+    try:
+        while True:
+            if settings.get('timeout') and (time.monotonic() - start) > settings['timeout']:
+                # Process.kill() is not available before Python 3.7
+                os.kill(worker.pid, signal.SIGKILL)
+                raise MigrationError("Isolated python migration {} timed out after {} seconds".format(os.path.basename(migration['filename']), settings['timeout']))
+            
+            if not recvPipe.poll(0.1):
+                continue
+            try:
+                msg = recvPipe.recv()
+            except EOFError:
+                break
+            
+            if msg[0] == 'log':
+                write_log(config, msg[2], level=msg[1])
+            else:
+                result = msg
+    finally:
+        recvPipe.close()
+        worker.join()
+    
+    if result is None:
+        raise MigrationError("Isolated python migration {} worker exited with code {} before returning a result".format(os.path.basename(migration['filename']), worker.exitcode))
+    if result[0] == 'error':
+        write_log(config, "Isolated python migration worker traceback:\n{}".format(result[3]), level=logging.ERROR)
+        raise MigrationError("Isolated python migration {} failed: {}: {}".format(os.path.basename(migration['filename']), result[1], result[2]))
+    
+    return result[1]
+# End run_isolated_python_migration
+
+
+def run_python_migration(config, migration):
+    """
+    Returns bool.
+    Runs a Python migration in-process (see run_python_migration_module()) or in an isolated worker process 
+    if config['python_migration_isolation'] is set (see run_isolated_python_migration()).
+    """
+    
+    if config.get('python_migration_isolation'):
+        return run_isolated_python_migration(config, migration)
+    
+    return run_python_migration_module(config, migration)
+# End run_python_migration
+
+
+def run_python_migration_module(config, migration):
+    """
+    Returns bool.
+    Loads and runs a Python migration as a module. 
+    The Python migration module should contain a function named 'run_config' 
+    that accepts two positional arguments for the config dict and the migration dict.
+    """
+    
+    # Expose the write_log func to the migration
+    config['write_log'] = write_log
+    
+    # Expost pre/post statement JIC
+    config['pre_statement'] = pre_statement
+    config['post_statement'] = post_statement
+    
+    # Expose the base migration exception to the migration
+    config['migration_exception'] = MigrationError
+    
+    # Expose the batch helpers
+    config['get_keyset_batches'] = get_keyset_batches
+    config['run_keyset_batches'] = run_keyset_batches
+    config['run_column_batches'] = run_column_batches
+    config['throttle'] = throttle
+    
+    # Expose the migration support module and the run cache
+    namespace = {'migration_support': get_migration_support(config), 'run_cache': config['run_cache']}
+    
+    write_log(config, 'Loading python migration "{}"'.format(migration['filename']))
+    migration_module_name = 'pv_mg_' + migration['version']
+    pymigration = import_arbitrary(migration['filename'], migration_module_name, 
+                                   get_migration_bundle(config) if migration.get('bundle') else None, 
+                                   migration.get('code'), config, namespace)
+    
+    if hasattr(pymigration, 'run_migration'):
+        write_log(config, 'Running python migration (run_migration() call)'.format(migration['filename']))
+        rc = pymigration.run_migration(config, migration)
+    else:
+        write_log(config, "Migration was run at import-time")
+        rc = True
+    
+    # unload migration
+    # This might be technically unnecessary, but I want to be explicit about this
+    # in case behavior changes in future
+    if migration_module_name in sys.modules:
+        del sys.modules[migration_module_name]
+    del pymigration
+    
+    return rc
+# End run_python_migration_module
+
+
+def get_sql_statement_sep():
+    """
+    Returns SQL statement separator regex.
+    Default is '--run' on its own line. The variant '--run commit' also marks a commit point.
+    If the regex has a named group 'commit', a match of that group marks the separator as a commit point.
+    """
+    
+    return re.compile(r'^\s*--\s*run(?:\s+(?P<commit>commit))?\s*$', flags=re.MULTILINE|re.IGNORECASE)
+# End get_sql_statement_sep
+
+
+def get_statements(sqlFile):
+    """
+    Returns str
+    Reads 1-MiB chunks of a sql file and parses statements from each chunk. 
+    Each statement found is yielded so this function is a generator.
+    SQL migration statements are delimited by get_sql_statement_sep().
+    """
+    
+    for stmt, commit, offset in get_statement_chunks(sqlFile):
+        yield stmt
+# End get_statements
+
+
+def get_statement_chunks(sqlFile):
+    """
+    Returns tuple
+    Reads 1-MiB chunks of a sql file and parses statements from each chunk. 
+    Yields a (statement, commit, offset) tuple for each statement found. commit is True 
+    when the separator following the statement is a commit point ('-- run commit').
+    offset is the byte offset (in the encoding of sqlFile) just past the separator, relative to 
+    where reading started. Open files with newline='' so the offsets match the file on disk.
+    SQL migration statements are delimited by get_sql_statement_sep().
+    """
+    
+    readLimit = 1000000
+    stmtSep = get_sql_statement_sep()
+    encoding = getattr(sqlFile, 'encoding', None) or 'utf-8'
+    offset = 0
+    
+    buff = sqlFile.read(readLimit)
+    while buff:
+        start = 0
+        end = 0
+        for m in stmtSep.finditer(buff):
+            end = m.start()
+            stmt = buff[start:end]
+            offset += len(buff[start:m.end()].encode(encoding))
+            start = m.end()
+            yield stmt, bool(m.groupdict().get('commit')), offset
+        
+        buff = buff[start:]
+        newBuff = sqlFile.read(readLimit)
+        if len(newBuff) == 0:
+            break
+        buff += newBuff
+        del newBuff
+    # End process loop
+# End get_statement_chunks
+
+
+def check_intra_migration_commit(config, what):
+    """
+    Raises MigrationError if commits inside a migration are not allowed by the transaction mode.
+    Commits inside a migration are only allowed in the 'script' transaction mode because any other mode 
+    would commit the outer batch transaction.
+    """
+    
+    transactionMode = config.get('transaction_mode', 'script')
+    if transactionMode != 'script':
+        raise MigrationError("{} cannot commit inside a migration in '{}' transaction mode".format(what, transactionMode))
+# End check_intra_migration_commit
+
+
+def get_file_checksum(config, fileName):
+    """
+    Returns str
+    Returns the SHA-256 hex digest of the content of a file. The file is read in 1-MiB blocks.
+    """
+    
+    digest = hashlib.sha256()
+    with open(fileName, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            digest.update(block)
+    
+    return digest.hexdigest()
+# End get_file_checksum
+
+
+def get_migration_checksum(config, migration):
+    """
+    Returns str
+    Returns the SHA-256 hex digest of a migration file, whether it is on disk or in a bundle.
+    """
+    
+    if not migration.get('bundle'):
+        return get_file_checksum(config, migration['filename'])
+    
+    digest = hashlib.sha256()
+    with get_migration_bundle(config).open(migration['filename']) as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            digest.update(block)
+    
+    return digest.hexdigest()
+# End get_migration_checksum
+
+
+class MigrationFileReader(io.TextIOWrapper):
+    """
+    Text stream over a (possibly decompressed) migration file that also closes the underlying raw file.
+    The decompressors do not close a file object they were given.
+    """
+    
+    def __init__(self, buffer, rawFile, **kwargs):
+        super().__init__(buffer, **kwargs)
+        self.rawFile = rawFile
+    
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.rawFile.close()
+# End class MigrationFileReader
+
+
+def open_migration_file(config, migration, offset=0, encoding=None):
+    """
+    Returns a text stream
+    Opens a migration file (on disk or in a bundle) for reading as text starting at the byte offset. 
+    No newline translation is done so byte offsets parsed from the stream match the file.
+    Compressed files (gz, bz2, xz) are decompressed as they are read. Their byte offsets 
+    are offsets in the decompressed data.
+    """
+    
+    if migration.get('bundle'):
+        rawFile = get_migration_bundle(config).open(migration['filename'])
+    else:
+        rawFile = open(migration['filename'], 'rb')
+    
+    compression = migration.get('compression')
+    if compression == 'gz':
+        import gzip
+        binFile = gzip.open(rawFile, 'rb')
+    elif compression == 'bz2':
+        import bz2
+        binFile = bz2.open(rawFile, 'rb')
+    elif compression == 'xz':
+        import lzma
+        binFile = lzma.open(rawFile, 'rb')
+    else:
+        binFile = rawFile
+    if offset:
+        binFile.seek(offset)
+    
+    return MigrationFileReader(binFile, rawFile, encoding=encoding or locale.getpreferredencoding(False), newline='')
+# End open_migration_file
+
+
+def check_checkpoint_table(config):
+    """
+    Returns bool
+    Checks if the checkpoint table exists. The result is cached in config['checkpoint_table_exists'].
+    If the table does not exist, the current transaction is rolled back, so only call this at a transaction boundary.
+    """
+    
+    if 'checkpoint_table_exists' not in config:
+        sql = """select * from {}"{}" where 1 = 0""".format(config.get('migration_table_schema', ''), config['migration_checkpoint_table_name'])
+        try:
+            with config['conn'].cursor() as cur:
+                cur.execute(sql)
+        except Exception as e:
+            config['conn'].rollback()
+            config['checkpoint_table_exists'] = False
+        else:
+            config['checkpoint_table_exists'] = True
+    
+    return config['checkpoint_table_exists']
+# End check_checkpoint_table
+
+
+def create_checkpoint_table(config):
+    """
+    Creates the checkpoint table in the migration table schema. Does not commit.
+    """
+    
+    schema = config.get('migration_table_schema', '')
+    tableName = config['migration_checkpoint_table_name']
+    sql = """
+create table {}"{}"
+(
+    migration_file   varchar(256) not null,  -- file name of migration with commit points
+    migration_action varchar(256) not null,  -- 'upgrade', 'downgrade', etc
+    file_checksum    varchar(64) not null,   -- sha256 of the file content
+    statement_index  integer not null,       -- number of statements committed
+    byte_offset      bigint not null,        -- file offset just past the last committed statement
+    updated_ts       timestamp not null      -- time of the checkpoint
+);
+""".format(schema, tableName)
+    index = """create unique index ux01__migration_checkpoints__ on {}"{}" (migration_file, migration_action);""".format(schema, tableName)
+    
+    write_log(config, "Creating migration checkpoint table")
+    with config['conn'].cursor() as cur:
+        cur.execute(sql)
+        cur.execute(index)
+    
+    config['checkpoint_table_exists'] = True
+# End create_checkpoint_table
+
+
+def get_sql_checkpoint(config, migration):
+    """
+    Returns dict
+    Returns the checkpoint record for the SQL migration or an empty dict if there is none.
+    """
+    
+    if not check_checkpoint_table(config):
+        return {}
+    
+    sql = """
+select * 
+  from {0}"{1}"
+ where migration_file = {2}
+   and migration_action = {2};
+""".format(config.get('migration_table_schema', ''), config['migration_checkpoint_table_name'], config['positional_variable_marker'])
+    with config['conn'].cursor() as cur:
+        cur.execute(sql, (os.path.basename(migration['filename']), config['migration_action']))
+        res = cur.fetchone()
+    
+    return res or {}
+# End get_sql_checkpoint
+
+
+def clear_sql_checkpoint(config, migration):
+    """
+    Removes the checkpoint record of the SQL migration. Does not commit.
+    """
+    
+    if not check_checkpoint_table(config):
+        return
+    
+    sql = """
+delete 
+  from {0}"{1}"
+ where migration_file = {2}
+   and migration_action = {2};
+""".format(config.get('migration_table_schema', ''), config['migration_checkpoint_table_name'], config['positional_variable_marker'])
+    with config['conn'].cursor() as cur:
+        cur.execute(sql, (os.path.basename(migration['filename']), config['migration_action']))
+# End clear_sql_checkpoint
+
+
+def save_sql_checkpoint(config, migration, stmtIx, offset):
+    """
+    Replaces the checkpoint record of the SQL migration with the statement index and byte offset. Does not commit.
+    The checkpoint is written in the same transaction as the chunk it marks.
+    """
+    
+    if 'file_checksum' not in migration:
+        migration['file_checksum'] = get_migration_checksum(config, migration)
+    
+    if not check_checkpoint_table(config):
+        create_checkpoint_table(config)
+    else:
+        clear_sql_checkpoint(config, migration)
+    
+    sql = """
+insert 
+  into {0}"{1}"
+       (migration_file, migration_action, file_checksum, statement_index, byte_offset, updated_ts)
+values ({2}, {2}, {2}, {2}, {2}, {2});
+""".format(config.get('migration_table_schema', ''), config['migration_checkpoint_table_name'], config['positional_variable_marker'])
+    with config['conn'].cursor() as cur:
+        cur.execute(sql, (os.path.basename(migration['filename']), config['migration_action'], migration['file_checksum'], stmtIx, offset, dt.now()))
+# End save_sql_checkpoint
+
+
+def commit_sql_migration_chunk(config, migration, stmtIx, offset):
+    """
+    Commit the work of a SQL migration at a commit point ('-- run commit') and record a progress marker 
+    in the migration dict (commit_points, committed_statements) and in the checkpoint table (see save_sql_checkpoint).
+    A migration with commit points is NOT atomic. If it fails after a commit point, the committed chunks stay applied
+    and the next run resumes from the last checkpoint.
+    """
+    
+    check_intra_migration_commit(config, "Commit point in {}".format(os.path.basename(migration['filename'])))
+    
+    if not migration.get('commit_points'):
+        write_log(config, "Migration {} has commit points and is NOT atomic. A failure will not roll back committed chunks.".format(os.path.basename(migration['filename'])), 
+                  level=logging.WARNING)
+    
+    check_migration_lock(config)
+    save_sql_checkpoint(config, migration, stmtIx, offset)
+    config['conn'].commit()
+    
+    migration['commit_points'] = migration.get('commit_points', 0) + 1
+    migration['committed_statements'] = stmtIx
+    write_log(config, "Commit point {} reached after statement {} (byte offset {}) of {}".format(migration['commit_points'], stmtIx, offset, os.path.basename(migration['filename'])))
+# End commit_sql_migration_chunk
+
+
+def get_migration_statements(config, migration, startIx=0, startOffset=0):
+    """
+    Returns tuple
+    Yields a (statement index, statement, commit, offset) tuple for each statement of a SQL migration after 
+    statement startIx. offset is the absolute byte offset just past the statement's separator.
+    Statements are read at the offsets from the migration plan if the migration came from a plan 
+    (see compile_migration_plan()); otherwise the file is parsed from startOffset with get_statement_chunks().
+    """
+    
+    if migration.get('statements') is not None:
+        with open_migration_file(config, migration) as sqlFile:
+            binFile = sqlFile.buffer
+            for stmtIx, (start, length, commit, offset) in enumerate(migration['statements'], 1):
+                if stmtIx <= startIx:
+                    continue
+                binFile.seek(start)
+                yield stmtIx, binFile.read(length).decode(sqlFile.encoding), commit, offset
+    else:
+        with open_migration_file(config, migration, startOffset) as sqlFile:
+            for stmtIx, (stmt, commit, offset) in enumerate(get_statement_chunks(sqlFile), startIx + 1):
+                yield stmtIx, stmt, commit, startOffset + offset
+# End get_migration_statements
+
+
+def run_sql_migration(config, migration):
+    """
+    Returns bool
+    Runs all statements in a SQL migration file one-at-a-time. Uses get_migration_statements as a generator in a loop.
+    Statements followed by a '-- run commit' separator are committed at that point (see commit_sql_migration_chunk).
+    If a checkpoint exists for the migration, execution resumes at the checkpoint's byte offset.
+    """
+    
+    conn = config['conn']
+    
+    write_log(config, "SQL migration from file '{}'".format(migration['filename']))
+    
+    startOffset = 0
+    startIx = 0
+    checkpoint = get_sql_checkpoint(config, migration) if config.get('transaction_mode', 'script') == 'script' else {}
+    if checkpoint:
+        if 'file_checksum' not in migration:
+            migration['file_checksum'] = get_migration_checksum(config, migration)
+        if migration['file_checksum'] != checkpoint['file_checksum']:
+            raise MigrationError("Migration file {} has changed since its checkpoint at statement {}. "
+                                 "Remove the checkpoint record to run it from the start.".format(os.path.basename(migration['filename']), checkpoint['statement_index']))
+        startOffset = int(checkpoint['byte_offset'])
+        startIx = int(checkpoint['statement_index'])
+        write_log(config, "Resuming {} after statement {} (byte offset {})".format(os.path.basename(migration['filename']), startIx, startOffset))
+    
+    for stmtIx, stmt, commit, offset in get_migration_statements(config, migration, startIx, startOffset):
+        write_log(config, "Executing statement:\n{}".format(stmt))
+        
+        pre_statement(config, migration, stmt)
+        
+        start = time.monotonic()
+        with conn.cursor() as cur:
+            cur.execute(stmt)
+        elapsed = time.monotonic() - start
+        
+        post_statement(config, migration, stmt)
+        
+        if commit:
+            commit_sql_migration_chunk(config, migration, stmtIx, offset)
+        
+        throttle(config, elapsed)
+    
+    if checkpoint or migration.get('commit_points'):
+        # Completed. The checkpoint is removed in the same transaction as the migration record.
+        clear_sql_checkpoint(config, migration)
+    
+    return True
+# End run_sql_migration
+
+
+def get_data_migration_header(config, migration):
+    """
+    Returns dict
+    Reads the JSON sidecar header of a data migration file. The sidecar has the same name as the data file 
+    with '.json' appended (e.g. 'r2.0.0_countries.csv.json'). The sidecar of a compressed data file 
+    is named after the uncompressed file (e.g. 'r2.0.0_countries.csv.json' for 'r2.0.0_countries.csv.gz'):
+    {
+        table: # target table name (required)
+        columns: # list of target column names. Default is the CSV header row or the keys of the first NDJSON record.
+        header: # CSV only. True if the first row of the file is a header row. Default is True.
+        null: # CSV only. Field value that is loaded as NULL. Default is None (no conversion).
+        batch_size: # rows per executemany call. Default is config['batch_settings']['batch_size'].
+        encoding: # file encoding. Default is the locale encoding.
+    }
+    """
+    
+    headerFileName = migration['filename']
+    if migration.get('compression'):
+        headerFileName = headerFileName[:-(len(migration['compression']) + 1)]
+    headerFileName += '.json'
+    try:
+        if migration.get('bundle'):
+            header = json.loads(get_migration_bundle(config).read(headerFileName).decode('utf-8'))
+        else:
+            with open(headerFileName, 'r') as headerFile:
+                header = json.load(headerFile)
+    except (OSError, ValueError, KeyError) as e:
+        raise MigrationError("Cannot read the header file {} of data migration {}: {}".format(headerFileName, os.path.basename(migration['filename']), e))
+    
+    if not isinstance(header, dict) or not header.get('table'):
+        raise MigrationError("The header file {} must be a JSON object with a 'table' key".format(headerFileName))
+    
+    header.setdefault('header', True)
+    header.setdefault('null', None)
+    header.setdefault('batch_size', (config.get('batch_settings') or get_batch_settings())['batch_size'])
+    
+    return header
+# End get_data_migration_header
+
+
+def get_data_rows(config, migration, dataFile, header):
+    """
+    Returns a tuple of (columns, generator)
+    Parses a CSV or NDJSON data file one line at a time. The generator yields a tuple of values per row 
+    in the order of the returned column list.
+    """
+    
+    import csv
+    
+    columns = header.get('columns')
+    if migration['filetype'] == 'csv':
+        reader = csv.reader(dataFile)
+        if header['header']:
+            fileColumns = next(reader, None)
+            columns = columns or fileColumns
+        nullValue = header['null']
+        
+        def rows():
+            for lineNo, row in enumerate(reader, 2 if header['header'] else 1):
+                if not row:
+                    continue
+                if len(row) != len(columns):
+                    raise MigrationError("{} line {}: expected {} fields, found {}".format(os.path.basename(migration['filename']), lineNo, len(columns), len(row)))
+                yield tuple(None if v == nullValue else v for v in row)
+    else:
+        records = (json.loads(line) for line in dataFile if line.strip())
+        first = next(records, None)
+        if not columns and first is not None:
+            columns = list(first.keys())
+        
+        def rows():
+            if first is not None:
+                yield tuple(first.get(c) for c in columns)
+            for record in records:
+                yield tuple(record.get(c) for c in columns)
+    
+    if not columns:
+        raise MigrationError("No columns found for data migration {}".format(os.path.basename(migration['filename'])))
+    
+    return columns, rows()
+# End get_data_rows
+
+
+def get_data_insert_sql(config, table, columns):
+    """
+    Returns str
+    Builds the insert statement used to load a data migration.
+    """
+    
+    marker = config['positional_variable_marker']
+    return "insert into {} ({}) values ({});".format(table, ', '.join(columns), ', '.join(marker for c in columns))
+# End get_data_insert_sql
+
+
+def run_data_migration(config, migration):
+    """
+    Returns bool
+    Streams a CSV or NDJSON data migration file into its target table (see get_data_migration_header()) 
+    in fixed-size batches. Only one batch is held in memory at a time. 
+    The load is not committed here; it is part of the migration's transaction like any other migration.
+    """
+    
+    import itertools
+    
+    header = get_data_migration_header(config, migration)
+    table = header['table']
+    batchSize = int(header['batch_size'])
+    
+    write_log(config, "Data migration from file '{}' into {}".format(migration['filename'], table))
+    
+    total = 0
+    start = time.time()
+    with open_migration_file(config, migration, encoding=header.get('encoding')) as dataFile:
+        columns, rows = get_data_rows(config, migration, dataFile, header)
+        while True:
+            batch = list(itertools.islice(rows, batchSize))
+            if not batch:
+                break
+            
+            batchStart = time.monotonic()
+            load_data_batch(config, migration, table, columns, batch)
+            total += len(batch)
+            throttle(config, time.monotonic() - batchStart)
+    
+    elapsed = time.time() - start
+    write_log(config, "{}: {} rows loaded ({:.0f} rows/sec)".format(table, total, total / elapsed if elapsed > 0 else total))
+    migration['rows_loaded'] = total
+    
+    return True
+# End run_data_migration
+
+
+def run_migration_file(config, migration):
+    """
+    Returns bool
+    Runs a single migration file (SQL, Python or data) between the pre_script and post_script triggers.
+    Exceptions are not trapped here. Transaction handling is left to the caller.
+    Raises MigrationError if the migration lock was lost (see check_migration_lock()) or if a planned migration 
+    has changed since its plan was compiled (see check_plan_migration()).
+    """
+    
+    check_migration_lock(config)
+    if migration.get('from_plan'):
+        check_plan_migration(config, migration)
+    pre_script(config, migration)
+    
+    if migration['filetype'] == 'py':
+        rc = run_python_migration(config, migration)
+    elif migration['filetype'] in ('csv', 'ndjson'):
+        rc = run_data_migration(config, migration)
+    else:
+        rc = run_sql_migration(config, migration)
+    
+    post_script(config, migration)
+    
+    return rc
+# End run_migration_file
+
+
+def execute_savepoint(config, command, name):
+    """
+    Execute a savepoint command ('savepoint', 'release savepoint' or 'rollback to savepoint') for the named savepoint.
+    """
+    
+    with config['conn'].cursor() as cur:
+        cur.execute("{} {}".format(command, name))
+# End execute_savepoint
+
+
+def begin_migration_transaction(config):
+    """
+    Opens an explicit transaction for a batch of migrations.
+    Drivers like sqlite3 only begin a transaction implicitly before DML, so the DDL of a batch would 
+    otherwise be committed as it runs. Connections that report an open transaction are left alone.
+    """
+    
+    conn = config['conn']
+    if getattr(conn, 'in_transaction', False):
+        return
+    
+    with conn.cursor() as cur:
+        cur.execute("begin")
+# End begin_migration_transaction
+
+
+def flush_migration_records(config, records):
+    """
+    Returns bool
+    Writes the pending migration records of a batch. The current flag is cleared once and then set on the last record only.
+    """
+    
+    if not records:
+        return True
+    
+    records[-1]['is_current'] = 1
+    return clear_current(config) and add_migration_records(config, records)
+# End flush_migration_records
+
+
+def run_migration_batch_job(config, migrations, startIx, targetIx, incVal):
+    """
+    Returns bool
+    Executes the migration loop like run_migration_job, but applies the chain in a single batch transaction.
+    The batch runs in an explicit transaction (see begin_migration_transaction).
+    Migration records are collected while the chain runs and are written with one executemany when the batch is committed.
+    The current flag is cleared once and is only set on the last record of the batch. 
+    In 'batch' transaction mode, any failure rolls back the whole chain.
+    In 'savepoint' transaction mode, each migration is wrapped in a savepoint and the batch is committed 
+    at the interval in config['commit_interval'], after which a new transaction is opened so that releasing 
+    a savepoint never ends the transaction. A failure rolls back to the last savepoint and commits 
+    the migrations that succeeded before returning False.
+    """
+    
+    conn = config['conn']
+    totalMigrations = (abs(startIx - targetIx) + 1)
+    migration_type = 'downgrade' if incVal < 0 else 'upgrade'
+    useSavepoints = config.get('transaction_mode') == 'savepoint'
+    if useSavepoints:
+        maxMigrations, maxSeconds = config.get('commit_interval') or (None, None)
+    else:
+        maxMigrations = maxSeconds = None
+    records = []
+    lastCommit = time.time()
+    begin_migration_transaction(config)
+    
+    for i, ix in enumerate(range(startIx, targetIx + incVal, incVal), 1):
+        migration = migrations[ix]
+        savepoint = 'pv_mg_{}'.format(i)
+        try:
+            msg = "Executing {} migration {}/{} ({}): {}".format(migration_type, 
+                                                                 i, 
+                                                                 totalMigrations, 
+                                                                 config.get('transaction_mode'),
+                                                                 os.path.basename(migration['filename']))
+            if config.get('chatty'):
+                print(msg)
+            write_log(config, msg)
             
-            pre_statement(config, migration, stmt)
+            if useSavepoints:
+                execute_savepoint(config, 'savepoint', savepoint)
             
-            with conn.cursor() as cur:
-                cur.execute(stmt)
+            rc = run_migration_file(config, migration)
+            
+            if rc and useSavepoints:
+                execute_savepoint(config, 'release savepoint', savepoint)
+        except Exception as e:
+            write_log(config, 'EXCEPTION {}:: Running migration {}: {}'.format(type(e).__name__, migration['filename'], e), level=logging.ERROR)
+            if config.get('verbose', False):
+                traceback.print_exc(file=sys.stderr)
+            rc = False
+        
+        if not rc:
+            if not useSavepoints:
+                write_log(config, "Rolling back batch of {} migration(s)".format(i), level=logging.ERROR)
+                rollback_migration(config)
+                return False
+            
+            write_log(config, "Rolling back to savepoint before migration {}".format(migration['version']), level=logging.ERROR)
+            try:
+                execute_savepoint(config, 'rollback to savepoint', savepoint)
+                addOK = flush_migration_records(config, records)
+            except Exception as e:
+                write_log(config, 'EXCEPTION {}:: Saving migration records before failed migration: {}'.format(type(e).__name__, e), level=logging.ERROR)
+                addOK = False
+            
+            if addOK:
+                conn.commit()
+                if records:
+                    write_log(config, "Committed {} migration(s) that succeeded before the failure".format(len(records)))
+            else:
+                rollback_migration(config)
+            
+            return False
+        
+        records.append(get_migration_record(config, migration))
+        
+        if (maxMigrations and len(records) >= maxMigrations) or (maxSeconds and (time.time() - lastCommit) >= maxSeconds):
+            try:
+                addOK = flush_migration_records(config, records)
+            except Exception as e:
+                write_log(config, 'EXCEPTION {}:: Adding migration records for batch: {}'.format(type(e).__name__, e), level=logging.ERROR)
+                addOK = False
             
-            post_statement(config, migration, stmt)
+            if not addOK:
+                rollback_migration(config)
+                return False
+            
+            conn.commit()
+            write_log(config, "Committed batch of {} migration(s)".format(len(records)))
+            records = []
+            lastCommit = time.time()
+            begin_migration_transaction(config)
+    # End processing loop
     
-    return True
-# End run_sql_migration
+    try:
+        addOK = flush_migration_records(config, records)
+    except Exception as e:
+        write_log(config, 'EXCEPTION {}:: Adding migration records for batch: {}'.format(type(e).__name__, e), level=logging.ERROR)
+        if config.get('verbose', False):
+            traceback.print_exc(file=sys.stderr)
+        addOK = False
+    
+    if addOK:
+        conn.commit()
+    else:
+        rollback_migration(config)
+    
+    return addOK
+# End run_migration_batch_job
 
 
 def run_migration_job(config, migrations, startIx, targetIx, incVal):
@@ -964,6 +3123,7 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
     Executes the migration loop from start to target incrementing positively or negatively 
     depending if the job is an upgrade or downgrade respectively. 
     If start and target are equal, then only that one target migration is performed.
+    If config['transaction_mode'] is 'batch' or 'savepoint', the job is handed to run_migration_batch_job().
     """
     
     conn = config['conn']
@@ -974,6 +3134,15 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
     if (startIx > targetIx) and incVal > 0:
         raise MigrationError("ERROR: incrementing value would cause an infinite loop.")
     
+    transactionMode = config.get('transaction_mode', 'script')
+    if transactionMode not in TRANSACTION_MODES:
+        raise MigrationError("ERROR: transaction mode must be one of {}".format(', '.join(TRANSACTION_MODES)))
+    elif transactionMode != 'script':
+        return run_migration_batch_job(config, migrations, startIx, targetIx, incVal)
+    
+    # Resolve checkpoint table existence at a clean transaction boundary
+    check_checkpoint_table(config)
+    
     i = 0
     totalMigrations = (abs(startIx - targetIx) + 1)
     migration_type = 'downgrade' if incVal < 0 else 'upgrade'
@@ -992,20 +3161,13 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
                 print(msg)
             write_log(config, msg)
             
-            pre_script(config, migration)
-            
-            if migration['filetype'] == 'py':
-                rc = run_python_migration(config, migration)
-            else:
-                rc = run_sql_migration(config, migration)
-            
-            post_script(config, migration)
+            rc = run_migration_file(config, migration)
             
         except Exception as e:
             write_log(config, 'EXCEPTION {}:: Running migration {}: {}'.format(type(e).__name__, migration['filename'], e), level=logging.ERROR)
             if config.get('verbose', False):
                 traceback.print_exc(file=sys.stderr)
-            conn.rollback()
+            rollback_migration(config)
             return False
         else:
             # we ran without exception
@@ -1017,13 +3179,13 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
                     write_log(config, 'EXCEPTION {}:: Adding migration record for version {}: {}'.format(type(e).__name__, migration['version'], e), level=logging.ERROR)
                     if config.get('verbose', False):
                         traceback.print_exc(file=sys.stderr)
-                    conn.rollback()
+                    rollback_migration(config)
                     return False
                 else:
                     if addOK:
                         conn.commit()
                     else:
-                        conn.rollback()
+                        rollback_migration(config)
                         return False
                 
                 if startIx == targetIx:
@@ -1032,7 +3194,7 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
                     startIx += incVal
             else:
                 # We had some sort of non-exception or gracefully handled failure
-                conn.rollback()
+                rollback_migration(config)
                 return False
     # End processing loop
     
@@ -1040,39 +3202,358 @@ def run_migration_job(config, migrations, startIx, targetIx, incVal):
 # End run_migration_job
 
 
+def get_migration_bundle(config):
+    """
+    Returns a zipfile.ZipFile instance
+    Opens the bundle file from config['migration_bundle_file']. The open bundle is kept in config['migration_bundle'] 
+    so that discovery and all migrations share a single open file.
+    """
+    
+    bundle = config.get('migration_bundle')
+    if bundle is None or bundle.filename != config['migration_bundle_file']:
+        bundle = config['migration_bundle'] = zipfile.ZipFile(config['migration_bundle_file'], 'r')
+    
+    return bundle
+# End get_migration_bundle
+
+
+def close_migration_bundle(config):
+    """
+    Closes the bundle file opened by get_migration_bundle(), if any.
+    """
+    
+    bundle = config.pop('migration_bundle', None)
+    if bundle is not None:
+        bundle.close()
+# End close_migration_bundle
+
+
+def get_bundle_migrations(config):
+    """
+    Returns list
+    Return a list of migration member names from the bundle's index. Based on the job type, it will return 
+    the 'upgrades' list or the 'downgrades' list of the index.
+    """
+    
+    bundle = get_migration_bundle(config)
+    try:
+        index = json.loads(bundle.read(BUNDLE_INDEX_NAME).decode('utf-8'))
+    except (KeyError, ValueError) as e:
+        raise MigrationError("Cannot read the index of migration bundle {}: {}".format(config['migration_bundle_file'], e))
+    
+    if index.get('format') != BUNDLE_FORMAT_VERSION:
+        raise MigrationError("Unsupported migration bundle format {}".format(index.get('format')))
+    
+    return list(index['upgrades' if config['migration_action'] == 'upgrade' else 'downgrades'])
+# End get_bundle_migrations
+
+
+def write_migration_bundle(config, bundleFileName):
+    """
+    Returns int (the number of migrations written)
+    Writes the migrations in the upgrade and downgrade directories (and the header files of data migrations) 
+    to a zip bundle with an index for use with get_migration_bundle_file().
+    Already compressed migrations are stored as-is; everything else is deflated.
+    """
+    
+    savedAction = config.get('migration_action')
+    savedBundleFileName = config.get('migration_bundle_file')
+    config['migration_bundle_file'] = None
+    members = {}
+    try:
+        for key, action in (('upgrades', 'upgrade'), ('downgrades', 'downgrade')):
+            config['migration_action'] = action
+            members[key] = [fn for fn in get_migrations(config) if get_migration_filename_info(config, fn)]
+    finally:
+        config['migration_action'] = savedAction
+        config['migration_bundle_file'] = savedBundleFileName
+    
+    index = {'format': BUNDLE_FORMAT_VERSION}
+    tmpFileName = bundleFileName + '.tmp'
+    with zipfile.ZipFile(tmpFileName, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for key, fileNames in members.items():
+            index[key] = []
+            for fileName in sorted(fileNames):
+                memberName = '{}/{}'.format(key, os.path.basename(fileName))
+                compressed = fileName.rsplit('.', 1)[-1] in COMPRESSION_TYPES
+                bundle.write(fileName, memberName, zipfile.ZIP_STORED if compressed else zipfile.ZIP_DEFLATED)
+                index[key].append(memberName)
+                
+                info = get_migration_filename_info(config, fileName)
+                if info['filetype'] in ('csv', 'ndjson'):
+                    headerFileName = fileName[:-(len(info['compression']) + 1)] if info['compression'] else fileName
+                    headerFileName += '.json'
+                    if os.path.exists(headerFileName):
+                        bundle.write(headerFileName, '{}/{}'.format(key, os.path.basename(headerFileName)))
+        bundle.writestr(BUNDLE_INDEX_NAME, json.dumps(index, indent=1))
+    os.replace(tmpFileName, bundleFileName)
+    
+    return len(index['upgrades']) + len(index['downgrades'])
+# End write_migration_bundle
+
+
 def get_migrations(config):
     """
     Returns list
     Return a list of migrations. Based on the job type, it will look in the upgrades dir or the downgrades dir.
-    Uses glob.glob to obtain the list of SQL and python files.
+    Uses glob.glob to obtain the list of SQL, python and data (csv, ndjson) files. 
+    SQL and data files may be compressed (see COMPRESSION_TYPES).
+    If a bundle file is configured, the member names from the bundle's index are returned instead.
     File extensions should always be lowercase.
     """
     
     import glob
     
+    if config.get('migration_bundle_file'):
+        return get_bundle_migrations(config)
+    
     migrationsDir = 'migration_upgrade_dir'if config['migration_action'] == 'upgrade' else 'migration_downgrade_dir'
     migrationsDir = config[migrationsDir]
     
-    # only sql and py files allowed!
-    migrations = glob.glob(os.path.join(migrationsDir, '*.sql'))
-    migrations.extend(glob.glob(os.path.join(migrationsDir, '*.py')))
+    # only sql, py and data files (optionally compressed) allowed!
+    migrations = []
+    for fileType in MIGRATION_FILE_TYPES:
+        migrations.extend(glob.glob(os.path.join(migrationsDir, '*.' + fileType)))
+        if fileType != 'py':
+            for compression in COMPRESSION_TYPES:
+                migrations.extend(glob.glob(os.path.join(migrationsDir, '*.{}.{}'.format(fileType, compression))))
     
     return migrations
 # End get_migrations
 
 
+def get_migration_source_info(config):
+    """
+    Returns dict
+    Describes where the migrations are read from: a bundle (by file name) or the migration directories. 
+    It holds no absolute paths, so a plan compiled on one host can be used from another checkout.
+    A migration plan is only used with the same source.
+    """
+    
+    bundle = config.get('migration_bundle_file')
+    return {'bundle': os.path.basename(bundle) if bundle else None}
+# End get_migration_source_info
+
+
+def get_migration_source_files(config):
+    """
+    Returns dict
+    Returns the sorted file names (relative to their migration directory) of the loose upgrade and downgrade migrations, 
+    keyed by 'upgrades' and 'downgrades'.
+    """
+    
+    savedAction = config['migration_action']
+    files = {}
+    try:
+        for key, action in (('upgrades', 'upgrade'), ('downgrades', 'downgrade')):
+            config['migration_action'] = action
+            files[key] = sorted(os.path.basename(f) for f in get_migrations(config))
+    finally:
+        config['migration_action'] = savedAction
+    
+    return files
+# End get_migration_source_files
+
+
+def get_plan_migration(config, key, migration):
+    """
+    Returns dict
+    Returns a copy of a migration dict of a plan with its file name resolved against the configured migration directory 
+    (or bundle). Plans store file names relative to their directory. The copy is flagged with 'from_plan' so its 
+    content is verified before it is executed.
+    """
+    
+    migration = dict(migration)
+    migration['from_plan'] = True
+    if config.get('migration_bundle_file'):
+        migration['bundle'] = config['migration_bundle_file']
+    else:
+        migration['filename'] = os.path.join(config['migration_upgrade_dir' if key == 'upgrades' else 'migration_downgrade_dir'], migration['filename'])
+    
+    return migration
+# End get_plan_migration
+
+
+def compile_migration_plan(config):
+    """
+    Action function. Returns int.
+    Writes a precompiled migration plan to config['plan_file'] or config['migration_plan_file']. 
+    The plan is a single marshal file with the sorted upgrade and downgrade catalogs. Each SQL migration 
+    has its statements pre-split into (byte offset, byte length, commit, offset past separator) entries and 
+    each Python migration has its compiled code object. All migrations have their content checksum.
+    The plan is only valid for the Python version (bytecode magic number) that wrote it.
+    """
+    
+    planFileName = config.get('plan_file') or config.get('migration_plan_file')
+    if not planFileName:
+        write_log(config, "No migration plan file configured", level=logging.ERROR)
+        return 1
+    
+    # Never compile from an existing plan
+    config['migration_plan'] = False
+    
+    source = get_migration_source_info(config)
+    plan = {'magic': PLAN_MAGIC, 
+            'format': PLAN_FORMAT_VERSION, 
+            'python': ilutil.MAGIC_NUMBER, 
+            'lib_version': __VERSION_STRING__, 
+            'created': dt.now().isoformat(), 
+            'source': source}
+    
+    savedAction = config['migration_action']
+    try:
+        for key, action in (('upgrades', 'upgrade'), ('downgrades', 'downgrade')):
+            config['migration_action'] = action
+            plan[key] = migrations = setup_migrations(config)
+            for migration in migrations:
+                migration['file_checksum'] = get_migration_checksum(config, migration)
+                
+                if migration['filetype'] == 'sql':
+                    migration['statements'] = statements = []
+                    with open_migration_file(config, migration) as sqlFile:
+                        start = 0
+                        for stmt, commit, offset in get_statement_chunks(sqlFile):
+                            statements.append((start, len(stmt.encode(sqlFile.encoding)), commit, offset))
+                            start = offset
+                elif migration['filetype'] == 'py':
+                    if migration.get('bundle'):
+                        pySource = get_migration_bundle(config).read(migration['filename'])
+                        codeFileName = os.path.join(migration['bundle'], migration['filename'])
+                    else:
+                        with open(migration['filename'], 'rb') as pyFile:
+                            pySource = pyFile.read()
+                        codeFileName = migration['filename']
+                    migration['code'] = get_code(pySource, codeFileName)
+                
+                write_log(config, "Planned {} migration {}".format(action, os.path.basename(migration['filename'])))
+                
+                # Keep the plan portable: bundle and directory are resolved when the plan is used
+                migration.pop('bundle', None)
+                if not source['bundle']:
+                    migration['filename'] = os.path.basename(migration['filename'])
+    finally:
+        config['migration_action'] = savedAction
+        del config['migration_plan']
+    
+    tmpFileName = planFileName + '.tmp'
+    with open(tmpFileName, 'wb') as planFile:
+        marshal.dump(plan, planFile)
+        planFile.flush()
+        os.fsync(planFile.fileno())
+    os.replace(tmpFileName, planFileName)
+    
+    msg = "Wrote migration plan {} ({} upgrades, {} downgrades)".format(planFileName, len(plan['upgrades']), len(plan['downgrades']))
+    if config.get('chatty'):
+        print(msg)
+    write_log(config, msg)
+    
+    return 0
+# End compile_migration_plan
+
+
+def load_migration_plan(config, planFileName):
+    """
+    Returns dict or None
+    Loads a migration plan file. Returns None if the file does not exist or was not written by this 
+    plan format and Python version.
+    """
+    
+    try:
+        with open(planFileName, 'rb') as planFile:
+            plan = marshal.load(planFile)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError) as e:
+        write_log(config, "Cannot load migration plan {}: {}".format(planFileName, e), level=logging.WARNING)
+        return None
+    
+    if not isinstance(plan, dict) or plan.get('magic') != PLAN_MAGIC or plan.get('format') != PLAN_FORMAT_VERSION:
+        write_log(config, "{} is not a supported migration plan. Ignoring it.".format(planFileName), level=logging.WARNING)
+        return None
+    if plan.get('python') != ilutil.MAGIC_NUMBER:
+        write_log(config, "Migration plan {} was written by a different Python version. Ignoring it.".format(planFileName), level=logging.WARNING)
+        return None
+    
+    return plan
+# End load_migration_plan
+
+
+def check_migration_plan(config, plan):
+    """
+    Returns bool
+    Verifies that a migration plan still matches its source by location-independent facts only: the same source kind 
+    and the same upgrade and downgrade file names. No migration file is read here. The content of a planned migration 
+    is verified against its planned checksum when it is executed (see check_plan_migration()).
+    """
+    
+    if plan['source'] != get_migration_source_info(config):
+        return False
+    
+    files = get_migration_source_files(config)
+    for key in ('upgrades', 'downgrades'):
+        if files[key] != sorted(os.path.basename(m['filename']) for m in plan[key]):
+            return False
+    
+    return True
+# End check_migration_plan
+
+
+def check_plan_migration(config, migration):
+    """
+    Verifies that a migration taken from a plan still has the content checksum it was planned with.
+    Raises MigrationError if the file changed since the plan was compiled.
+    """
+    
+    if get_migration_checksum(config, migration) != migration['file_checksum']:
+        raise MigrationError("Migration {} has changed since the migration plan was compiled. Recompile the plan with --compile-plan.".format(
+                             os.path.basename(migration['filename'])))
+# End check_plan_migration
+
+
+def get_migration_plan(config):
+    """
+    Returns dict or None
+    Returns the current migration plan from config['migration_plan_file'] or None if there is no plan 
+    or the plan is stale. The result is kept in config['migration_plan'].
+    """
+    
+    plan = config.get('migration_plan')
+    if plan is None:
+        plan = False
+        if config.get('migration_plan_file'):
+            plan = load_migration_plan(config, config['migration_plan_file']) or False
+            if plan and not check_migration_plan(config, plan):
+                write_log(config, "Migration plan {} is stale. Using migration files.".format(config['migration_plan_file']), level=logging.WARNING)
+                plan = False
+            elif plan:
+                write_log(config, "Using migration plan {}".format(config['migration_plan_file']))
+        config['migration_plan'] = plan
+    
+    return plan or None
+# End get_migration_plan
+
+
 def setup_migrations(config):
     """
     Returns list
     Gets the migration file names, creates migration dicts from the filenames, and sorts them by version.
-    See get_migration_filename_info().
+    See get_migration_filename_info(). If a current migration plan exists (see get_migration_plan()), 
+    the sorted migrations are taken from the plan instead.
     """
     
+    plan = get_migration_plan(config)
+    if plan:
+        key = 'upgrades' if config['migration_action'] == 'upgrade' else 'downgrades'
+        return [get_plan_migration(config, key, m) for m in plan[key]]
+    
     migrations = get_migrations(config)
     
     if len(migrations) > 0:
         # info-ize them
         migrations = [get_migration_filename_info(config, fn) for fn in migrations]
+        if config.get('migration_bundle_file'):
+            for migration in migrations:
+                migration['bundle'] = config['migration_bundle_file']
         # and sort 'em
         migrations = sort_migrations(config, migrations)
 
@@ -1080,6 +3561,134 @@ def setup_migrations(config):
 # End setup_migrations
 
 
+def get_repeatable_migrations(config):
+    """
+    Returns list
+    Returns the repeatable migrations in the repeatable directory, sorted by file name. File names are parsed with 
+    the regex returned from get_repeatable_filename_regex(). The migration dicts have the same keys as the ones 
+    from get_migration_filename_info() with the name as description and repeatable = True. The version is the file name 
+    without its type (ex: 'R_users_view'), so the records of different repeatable migrations never share a version.
+    Repeatable migrations are always read from the directory, not from a bundle or a plan.
+    """
+    
+    import glob
+    
+    repeatableDir = config.get('migration_repeatable_dir')
+    if not repeatableDir:
+        return []
+    
+    migrations = []
+    for fileName in sorted(glob.glob(os.path.join(repeatableDir, '*'))):
+        values = config['repeatable_filename_regex'].findall(os.path.basename(fileName))
+        if not values or len(values[0]) != 2:
+            continue
+        description, fileType = values[0]
+        fileType, _, compression = fileType.lower().partition('.')
+        migrations.append({'version': os.path.basename(fileName).partition('.')[0], 
+                           'description': description, 
+                           'filetype': fileType, 
+                           'compression': compression if compression in COMPRESSION_TYPES else None, 
+                           'filename': fileName, 
+                           'repeatable': True})
+    
+    return migrations
+# End get_repeatable_migrations
+
+
+def get_applied_repeatable_checksums(config):
+    """
+    Returns dict
+    Returns the checksum of the latest application of every repeatable migration keyed by file name (single query).
+    """
+    
+    sql = """
+select migration_file, checksum
+  from {}"{}"
+ where migration_action = 'repeatable'
+ order 
+    by applied_ts;
+""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    
+    # The latest application of a file wins
+    applied = {}
+    with config['conn'].cursor() as cur:
+        cur.execute(sql)
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            applied.update((r['migration_file'], r['checksum']) for r in rows)
+    
+    return applied
+# End get_applied_repeatable_checksums
+
+
+def run_repeatable_migrations(config):
+    """
+    Returns int. This return code will be forwarded to the shell.
+    Runs the repeatable migrations (see get_repeatable_migrations()) that were never applied or whose checksum differs 
+    from the checksum of their latest application. Called after every successful upgrade. Each migration is run in 
+    its own transaction with a 'repeatable' migration record that does not change the current or baseline version.
+    """
+    
+    migrations = get_repeatable_migrations(config)
+    if not migrations:
+        return 0
+    
+    conn = config['conn']
+    write_log(config, "Running Repeatable Migrations")
+    try:
+        checksums = get_catalog_checksums(config, migrations)
+        applied = get_applied_repeatable_checksums(config)
+        conn.rollback()
+        # Resolve checkpoint table existence at a clean transaction boundary
+        check_checkpoint_table(config)
+    except Exception as e:
+        write_log(config, "EXCEPTION {}:: Checking repeatable migrations: {}".format(type(e).__name__, e), level=logging.ERROR)
+        if config.get('verbose', False):
+            traceback.print_exc(file=sys.stderr)
+        rollback_migration(config)
+        return 25
+    
+    pending = []
+    for migration in migrations:
+        migration['file_checksum'] = checksums[migration['filename']]
+        if applied.get(os.path.basename(migration['filename'])) != migration['file_checksum']:
+            pending.append(migration)
+    
+    if not pending:
+        write_log(config, "Repeatable migrations are up to date")
+        return 0
+    
+    for i, migration in enumerate(pending, 1):
+        msg = "Executing repeatable migration {}/{}: {}".format(i, len(pending), os.path.basename(migration['filename']))
+        if config.get('chatty'):
+            print(msg)
+        write_log(config, msg)
+        
+        try:
+            rc = run_migration_file(config, migration)
+            if rc:
+                record = get_migration_record(config, migration)
+                record['migration_action'] = 'repeatable'
+                rc = add_migration_records(config, [record])
+        except Exception as e:
+            write_log(config, 'EXCEPTION {}:: Running repeatable migration {}: {}'.format(type(e).__name__, migration['filename'], e), level=logging.ERROR)
+            if config.get('verbose', False):
+                traceback.print_exc(file=sys.stderr)
+            rollback_migration(config)
+            return 25
+        
+        if not rc:
+            rollback_migration(config)
+            return 25
+        conn.commit()
+    # End repeatable loop
+    
+    return 0
+# End run_repeatable_migrations
+
+
 def find_migration_file_version(config, migrations, version, prior=False):
     """
     Returns int (or None on failure)
@@ -1291,21 +3900,155 @@ def run_downgrade(config):
     try:
         rc = run_migration_job(config, migrations, startIx, targetIx, -1)
     except Exception as e:
-        write_log(config, "EXCEPTION {}:: running migration job: {}".format(type(e).__name__, e), level=logging.ERROR)
-        return 35
-    else:
-        if not rc:
-            return 36
+        write_log(config, "EXCEPTION {}:: running migration job: {}".format(type(e).__name__, e), level=logging.ERROR)
+        return 35
+    else:
+        if not rc:
+            return 36
+
+    currentVersion = get_current(config)
+    if currentVersion:
+        msg = "Current database version is: {}".format(currentVersion['version'])
+        if config.get('chatty'):
+            print(msg)
+        write_log(config, msg)
+
+    return 0
+# End run_downgrade
+
+
+def get_catalog_hash(config):
+    """
+    Returns str
+    Returns the SHA-256 hex digest of the local upgrade catalog: the version and file name of every upgrade migration 
+    in version order and the file name and checksum of every repeatable migration. 
+    Runners with the same catalog hash apply the same migrations. Computed once per run.
+    """
+    
+    if config.get('catalog_hash'):
+        return config['catalog_hash']
+    
+    savedAction = config['migration_action']
+    config['migration_action'] = 'upgrade'
+    try:
+        migrations = setup_migrations(config)
+    finally:
+        config['migration_action'] = savedAction
+    
+    digest = hashlib.sha256()
+    for migration in migrations:
+        digest.update('{}\t{}\n'.format(migration['version'], os.path.basename(migration['filename'])).encode('utf-8'))
+    
+    repeatables = get_repeatable_migrations(config)
+    if repeatables:
+        checksums = get_catalog_checksums(config, repeatables)
+        for migration in repeatables:
+            digest.update('R\t{}\t{}\n'.format(os.path.basename(migration['filename']), checksums[migration['filename']]).encode('utf-8'))
+    
+    config['catalog_hash'] = digest.hexdigest()
+    return config['catalog_hash']
+# End get_catalog_hash
+
+
+def write_status_file(config):
+    """
+    Returns bool
+    Atomically writes the status snapshot (JSON) to config['status_file']: the current version, the baseline version, 
+    the latest applied timestamp and the catalog hash (see get_catalog_hash()). The versions are taken from the 
+    migration state of the run. Errors are logged and do not fail the run.
+    """
+    
+    statusFileName = config.get('status_file')
+    if not statusFileName:
+        return False
+    
+    current = get_current(config)
+    baseline = get_baseline(config)
+    # Records written in this run carry datetime instances; records read back may carry strings
+    applied = [str(r['applied_ts']) for r in (current, baseline) if r]
+    status = {'format': STATUS_FORMAT_VERSION,
+              'written_ts': dt.now().isoformat(),
+              'current_version': current.get('version'),
+              'baseline_version': baseline.get('version'),
+              'applied_ts': max(applied) if applied else None,
+              'catalog_hash': get_catalog_hash(config)}
+    
+    tmpFileName = '{}.{}.tmp'.format(statusFileName, os.getpid())
+    try:
+        statusDir = os.path.dirname(statusFileName)
+        if statusDir:
+            os.makedirs(statusDir, mode=0o755, exist_ok=True)
+        with open(tmpFileName, 'w') as statusFile:
+            json.dump(status, statusFile, indent=2)
+            statusFile.flush()
+            os.fsync(statusFile.fileno())
+        os.replace(tmpFileName, statusFileName)
+    except Exception as e:
+        write_log(config, "EXCEPTION:: Writing status file '{}': {}".format(statusFileName, e), level=logging.WARNING)
+        try:
+            os.unlink(tmpFileName)
+        except OSError:
+            pass
+        return False
+    
+    write_log(config, "Wrote status file '{}'".format(statusFileName))
+    return True
+# End write_status_file
+
+
+def load_status_file(config):
+    """
+    Returns dict or None
+    Returns the status snapshot from config['status_file']. Returns None if there is no status file or it cannot be used: 
+    it is missing, unreadable, of another format or older than config['status_file_max_age'] seconds.
+    """
+    
+    statusFileName = config.get('status_file')
+    if not statusFileName:
+        return None
+    
+    try:
+        with open(statusFileName, 'r') as statusFile:
+            age = time.time() - os.fstat(statusFile.fileno()).st_mtime
+            status = json.load(statusFile)
+    except Exception as e:
+        write_log(config, "Cannot read status file '{}': {}".format(statusFileName, e))
+        return None
+    
+    if not isinstance(status, dict) or status.get('format') != STATUS_FORMAT_VERSION:
+        write_log(config, "Status file '{}' has an unknown format".format(statusFileName))
+        return None
+    
+    maxAge = config.get('status_file_max_age')
+    if maxAge is not None and age > maxAge:
+        write_log(config, "Status file '{}' is older than {} seconds".format(statusFileName, maxAge))
+        return None
+    
+    return status
+# End load_status_file
 
-    currentVersion = get_current(config)
-    if currentVersion:
-        msg = "Current database version is: {}".format(currentVersion['version'])
-        if config.get('chatty'):
-            print(msg)
-        write_log(config, msg)
 
+def verify_status_file(config):
+    """
+    Returns int or None
+    Verifies the target version against the status snapshot (see load_status_file()). 
+    Returns None if the status file cannot be used and the database must be checked instead.
+    """
+    
+    status = load_status_file(config)
+    if status is None:
+        return None
+    
+    write_log(config, "Running Verify Version = {} from status file".format(config['version']))
+    if status.get('current_version') is None:
+        write_log(config, "No current version information in the status file.", level=logging.ERROR)
+        return 51
+    elif status['current_version'] != config['version']:
+        write_log(config, "Version mismatch! Current = {}; Target = {}.".format(status['current_version'], config['version']))
+        return 50
+    
     return 0
-# End run_downgrade
+# End verify_status_file
 
 
 def display_version_info(version_info, legend):
@@ -1316,7 +4059,7 @@ def display_version_info(version_info, legend):
     print(legend)
     width = max(len(c) for c in VALID_COLUMNS)
     for k in VALID_COLUMNS:
-        print("    {0:{1}s} : {2}".format(k, width, version_info[k]))
+        print("    {0:{1}s} : {2}".format(k, width, version_info.get(k)))
 # End display_current_version
 
 
@@ -1390,6 +4133,144 @@ def verify_version(config):
 # End get_info
 
 
+def get_catalog_checksums(config, migrations):
+    """
+    Returns dict
+    Returns the content checksum (see get_migration_checksum()) of every migration keyed by file name. Checksums that are 
+    already known are used as is, but not the checksums of a migration plan, which are only verified on execution. 
+    The other files are hashed in parallel threads. Checksums of files on disk are cached in the cache directory 
+    with the file's (mtime, size), so unchanged files are not read again.
+    """
+    import concurrent.futures
+    
+    cacheFileName = os.path.join(config['cache_dir'], 'checksums.json') if config.get('cache_dir') else None
+    cache = {}
+    if cacheFileName:
+        try:
+            with open(cacheFileName, 'r') as cacheFile:
+                cache = json.load(cacheFile)
+        except (OSError, ValueError):
+            cache = {}
+    
+    checksums = {}
+    stamps = {}
+    todo = []
+    for migration in migrations:
+        fileName = migration['filename']
+        if migration.get('file_checksum') and not migration.get('from_plan'):
+            checksums[fileName] = migration['file_checksum']
+            continue
+        if not migration.get('bundle'):
+            try:
+                st = os.stat(fileName)
+            except OSError:
+                todo.append(migration)
+                continue
+            key = os.path.abspath(fileName)
+            stamps[key] = [st.st_mtime_ns, st.st_size]
+            entry = cache.get(key)
+            if entry and entry.get('stamp') == stamps[key]:
+                checksums[fileName] = entry['checksum']
+                continue
+        todo.append(migration)
+    # End migration loop
+    
+    if todo:
+        if any(m.get('bundle') for m in todo):
+            # Open the bundle once before the worker threads read from it
+            get_migration_bundle(config)
+        with concurrent.futures.ThreadPoolExecutor() as pool:
+            for migration, checksum in zip(todo, pool.map(lambda m: get_migration_checksum(config, m), todo)):
+                checksums[migration['filename']] = checksum
+                key = os.path.abspath(migration['filename'])
+                if key in stamps:
+                    cache[key] = {'stamp': stamps[key], 'checksum': checksum}
+        
+        if cacheFileName and stamps:
+            tmpFileName = '{}.{}.tmp'.format(cacheFileName, os.getpid())
+            try:
+                os.makedirs(config['cache_dir'], mode=0o755, exist_ok=True)
+                with open(tmpFileName, 'w') as cacheFile:
+                    json.dump({k: v for k, v in cache.items() if k in stamps or os.path.exists(k)}, cacheFile)
+                os.replace(tmpFileName, cacheFileName)
+            except OSError:
+                pass
+    
+    return checksums
+# End get_catalog_checksums
+
+
+def verify_checksums(config):
+    """
+    Action function. Returns int (zero (0) is success).
+    Compares the content checksums of the local upgrade and downgrade migrations (see get_catalog_checksums()) with 
+    the checksums stored for their latest application, which are read with a single query. 
+    Migrations that have not been applied or were applied without a checksum are skipped.
+    """
+    
+    if config.get('migration_table_exists') is False or 'checksum' not in get_migration_table_columns(config):
+        write_log(config, "No migration checksums are stored", level=logging.WARNING)
+        return 0
+    
+    write_log(config, "Running Verify Checksums")
+    conn = config['conn']
+    sql = """
+select migration_action, migration_file, checksum
+  from {}"{}"
+ where checksum is not null
+   and migration_action in ('upgrade', 'downgrade')
+ order 
+    by applied_ts;
+""".format(config.get('migration_table_schema', ''), config['migration_table_name'])
+    
+    savedAction = config['migration_action']
+    try:
+        catalogs = {}
+        for action in ('upgrade', 'downgrade'):
+            config['migration_action'] = action
+            catalogs[action] = setup_migrations(config)
+        config['migration_action'] = savedAction
+        
+        # The latest application of a file wins
+        stored = {}
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            while True:
+                rows = cur.fetchmany(1000)
+                if not rows:
+                    break
+                stored.update(((r['migration_action'], r['migration_file']), r['checksum']) for r in rows)
+        conn.rollback()
+        
+        local = get_catalog_checksums(config, catalogs['upgrade'] + catalogs['downgrade'])
+    except Exception as e:
+        config['migration_action'] = savedAction
+        write_log(config, "EXCEPTION:: Verifying checksums: {}".format(e), level=logging.ERROR)
+        if config.get('verbose', False):
+            traceback.print_exc(file=sys.stderr)
+        return 91
+    
+    checked = mismatched = 0
+    for action, migrations in catalogs.items():
+        for migration in migrations:
+            storedChecksum = stored.get((action, os.path.basename(migration['filename'])))
+            if storedChecksum is None:
+                continue
+            checked += 1
+            if storedChecksum != local[migration['filename']]:
+                mismatched += 1
+                write_log(config, "Checksum mismatch! {} migration {} was applied with checksum {} but the local file has {}".format(
+                    action, os.path.basename(migration['filename']), storedChecksum, local[migration['filename']]), level=logging.ERROR)
+    
+    msg = "Verified the checksums of {} applied migrations: {} mismatched".format(checked, mismatched)
+    if config.get('chatty'):
+        print(msg)
+    write_log(config, msg)
+    
+    return 90 if mismatched else 0
+# End verify_checksums
+
+
 def wrap_text(text, limit):
     """
     Wrap a text string at a certain width (limit)
@@ -1408,111 +4289,248 @@ def wrap_text(text, limit):
 # End wrap_text
 
 
-def write_header(tmp_file, fields, lengths):
+def get_log_line_format(fields, lengths):
     """
-    Write migration data output header
+    Returns str
+    Returns the format string of one line of the migration log table. Computed once per output.
     """
     
-    fmtStr = ' | '.join("{{{0}:{1}s}}".format(i, lengths[fields[i]]) for i in range(len(fields)))
-    print(fmtStr.format(*fields), file=tmp_file)
+    return ' | '.join("{{{0}:{1}s}}".format(i, lengths[fields[i]]) for i in range(len(fields)))
+# End get_log_line_format
+
+
+def write_header(out, fields, lengths, fmtStr):
+    """
+    Write migration data output header
+    """
     
-    fmtStr = '-+-'.join("{{{0}:-<{1}s}}".format(i, lengths[fields[i]]) for i in range(len(fields)))
-    print(fmtStr.format(*[''] * len(fields)), file=tmp_file)
+    print(fmtStr.format(*fields), file=out)
+    print('-+-'.join('-' * lengths[f] for f in fields), file=out)
 # End write_header
 
 
-def write_line(tmp_file, record, fields, lengths):
+def write_line(out, record, fields, lengths, fmtStr):
     """
-    Write a formatted table of data to stdout.
+    Write one record as one or more lines of the table. Only values wider than their column are wrapped.
     """
     
-    fmtStr = ' | '.join("{{{0}:{1}s}}".format(col, lengths[col]) for col in fields)
-    tmp = record.copy()
-    out = dict.fromkeys(fields, '')
+    cells = [str(record.get(f, '')) for f in fields]
+    if all(len(cells[i]) <= lengths[fields[i]] for i in range(len(fields))):
+        print(fmtStr.format(*cells), file=out)
+        return
     
     # Wrap all the things
-    for col in fields:
-        tmp[col] = {i: t for i, t in enumerate(wrap_text(str(tmp[col]), lengths[col]))}
-    
-    # output wraped stuffs
-    i = 0
-    while True:
-        haveData = False
-        for col in fields:
-            out[col] = tmp[col].get(i, '')
-            if not haveData:
-                haveData = bool(out[col])
-        
-        if haveData:
-            print(fmtStr.format(**out), file=tmp_file)
-            i += 1
-        else:
-            break
-    # End output loop
+    import itertools
+    wrapped = [list(wrap_text(cells[i], lengths[fields[i]])) for i in range(len(fields))]
+    for line in itertools.zip_longest(*wrapped, fillvalue=''):
+        print(fmtStr.format(*line), file=out)
 # End write_line
 
 
-def output_migration_data(config, migrationLog):
+def write_migration_data(config, records, out):
     """
-    Print formatted migration data to stdout
+    Returns int
+    Writes the records as a table to the out stream as they are read. Returns the number of records written.
+    Checksums are shortened to the width of their column; the CSV and NDJSON exports keep them in full.
     """
-    import tempfile
-    import subprocess
-    import shutil
     
-    tmp_file, tmp_file_name = tempfile.mkstemp(text=True)
-    tmp_file = os.fdopen(tmp_file, 'w')
     fields = ['#'] + VALID_COLUMNS
     lengths = dict(zip(fields, [5] + COLUMN_LENGTHS))
-    write_header(tmp_file, fields, lengths)
+    fmtStr = get_log_line_format(fields, lengths)
+    write_header(out, fields, lengths, fmtStr)
+    
+    count = 0
+    for record in records:
+        record['#'] = count
+        if record.get('checksum'):
+            record['checksum'] = record['checksum'][:lengths['checksum']]
+        write_line(out, record, fields, lengths, fmtStr)
+        count += 1
+    # End record loop
     
-    if bool(shutil.which('less')):
-        traversal = reversed(range(len(migrationLog)))
-    else:
-        traversal = range(len(migrationLog))
+    out.flush()
+    return count
+# End write_migration_data
+
+
+def write_migration_data_csv(config, records, out):
+    """
+    Returns int
+    Writes the records as CSV (with a header row) to the out stream as they are read. Returns the number of records written.
+    """
+    import csv
     
-    for i in traversal:
-        record = migrationLog[i]
-        record['#'] = i
-        write_line(tmp_file, record, fields, lengths)
+    writer = csv.writer(out)
+    writer.writerow(VALID_COLUMNS)
+    count = 0
+    for record in records:
+        writer.writerow([record.get(c) for c in VALID_COLUMNS])
+        count += 1
     # End record loop
     
-    tmp_file.flush()
-    tmp_file.close()
+    out.flush()
+    return count
+# End write_migration_data_csv
+
+
+def write_migration_data_ndjson(config, records, out):
+    """
+    Returns int
+    Writes the records as newline-delimited JSON objects to the out stream as they are read. Timestamps are written as strings. 
+    Returns the number of records written.
+    """
+    
+    count = 0
+    for record in records:
+        out.write(json.dumps({c: record.get(c) for c in VALID_COLUMNS}, default=str))
+        out.write('\n')
+        count += 1
+    # End record loop
+    
+    out.flush()
+    return count
+# End write_migration_data_ndjson
+
+
+def output_migration_data(config, records):
+    """
+    Returns int
+    Print formatted migration data (any iterable of records) to stdout. On a terminal, the lines are piped into 'less' 
+    as the records are read, so the first screen is shown right away. Returns the number of records written.
+    """
+    import subprocess
+    import shutil
+    
+    pager = shutil.which('less') if sys.stdout.isatty() else None
+    proc = None
+    if pager:
+        try:
+            proc = subprocess.Popen([pager, '-E', '-F', '-P', ':'], stdin=subprocess.PIPE, universal_newlines=True)
+        except OSError:
+            proc = None
+    
+    if proc is None:
+        return write_migration_data(config, records, sys.stdout)
     
+    count = 0
     try:
-        subprocess.call(['less', '-E' '-F', '-P', ':', tmp_file_name])
-    except:
-        with open(tmp_file_name, 'r') as tmpf:
-            buff = ['']
-            while len(buff):
-                print(buff)
-                buff = tmpf.read(4000)
+        count = write_migration_data(config, records, proc.stdin)
+    except BrokenPipeError:
+        # The pager was closed before the end of the log
+        pass
     finally:
-        os.unlink(tmp_file_name)
-# End get_migration_data
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        proc.wait()
+    
+    return count
+# End output_migration_data
 
 
-def get_migration_data(config):
+def get_log_cursor(config):
     """
-    Get all migration data from database migration table
+    Returns a cursor used to read the migration log. Default is a cursor of config['conn'].
+    Overide this function in your config file to return a server-side cursor (ex: a psycopg2 named cursor) 
+    so large histories are not buffered by the database module.
     """
     
-    conn = config['conn']
+    return config['conn'].cursor()
+# End get_log_cursor
+
+
+def get_migration_log_sql(config, filters):
+    """
+    Returns (str, tuple)
+    Returns the migration log query and its parameters with the filters pushed into the query:
+        since   : records applied at or after this timestamp
+        until   : records applied at or before this timestamp
+        version : records of this version
+        action  : records of this migration action
+        limit   : only the first (oldest) limit records
+        tail    : only the last (newest) tail records. The rows are returned newest first.
+    If config['include_archive'] is set, the archived records (see compact_migration_history()) are included.
+    """
+    
+    schema = config.get('migration_table_schema', '')
+    marker = config['positional_variable_marker']
+    columns = ', '.join(get_migration_table_columns(config))
+    source = '{}"{}"'.format(schema, config['migration_table_name'])
+    if config.get('include_archive') and check_archive_table(config):
+        # An archive table created by an older release may lack OPTIONAL_COLUMNS
+        archiveColumns = ', '.join(c if c in config['migration_archive_columns'] else 'null as {}'.format(c) for c in get_migration_table_columns(config))
+        source = '(select {0} from {1} union all select {2} from {3}"{4}") h'.format(columns, source, archiveColumns, schema, config['migration_archive_table_name'])
+    
+    conditions = []
+    params = []
+    for key, condition in (('since', 'applied_ts >= {}'), ('until', 'applied_ts <= {}'), ('version', 'version = {}'), ('action', 'migration_action = {}')):
+        if filters.get(key) is not None:
+            conditions.append(condition.format(marker))
+            params.append(filters[key])
+    
+    tail = filters.get('tail') is not None
+    limit = filters['tail'] if tail else filters.get('limit')
+    if limit is not None:
+        params.append(int(limit))
+    
+    sql = """
+select {}
+  from {}
+ where {}
+ order 
+    by applied_ts {}
+{};
+""".format(columns, source, ' and '.join(conditions) or '1 = 1', 'desc' if tail else 'asc', 
+           '' if limit is None else ' limit {}'.format(marker))
+    
+    return sql, tuple(params)
+# End get_migration_log_sql
+
+
+def iter_migration_data(config, filters=None):
+    """
+    Generator. Yields the migration records in applied_ts order.
+    The filters (see get_migration_log_sql()) default to config['log_filters']. Records are fetched in batches 
+    of the batch_size batch setting with fetchmany() from the cursor returned by get_log_cursor().
+    """
+    
+    if filters is None:
+        filters = config.get('log_filters') or {}
+    batchSize = (config.get('batch_settings') or {}).get('batch_size') or 1000
     
     try:
-        with conn.cursor() as cur:
-            sql = """select * from {}{} order by applied_ts;""".format(config.get('migration_table_schema', ''), 
-                                                                            config['migration_table_name'])
-            cur.execute(sql)
-            res = cur.fetchall()
+        sql, params = get_migration_log_sql(config, filters)
+        with get_log_cursor(config) as cur:
+            cur.execute(sql, params)
+            if filters.get('tail') is not None:
+                # At most tail rows, fetched newest first
+                yield from reversed(cur.fetchall())
+            else:
+                while True:
+                    rows = cur.fetchmany(batchSize)
+                    if not rows:
+                        break
+                    yield from rows
+                # End fetch loop
+    finally:
+        config['conn'].rollback()
+# End iter_migration_data
+
+
+def get_migration_data(config):
+    """
+    Get the migration data from database migration table as a list.
+    See iter_migration_data() for the filters and the archived records.
+    """
+    
+    try:
+        res = list(iter_migration_data(config))
     except Exception as e:
         write_log(config, "EXCEPTION:: Getting migration application log ({}).".format(e), level=logging.ERROR)
         if config.get('verbose', False):
             traceback.print_exc(file=sys.stderr)
         return None
-    finally:
-        conn.rollback()
     
     return res
 # End get_migration_data
@@ -1521,15 +4539,45 @@ def get_migration_data(config):
 def migration_log(config):
     """
     Print the migration log
+    The records are streamed from the database to the output (see iter_migration_data() and output_migration_data()).
+    With config['log_format'] 'csv' or 'ndjson' or with config['log_output'] (a file name), the records are exported 
+    without a pager.
     """
     
-    data = get_migration_data(config)
-    if data is None:
-        return 60
-    elif len(data) == 0:
+    if config.get('migration_table_exists') is False:
         write_log(config, "No migration data is available")
-    else:
-        output_migration_data(config, data)
+        return 0
+    
+    import itertools
+    
+    logFormat = config.get('log_format') or 'table'
+    if logFormat not in LOG_FORMATS:
+        write_log(config, "ERROR:: log format must be one of {}".format(', '.join(LOG_FORMATS)), level=logging.ERROR)
+        return 61
+    
+    records = iter_migration_data(config)
+    try:
+        if logFormat != 'table' or config.get('log_output'):
+            writer = {'table': write_migration_data, 'csv': write_migration_data_csv, 'ndjson': write_migration_data_ndjson}[logFormat]
+            if config.get('log_output'):
+                with open(config['log_output'], 'w', encoding='utf-8', newline=('' if logFormat == 'csv' else None)) as out:
+                    count = writer(config, records, out)
+            else:
+                count = writer(config, records, sys.stdout)
+            write_log(config, "Exported {} migration records as {}".format(count, logFormat))
+        else:
+            first = next(records, None)
+            if first is None:
+                write_log(config, "No migration data is available")
+            else:
+                output_migration_data(config, itertools.chain([first], records))
+    except Exception as e:
+        write_log(config, "EXCEPTION:: Getting migration application log ({}).".format(e), level=logging.ERROR)
+        if config.get('verbose', False):
+            traceback.print_exc(file=sys.stderr)
+        return 60
+    finally:
+        records.close()
     
     return 0
 # End dump_migrations
@@ -1544,7 +4592,7 @@ def new_config():
 # End new_config
 
 
-def initialize(configFileName, action, version, sequential=True, verbose=False, chatty=False):
+def initialize(configFileName, action, version, sequential=True, verbose=False, chatty=False, connect=True, **options):
     """
     Perform all initializations for pydbvolve:
         Load config file
@@ -1553,12 +4601,20 @@ def initialize(configFileName, action, version, sequential=True, verbose=False,
         Setup log
         Get DB credentials
         Get DB connection
+    Any extra keyword options (ex: target) are copied into the config dict before the config functions are run.
+    If connect is False, no database credentials or connection are requested.
+    The read-only actions (see READONLY_ACTIONS) set config['read_only'] unless it is given as an option. A read-only run 
+    does not create directories or a log file and uses get_db_readonly_credentials() when it returns credentials.
+    The quiet option suppresses the messages written to stdout before the logger exists (ex: for exports to stdout).
     """
     
-    write_log({}, "Loading config code from '{}'".format(configFileName))
+    # There is no logger yet, so this goes to stdout; the quiet option keeps it off machine-readable output
+    if not options.get('quiet'):
+        write_log({}, "Loading config code from '{}'".format(configFileName))
     load_config(configFileName)
     
     config = new_config()
+    config.update(options)
     config.update({'migration_action': action, 
                    'version': version,
                    'migration_user': get_migration_user(config),
@@ -1566,11 +4622,13 @@ def initialize(configFileName, action, version, sequential=True, verbose=False,
                    'verbose': verbose,
                    'chatty': chatty,
                    'config_file_path': os.path.abspath(configFileName)})
+    config['read_only'] = config.get('read_only', action in READONLY_ACTIONS)
     
     # get_config calls the config setup functions that may be overridden by the config code
     run_config(config)
     
-    confirm_dirs(config)
+    if not config['read_only']:
+        confirm_dirs(config)
     
     setup_log(config)
     msg = "Running {} as user {}".format(os.path.basename(sys.argv[0]), config['migration_user'])
@@ -1578,9 +4636,23 @@ def initialize(configFileName, action, version, sequential=True, verbose=False,
         print(msg)
     write_log(config, msg)
     
+    if connect and not connect_database(config):
+        close_log(config)
+        return None
+    
+    return config
+# End initialize
+
+
+def connect_database(config):
+    """
+    Returns the config dict or None on error.
+    Gets the database credentials and sets the database connection in config['conn'].
+    """
+    
     write_log(config, "Getting DB Credentials")
     try:
-        credentials = get_db_credentials(config)
+        credentials = (get_db_readonly_credentials(config) if config['read_only'] else None) or get_db_credentials(config)
     except Exception as e:
         write_log(config, "EXCEPTION:: Getting database credentials: {}".format(e), level=logging.ERROR)
         return None
@@ -1599,10 +4671,10 @@ def initialize(configFileName, action, version, sequential=True, verbose=False,
         write_log(config, "Failed to get DB credentials", level=logging.ERROR)
     
     return config
-# End initialize
+# End connect_database
 
 
-def run_migration(configFileName, action, version, sequential=True, verbose=False, chatty=False):
+def run_migration(configFileName, action, version, sequential=True, verbose=False, chatty=False, **options):
     """
     Main handler function for pydbvolve. 
     If you intend to import pydbvolve into a larger project, this is the function that should serve as the entry point.
@@ -1611,48 +4683,70 @@ def run_migration(configFileName, action, version, sequential=True, verbose=Fals
         Verification of migrations table
         Resolve action argument to action function
         Execute action function
+    Extra keyword options are passed through to initialize().
+    With the from_status_file option, verify is answered from the status file (see verify_status_file()) 
+    and only falls back to the database if the status file cannot be used.
     """
     
     if not os.access(configFileName, os.F_OK | os.R_OK):
         write_log({}, "Config file '{}' does not exist or cannot be read.".format(configFileName), level=logging.ERROR)
         return 1
     
-    config = initialize(configFileName, action, version, sequential, verbose, chatty)
+    fromStatusFile = (action == 'verify' and bool(options.get('from_status_file')))
+    config = initialize(configFileName, action, version, sequential, verbose, chatty, connect=(action not in OFFLINE_ACTIONS and not fromStatusFile), **options)
     if not config:
         write_log({}, "Error creating config dict. Script cannot run.", level=logging.ERROR)
         return 2
-    if not config.get('conn'):
+    if fromStatusFile:
+        rc = verify_status_file(config)
+        if rc is not None:
+            close_log(config)
+            return rc
+        write_log(config, "Falling back to the database to verify the version")
+        if not connect_database(config):
+            close_log(config)
+            write_log({}, "Error creating config dict. Script cannot run.", level=logging.ERROR)
+            return 2
+    if not config.get('conn') and action not in OFFLINE_ACTIONS:
         write_log(config, "Could not get a database connection. Please verify your credentials and connectivity.", level=logging.ERROR)
+        close_log(config)
         return 3
     
     # Verify action code
     if action not in VALID_ACTIONS:
         write_log(config, "ERROR:: action must be one of {}".format(', '.join(sorted(VALID_ACTIONS))), level=logging.ERROR)
+        close_log(config)
         return 4
     
     # Resolve action code string to action function
     if action == 'baseline':
         if version == LATEST_VERSION:
             write_log(config, "Cannot baseline to 'latest'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         elif version == BASELINE_VERSION:
             write_log(config, "Cannot baseline to 'baseline'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         action = set_baseline
     elif action == 'upgrade':
         if version == CURRENT_VERSION:
             write_log(config, "Cannot upgrade to 'current'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         elif version == BASELINE_VERSION:
             write_log(config, "Cannot upgrade to 'baseline'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         action = run_upgrade
     elif action == 'downgrade':
         if version == LATEST_VERSION:
             write_log(config, "Cannot downgrade to 'latest'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         elif version == CURRENT_VERSION:
             write_log(config, "Cannot downgrade to 'current'", level=logging.ERROR)
+            close_log(config)
             return 5  # re-using this one since it's still an action check
         action = run_downgrade
     elif action == 'info':
@@ -1663,21 +4757,59 @@ def run_migration(configFileName, action, version, sequential=True, verbose=Fals
         action = migration_log
     elif action == 'verify':
         action = verify_version
+    elif action == 'plan':
+        action = compile_migration_plan
+    elif action == 'compact':
+        action = compact_migration_history
+    elif action == 'checksums':
+        action = verify_checksums
     else:
         write_log(config, "Unknown action {}. Exiting.".format(action), level=logging.ERROR)
+        close_log(config)
         return 5
     
-    # Verify migration table
-    write_log(config, "Checking for migrations table")
-    try:
-        migrateTableExists = check_migration_table(config)
-    except Exception as e:
-        write_log(config, "EXCEPTION {}:: Error with migrations table: {}".format(type(e).__name__, e), level=logging.ERROR)
-        return 6
-    if not migrateTableExists:
-        create_migration_table(config)
+    # Only one runner at a time may change the migration table (see acquire_migration_lock())
+    if config.get('migration_lock_settings') and action in (set_baseline, run_upgrade, run_downgrade, compact_migration_history):
+        try:
+            locked = acquire_migration_lock(config)
+        except Exception as e:
+            write_log(config, "EXCEPTION {}:: Acquiring the migration lock: {}".format(type(e).__name__, e), level=logging.ERROR)
+            config['conn'].close()
+            close_log(config)
+            return 13
+        if not locked:
+            msg = "Migrations are up to date"
+            if config.get('chatty'):
+                print(msg)
+            write_log(config, msg)
+            config['conn'].close()
+            close_log(config)
+            return 0
+    
+    # Verify migration table and load the migration state of this run
+    if config.get('conn'):
+        write_log(config, "Checking for migrations table")
+        config['migration_state'] = MigrationState()
+        try:
+            migrateTableExists = check_migration_table(config)
+        except Exception as e:
+            write_log(config, "EXCEPTION {}:: Error with migrations table: {}".format(type(e).__name__, e), level=logging.ERROR)
+            release_migration_lock(config)
+            close_log(config)
+            return 6
+        config['migration_table_exists'] = migrateTableExists
+        if migrateTableExists and not config.get('read_only') and not upgrade_migration_table(config):
+            release_migration_lock(config)
+            close_log(config)
+            return 6
+        if not migrateTableExists:
+            # A read-only run never creates the migration table
+            if not config.get('read_only'):
+                create_migration_table(config)
+            config['migration_state'].load([])
     
     # Perform action
+    rc = None
     try:
         pre_execution(config)
     except Exception as e:
@@ -1688,6 +4820,14 @@ def run_migration(configFileName, action, version, sequential=True, verbose=Fals
     else:
         try:
             rc = action(config)
+            if rc == 0 and action is run_upgrade:
+                rc = run_repeatable_migrations(config)
+            if rc == 0 and action in (run_upgrade, run_downgrade, set_baseline):
+                write_status_file(config)
+            if rc == 0 and action in (run_upgrade, run_downgrade) and (config.get('history_retention') or {}).get('auto_compact'):
+                compact_migration_history(config)
+            if rc != 0 and config.get('lock_heartbeat') is not None and config['lock_heartbeat'].lost.is_set():
+                rc = 14
         except Exception as e:
             write_log(config, "Error performing action {}".format(action.__name__), level=logging.ERROR)
             if config.get('verbose', False):
@@ -1701,12 +4841,189 @@ def run_migration(configFileName, action, version, sequential=True, verbose=Fals
                 if config.get('verbose', False):
                     traceback.print_exc(file=sys.stderr)
                 rc = 9
-        finally:
-            if config.get('conn'):
-                write_log(config, "Closing database connection")
-                config['conn'].close()
-            close_log(config)
+    finally:
+        # Every outcome, including a failed pre-execution, releases the lock and closes the connection and the log
+        if config.get('lock_owner'):
+            release_migration_lock(config, get_catalog_hash(config) if (rc == 0 and action is run_upgrade and version == LATEST_VERSION) else None)
+        if config.get('conn'):
+            write_log(config, "Closing database connection")
+            config['conn'].close()
+        close_migration_bundle(config)
+        unload_migration_support(config)
+        close_log(config)
     
     return rc
 # End run_migration
 
+
+def new_run_journal(action, version, targets):
+    """
+    Returns dict
+    Create a new run journal for a multi-target run. Every target starts in the 'pending' state.
+    """
+    
+    now = dt.now().isoformat()
+    return {'journal_version': JOURNAL_FORMAT_VERSION,
+            'action': action,
+            'version': version,
+            'created_ts': now,
+            'updated_ts': now,
+            'targets': [{'target': t, 'state': 'pending', 'rc': None, 'updated_ts': None} for t in targets]}
+# End new_run_journal
+
+
+def load_run_journal(journalFileName):
+    """
+    Returns dict
+    Read a run journal file. Raises MigrationError if the file is not a valid journal.
+    """
+    
+    with open(journalFileName, 'r') as journalFile:
+        journal = json.load(journalFile)
+    
+    if not isinstance(journal, dict) or journal.get('journal_version') != JOURNAL_FORMAT_VERSION:
+        raise MigrationError("'{}' is not a version {} run journal".format(journalFileName, JOURNAL_FORMAT_VERSION))
+    
+    for entry in journal.get('targets', []):
+        if entry.get('state') not in JOURNAL_STATES:
+            raise MigrationError("Target '{}' has an invalid state '{}' in run journal '{}'".format(entry.get('target'), entry.get('state'), journalFileName))
+    
+    return journal
+# End load_run_journal
+
+
+def save_run_journal(journal, journalFileName):
+    """
+    Atomically write the run journal file. The journal is written to a temp file in the same 
+    directory, flushed to disk and then renamed over the old journal so a crash never leaves a partial journal.
+    """
+    
+    if not journalFileName:
+        return
+    
+    journal['updated_ts'] = dt.now().isoformat()
+    tmpFileName = '{}.{}.tmp'.format(journalFileName, os.getpid())
+    with open(tmpFileName, 'w') as tmpFile:
+        json.dump(journal, tmpFile, indent=1)
+        tmpFile.flush()
+        os.fsync(tmpFile.fileno())
+    
+    os.replace(tmpFileName, journalFileName)
+# End save_run_journal
+
+
+def set_journal_target_state(journal, entry, state, rc=None):
+    """
+    Set the state (and return code) of a target entry in the run journal.
+    """
+    
+    if state not in JOURNAL_STATES:
+        raise MigrationError("Invalid run journal state '{}'".format(state))
+    
+    entry['state'] = state
+    entry['rc'] = rc
+    entry['updated_ts'] = dt.now().isoformat()
+# End set_journal_target_state
+
+
+def get_journal_run_order(journal):
+    """
+    Returns list
+    Returns the target entries that still need to be run. Failed targets (and targets that were 
+    interrupted while running) are retried first, followed by pending targets. Done targets are skipped.
+    """
+    
+    retry = [e for e in journal['targets'] if e['state'] in ('failed', 'running')]
+    pending = [e for e in journal['targets'] if e['state'] == 'pending']
+    
+    return retry + pending
+# End get_journal_run_order
+
+
+def run_fleet_migration(configFileName, action, version, sequential=True, verbose=False, chatty=False, journalFileName=None, resume=False, **options):
+    """
+    Multi-target handler function for pydbvolve. Returns int.
+    Runs the migration action against every target returned by get_migration_targets(). 
+    Each target is run by run_migration() with config['target'] set to the target name.
+    If journalFileName is set, the per-target state is durably recorded in that journal file after every state change.
+    If resume is True, the journal is read and done targets are skipped while failed targets are retried first.
+    """
+    
+    if not os.access(configFileName, os.F_OK | os.R_OK):
+        write_log({}, "Config file '{}' does not exist or cannot be read.".format(configFileName), level=logging.ERROR)
+        return 1
+    
+    load_config(configFileName)
+    config = new_config()
+    config.update(options)
+    config.update({'migration_action': action, 
+                   'version': version,
+                   'sequential': sequential,
+                   'verbose': verbose,
+                   'chatty': chatty,
+                   'config_file_path': os.path.abspath(configFileName)})
+    run_config(config)
+    
+    targets = list(get_migration_targets(config) or [])
+    
+    if resume:
+        try:
+            journal = load_run_journal(journalFileName)
+        except Exception as e:
+            write_log({}, "EXCEPTION {}:: Reading run journal '{}': {}".format(type(e).__name__, journalFileName, e), level=logging.ERROR)
+            return 71
+        
+        if (journal['action'], journal['version']) != (action, version):
+            write_log({}, "ERROR:: Run journal '{}' was written for a different run (action = {}; version = {})".format(journalFileName, journal['action'], journal['version']), level=logging.ERROR)
+            return 71
+        
+        known = {e['target'] for e in journal['targets']}
+        for target in targets:
+            if target not in known:
+                write_log({}, "Adding new target '{}' to run journal".format(target))
+                journal['targets'].append({'target': target, 'state': 'pending', 'rc': None, 'updated_ts': None})
+    else:
+        if not targets:
+            write_log({}, "ERROR:: No migration targets. Implement get_migration_targets() in your config file.", level=logging.ERROR)
+            return 70
+        
+        journal = new_run_journal(action, version, targets)
+    
+    try:
+        save_run_journal(journal, journalFileName)
+    except Exception as e:
+        write_log({}, "EXCEPTION {}:: Writing run journal '{}': {}".format(type(e).__name__, journalFileName, e), level=logging.ERROR)
+        return 71
+    
+    runOrder = get_journal_run_order(journal)
+    skipped = len(journal['targets']) - len(runOrder)
+    msg = "Running {} on {} target(s); {} target(s) already done".format(action, len(runOrder), skipped)
+    if chatty:
+        print(msg)
+    write_log({}, msg)
+    
+    for entry in runOrder:
+        set_journal_target_state(journal, entry, 'running')
+        save_run_journal(journal, journalFileName)
+        
+        if chatty:
+            print("Target {}".format(entry['target']))
+        
+        try:
+            rc = run_migration(configFileName, action, version, sequential, verbose, chatty, target=entry['target'], **options)
+        except Exception as e:
+            write_log({}, "EXCEPTION {}:: Running target {}: {}".format(type(e).__name__, entry['target'], e), level=logging.ERROR)
+            rc = 254
+        
+        set_journal_target_state(journal, entry, 'done' if rc == 0 else 'failed', rc)
+        save_run_journal(journal, journalFileName)
+    # End target loop
+    
+    failed = [e['target'] for e in journal['targets'] if e['state'] != 'done']
+    if failed:
+        write_log({}, "ERROR:: {} target(s) did not complete: {}".format(len(failed), ', '.join(str(t) for t in failed)), level=logging.ERROR)
+        return 72
+    
+    return 0
+# End run_fleet_migration
+
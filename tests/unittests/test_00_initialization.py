@@ -242,7 +242,8 @@ def test_16_confirm_dirs():
     pydbvolve.run_config(config)
     pydbvolve.confirm_dirs(config)
     
-    for dirname in (k for k in config.keys() if k.endswith('_dir')):
+    # Optional directories (ex: cache_dir) may be unset
+    for dirname in (k for k in config.keys() if k.endswith('_dir') and config[k] is not None):
         assert(os.path.exists(config[dirname]))
 # End test_16_confirm_dirs
 
@@ -10,6 +10,7 @@ sys.path.insert(1, os.path.abspath('.'))
 import pydbvolve
 
 TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
 
 
 def _drop_migration_table(config):
@@ -371,3 +372,42 @@ def test_10_add_migration_record():
     assert(res == False)
 # End test_10_add_migration_record
 
+
+def test_11_migration_state():
+    """Verify that the migration state is loaded in one query and kept up to date during a run"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    res = pydbvolve.create_migration_table(config)
+    assert(res)
+    
+    statements = []
+    config['conn'].set_trace_callback(statements.append)
+    config['migration_state'] = pydbvolve.MigrationState()
+    assert(pydbvolve.check_migration_table(config))
+    assert(len([s for s in statements if config['migration_table_name'] in s]) == 1)
+    assert(config['migration_state'].loaded)
+    
+    del statements[:]
+    rc = pydbvolve.run_upgrade(config)
+    assert(rc == 0)
+    tableStatements = [s for s in statements if config['migration_table_name'] in s]
+    assert(not any(s.lstrip().lower().startswith('select') for s in tableStatements))
+    # No current version to clear before the first migration record
+    assert(len([s for s in tableStatements if 'set is_current = 0' in s]) == len([s for s in tableStatements if 'insert' in s]) - 1)
+    config['conn'].set_trace_callback(None)
+    
+    current = pydbvolve.get_current(config)
+    assert(current['version'] == 'r1.3.0')
+    
+    pydbvolve.rollback_migration(config)
+    assert(pydbvolve.get_migration_state(config) is None)
+    assert(pydbvolve.get_current(config)['version'] == current['version'])
+    assert(_count_current(config) == 1)
+    
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_11_migration_state
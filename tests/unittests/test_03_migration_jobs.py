@@ -753,5 +753,580 @@ def test_22_downgrade_baseline(capsys):
 # End test_21_upgrade_baseline_current
 
 
+def test_23_read_only_actions():
+    """Verify that info, verify and log run read-only without creating directories, log files or the migration table"""
+    import shutil
+    
+    statements = []
+    def pre_execution(config):
+        config['conn'].set_trace_callback(statements.append)
+    
+    def get_db_readonly_credentials(config):
+        return {'user': 'reader', 'file': os.path.join(config['base_dir'], 'test_db.sqlite')}
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    shutil.rmtree(os.path.join('tests', 'logs'), ignore_errors=True)
+    
+    pydbvolve.get_db_readonly_credentials = get_db_readonly_credentials
+    pydbvolve.pre_execution = pre_execution
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False)
+    assert(config['read_only'])
+    assert(config['db_user'] == 'reader')
+    assert(config['log_file_name'] is None)
+    config['conn'].close()
+    
+    for action in ('verify', 'info', 'log'):
+        rc = pydbvolve.run_migration(TEST_CONFIG_FILE, action, 'r1.3.1', True, False)
+        assert(rc == (51 if action == 'verify' else 0))
+    assert(not os.path.exists(os.path.join('tests', 'logs')))
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.1', True, False)
+    assert(not config['read_only'])
+    assert(config['db_user'] != 'reader')
+    assert(not pydbvolve.check_migration_table(config))
+    config['conn'].close()
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', 'r1.3.1', True, False)
+    assert(rc == 0)
+    
+    # The current version is answered from the migration state query; the action itself runs no statement
+    del statements[:]
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False)
+    assert(rc == 0)
+    assert(statements == [])
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_23_read_only_actions
+
+
+def test_24_status_file():
+    """Verify that the status file is written after a migration and that verify can be answered from it"""
+    import json
+    import tempfile
+    
+    connections = []
+    def pre_execution(config):
+        connections.append(config['migration_action'])
+    
+    statusFileName = os.path.join(tempfile.mkdtemp(), 'status', 'pydbvolve.json')
+    def get_status_file(base_dir):
+        return statusFileName
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_status_file = get_status_file
+    pydbvolve.pre_execution = pre_execution
+    
+    # No status file yet: verify falls back to the database
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False, from_status_file=True)
+    assert(rc == 51)
+    assert(not os.path.exists(statusFileName))
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False)
+    assert(rc == 0)
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'baseline', 'r1.0.0', True, False)
+    assert(rc == 0)
+    with open(statusFileName, 'r') as statusFile:
+        status = json.load(statusFile)
+    assert(status['current_version'] == 'r1.3.1')
+    assert(status['baseline_version'] == 'r1.0.0')
+    assert(status['applied_ts'] is not None)
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False, connect=False)
+    assert(status['catalog_hash'] == pydbvolve.get_catalog_hash(config))
+    
+    del connections[:]
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False, from_status_file=True) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'verify', 'r1.2.0', True, False, from_status_file=True) == 50)
+    assert(connections == [])
+    
+    # A stale status file is not trusted, and the read-only fallback does not rewrite it
+    os.utime(statusFileName, (0, 0))
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'verify', 'r1.3.1', True, False, from_status_file=True) == 0)
+    assert(connections == ['verify'])
+    assert(os.stat(statusFileName).st_mtime == 0)
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_24_status_file
+
+
+def test_25_migration_lock():
+    """Verify that the migration lock serializes runners and that waiters skip an already applied catalog"""
+    actions = []
+    def pre_execution(config):
+        actions.append(config['migration_action'])
+    
+    def get_migration_lock_settings():
+        return {'lease': 30.0, 'poll_interval': 0.05, 'max_wait': 0.2}
+    
+    def _get_lock(config):
+        with config['conn'].cursor() as cur:
+            cur.execute('select * from "{}";'.format(config['migration_lock_table_name']))
+            lock = cur.fetchone()
+        config['conn'].rollback()
+        return lock
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_migration_lock_settings = get_migration_lock_settings
+    pydbvolve.pre_execution = pre_execution
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False)
+    assert(rc == 0)
+    assert(actions == ['upgrade'])
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False)
+    lock = _get_lock(config)
+    assert(lock['lock_owner'] is None)
+    assert(lock['catalog_hash'] == pydbvolve.get_catalog_hash(config))
+    
+    # The catalog has been applied: no lock is taken and no action is run
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False)
+    assert(rc == 0)
+    assert(actions == ['upgrade'])
+    assert(pydbvolve.acquire_migration_lock(config) == False)
+    
+    # A held lock makes other runners wait and time out; a downgrade clears the stored catalog hash
+    other = pydbvolve.initialize(TEST_CONFIG_FILE, 'downgrade', 'r1.2.0', True, False)
+    assert(pydbvolve.acquire_migration_lock(other))
+    assert(_get_lock(config)['lock_owner'] == other['lock_owner'])
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'baseline', 'r1.0.0', True, False)
+    assert(rc == 13)
+    pydbvolve.release_migration_lock(other)
+    assert(_get_lock(config)['catalog_hash'] is None)
+    other['conn'].close()
+    
+    # An expired lease is taken over and the lease of the holder is renewed
+    with config['conn'].cursor() as cur:
+        cur.execute('update "{}" set lock_owner = ?, expires_at = ?;'.format(config['migration_lock_table_name']), ('crashed', 0.0))
+    config['conn'].commit()
+    config['migration_lock_settings']['lease'] = 0.3
+    assert(pydbvolve.acquire_migration_lock(config))
+    expires = _get_lock(config)['expires_at']
+    pydbvolve.time.sleep(0.25)
+    assert(_get_lock(config)['expires_at'] > expires)
+    pydbvolve.release_migration_lock(config, 'abc')
+    assert(_get_lock(config)['lock_owner'] is None)
+    config['conn'].close()
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_25_migration_lock
 
 
+def test_26_compact_history():
+    """Verify that old migration records are moved to the archive table in batches"""
+    retention = {'keep_days': None, 'keep_rows': 4, 'batch_size': 2, 'auto_compact': False}
+    def get_history_retention():
+        return retention
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_history_retention = get_history_retention
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'downgrade', 'r1.0.0', True, False) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    history = pydbvolve.get_migration_data(config)
+    current = pydbvolve.get_current(config)
+    config['conn'].close()
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    assert([r['applied_ts'] for r in pydbvolve.get_migration_data(config)] == [r['applied_ts'] for r in history[-4:]])
+    assert(pydbvolve.get_current(config)['applied_ts'] == current['applied_ts'])
+    config['include_archive'] = True
+    assert([(r['version'], r['applied_ts']) for r in pydbvolve.get_migration_data(config)] == [(r['version'], r['applied_ts']) for r in history])
+    config['conn'].close()
+    
+    # Nothing to do within the retention limits
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    
+    # The current record is always kept; auto compaction runs after an upgrade
+    retention.update({'keep_days': 0, 'keep_rows': None, 'auto_compact': True})
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'downgrade', 'r1.3.0', True, False) == 0)
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    assert([r['version'] for r in pydbvolve.get_migration_data(config)] == ['r1.3.0'])
+    assert(pydbvolve.get_current(config)['version'] == 'r1.3.0')
+    config['conn'].close()
+    
+    # keep_rows 0 without an age limit archives everything but the current record
+    retention.update({'keep_days': None, 'keep_rows': 0, 'auto_compact': False})
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    assert([r['version'] for r in pydbvolve.get_migration_data(config)] == ['r1.3.1'])
+    config['conn'].close()
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_26_compact_history
+
+
+def test_27_filtered_migration_log():
+    """Verify that the migration log filters are pushed into the query and rows are fetched in batches"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'downgrade', 'r1.0.0', True, False) == 0)
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    config['batch_settings']['batch_size'] = 2
+    history = pydbvolve.get_migration_data(config)
+    
+    records = pydbvolve.iter_migration_data(config, {'action': 'downgrade'})
+    assert(not isinstance(records, list))
+    assert([r['version'] for r in records] == [r['version'] for r in history if r['migration_action'] == 'downgrade'])
+    assert([r['applied_ts'] for r in pydbvolve.iter_migration_data(config, {'version': 'r1.1.0'})] == [r['applied_ts'] for r in history if r['version'] == 'r1.1.0'])
+    assert(list(pydbvolve.iter_migration_data(config, {'limit': 3})) == history[:3])
+    assert(list(pydbvolve.iter_migration_data(config, {'tail': 3})) == history[-3:])
+    assert(list(pydbvolve.iter_migration_data(config, {'limit': 0})) == [])
+    assert(list(pydbvolve.iter_migration_data(config, {'tail': 0, 'limit': None})) == [])
+    assert(list(pydbvolve.iter_migration_data(config, {'since': history[4]['applied_ts'], 'until': history[6]['applied_ts']})) == history[4:7])
+    
+    sql, params = pydbvolve.get_migration_log_sql(config, {'version': 'r1.1.0', 'tail': 2})
+    assert('version = ?' in sql and 'desc' in sql and 'limit ?' in sql)
+    assert(params == ('r1.1.0', 2))
+    
+    config['log_filters'] = {'version': 'r1.3.1'}
+    assert([r['version'] for r in pydbvolve.get_migration_data(config)] == ['r1.3.1'])
+    config['conn'].close()
+    
+    os.unlink(TEST_DB_FILE)
+# End test_27_filtered_migration_log
+
+
+def test_28_stream_migration_log(monkeypatch, capsys):
+    """Verify that the migration log table is streamed to stdout or into the pager as the records are read"""
+    import tempfile
+    
+    consumed = []
+    def records(count):
+        for i in range(count):
+            consumed.append(i)
+            yield {'version': 'r{}'.format(i), 'applied_ts': '2024-01-01 00:00:00', 'migration_file': 'x' * 70, 'migration_action': 'upgrade',
+                   'migration_type': 'sql', 'migration_user': 'me', 'db_user': 'me', 'is_current': 0, 'is_baseline': 0}
+    
+    out = StringIO()
+    assert(pydbvolve.write_migration_data({}, records(2), out) == 2)
+    lines = out.getvalue().splitlines()
+    assert(lines[0].split(' | ')[0].strip() == '#')
+    # The long file name is wrapped over three lines per record
+    assert(len(lines) == 2 + 2 * 3)
+    assert(len(set(len(l) for l in lines)) == 1)
+    
+    # A full checksum is shortened to fit its column instead of being wrapped
+    out = StringIO()
+    record = {'version': 'r1', 'migration_file': 'x.sql', 'checksum': 'ab' * 32}
+    assert(pydbvolve.write_migration_data({}, [record], out) == 1)
+    lines = out.getvalue().splitlines()
+    assert(len(lines) == 3)
+    assert(lines[2].split(' | ')[-1].strip() == 'ab' * 6)
+    
+    # Not a terminal: plain stdout
+    assert(pydbvolve.output_migration_data({}, records(3)) == 3)
+    assert(len(capsys.readouterr().out.splitlines()) == 2 + 3 * 3)
+    
+    # A pager that quits after the first screen stops the stream
+    binDir = tempfile.mkdtemp()
+    screenFileName = os.path.join(binDir, 'screen.txt')
+    with open(os.path.join(binDir, 'less'), 'w') as pager:
+        pager.write('#!/bin/sh\nhead -n 20 > {}\n'.format(screenFileName))
+    os.chmod(os.path.join(binDir, 'less'), 0o755)
+    monkeypatch.setenv('PATH', binDir + os.pathsep + os.environ.get('PATH', ''))
+    monkeypatch.setattr(pydbvolve.sys.stdout, 'isatty', lambda: True)
+    
+    del consumed[:]
+    count = pydbvolve.output_migration_data({}, records(100000))
+    assert(count < 100000)
+    assert(len(consumed) < 100000)
+    with open(screenFileName, 'r') as screen:
+        assert(len(screen.read().splitlines()) == 20)
+# End test_28_stream_migration_log
+
+
+def test_29_export_migration_log(capsys):
+    """Verify that the migration log can be exported as CSV or NDJSON without a pager"""
+    import csv
+    import json
+    import tempfile
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    history = pydbvolve.get_migration_data(config)
+    config['conn'].close()
+    capsys.readouterr()
+    
+    csvFileName = os.path.join(tempfile.mkdtemp(), 'log.csv')
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'log', 'all', True, False, log_format='csv', log_output=csvFileName)
+    assert(rc == 0)
+    assert('Loading config code' in capsys.readouterr().out)
+    with open(csvFileName, 'r', newline='') as csvFile:
+        rows = list(csv.DictReader(csvFile))
+    assert([r['version'] for r in rows] == [r['version'] for r in history])
+    assert(list(rows[0].keys()) == pydbvolve.VALID_COLUMNS)
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'log', 'all', True, False, log_format='ndjson', log_filters={'tail': 2}, quiet=True)
+    assert(rc == 0)
+    records = [json.loads(l) for l in capsys.readouterr().out.splitlines()]
+    assert([r['version'] for r in records] == [r['version'] for r in history[-2:]])
+    assert(records[-1]['is_current'] == 1)
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'log', 'all', True, False, log_format='xml')
+    assert(rc == 61)
+    
+    os.unlink(TEST_DB_FILE)
+# End test_29_export_migration_log
+
+
+def test_30_verify_checksums():
+    """Verify that migration checksums are stored and that changed applied migrations are detected"""
+    import shutil
+    import sqlite3
+    import tempfile
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'checksums', 'all', True, False)
+    config['cache_dir'] = os.path.join(tempfile.mkdtemp(), 'cache')
+    assert(pydbvolve.check_migration_table(config))
+    records = [r for r in pydbvolve.get_migration_data(config) if r['migration_action'] == 'upgrade']
+    assert(len(records) > 1)
+    assert(all(r['checksum'] and len(r['checksum']) == 64 for r in records))
+    assert(pydbvolve.verify_checksums(config) == 0)
+    assert(os.path.exists(os.path.join(config['cache_dir'], 'checksums.json')))
+    
+    migrationsDir = os.path.join(tempfile.mkdtemp(), 'migrations')
+    shutil.copytree(os.path.join('tests', 'migrations'), migrationsDir)
+    config['migration_upgrade_dir'] = os.path.join(migrationsDir, 'upgrades')
+    config['migration_downgrade_dir'] = os.path.join(migrationsDir, 'downgrades')
+    assert(pydbvolve.verify_checksums(config) == 0)
+    with open(os.path.join(config['migration_upgrade_dir'], 'r1.1.0_add_address.sql'), 'a') as migrationFile:
+        migrationFile.write("\n-- changed after it was applied\n")
+    assert(pydbvolve.verify_checksums(config) == 90)
+    config['conn'].close()
+    shutil.rmtree(os.path.dirname(migrationsDir))
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'checksums', 'all', True, False) == 0)
+    
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        # A table created before the checksum column existed is read as is and upgraded by a write run
+        conn = sqlite3.connect(TEST_DB_FILE)
+        conn.execute('alter table __migrations__ drop column checksum;')
+        conn.commit()
+        conn.close()
+        
+        assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'checksums', 'all', True, False) == 0)
+        assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'info', pydbvolve.CURRENT_VERSION, True, False) == 0)
+        assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'downgrade', 'r1.2.9', True, False) == 0)
+        config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+        assert(pydbvolve.check_migration_table(config))
+        records = pydbvolve.get_migration_data(config)
+        assert(records[-1]['checksum'])
+        assert(records[0]['checksum'] is None)
+        config['conn'].close()
+    
+    os.unlink(TEST_DB_FILE)
+# End test_30_verify_checksums
+
+
+def test_31_repeatable_migrations():
+    """Verify that repeatable migrations run after upgrades only when their content changes"""
+    import shutil
+    import tempfile
+    
+    repeatableDir = tempfile.mkdtemp()
+    def get_migration_repeatable_dir(migration_base_dir):
+        return repeatableDir
+    
+    def runs():
+        config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+        with config['conn'].cursor() as cur:
+            cur.execute('select count(*) as "count" from repeatable_runs;')
+            count = cur.fetchone()['count']
+        records = [r for r in pydbvolve.get_migration_data(config) if r['migration_action'] == 'repeatable']
+        current = pydbvolve.get_current(config)
+        config['conn'].close()
+        return count, records, current
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    with open(os.path.join(repeatableDir, 'R_address_types.sql'), 'w') as migrationFile:
+        migrationFile.write("drop view if exists v_address_types;\n--run\n\ncreate view v_address_types as select id, label from address_type;\n--run\n")
+    with open(os.path.join(repeatableDir, 'R_runs.py'), 'w') as migrationFile:
+        migrationFile.write("def run_migration(config, migration):\n"
+                            "    with config['conn'].cursor() as cur:\n"
+                            "        cur.execute('create table if not exists repeatable_runs (run_ts timestamp);')\n"
+                            "        cur.execute('insert into repeatable_runs (run_ts) values (current_timestamp);')\n"
+                            "    return True\n")
+    with open(os.path.join(repeatableDir, 'notes.txt'), 'w') as migrationFile:
+        migrationFile.write("not a migration\n")
+    
+    pydbvolve.get_migration_repeatable_dir = get_migration_repeatable_dir
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    count, records, current = runs()
+    assert(count == 1)
+    assert([r['migration_file'] for r in records] == ['R_address_types.sql', 'R_runs.py'])
+    assert([r['version'] for r in records] == ['R_address_types', 'R_runs'])
+    assert(all(r['is_current'] == 0 and r['is_baseline'] == 0 and r['checksum'] for r in records))
+    assert(current['version'] == 'r1.3.1')
+    
+    # Unchanged repeatables are not run again
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    assert(runs()[0] == 1)
+    
+    # A changed repeatable is run again after the upgrade
+    with open(os.path.join(repeatableDir, 'R_runs.py'), 'a') as migrationFile:
+        migrationFile.write("# changed\n")
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    count, records, current = runs()
+    assert(count == 2)
+    assert([r['migration_file'] for r in records] == ['R_address_types.sql', 'R_runs.py', 'R_runs.py'])
+    assert(current['version'] == 'r1.3.1')
+    
+    # A failing repeatable is rolled back and fails the run
+    with open(os.path.join(repeatableDir, 'R_address_types.sql'), 'w') as migrationFile:
+        migrationFile.write("create view v_address_types as select nope from no_such_table;\n--run\n")
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 25)
+    assert(len(runs()[1]) == 3)
+    
+    # Compaction keeps the latest record of each repeatable
+    os.unlink(os.path.join(repeatableDir, 'R_address_types.sql'))
+    pydbvolve.get_history_retention = lambda: {'keep_days': 0, 'keep_rows': None, 'batch_size': 10, 'auto_compact': False}
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    count, records, current = runs()
+    assert([r['migration_file'] for r in records] == ['R_address_types.sql', 'R_runs.py'])
+    assert(records[1]['applied_ts'] > records[0]['applied_ts'])
+    
+    importlib.reload(pydbvolve)
+    shutil.rmtree(repeatableDir)
+    os.unlink(TEST_DB_FILE)
+# End test_31_repeatable_migrations
+
+
+def test_32_legacy_archive_table():
+    """Verify that an archive table created before the checksum column existed can be read and is upgraded"""
+    import sqlite3
+    
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        return
+    
+    retention = {'keep_days': None, 'keep_rows': 4, 'batch_size': 2, 'auto_compact': False}
+    def get_history_retention():
+        return retention
+    
+    def history(includeArchive):
+        config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+        config['include_archive'] = includeArchive
+        records = pydbvolve.get_migration_data(config)
+        config['conn'].close()
+        return records
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_history_retention = get_history_retention
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False) == 0)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    conn = sqlite3.connect(TEST_DB_FILE)
+    conn.execute('alter table __migrations_archive__ drop column checksum;')
+    conn.commit()
+    conn.close()
+    
+    # Read-only runs select null for the missing column
+    records = history(True)
+    assert(len(records) > 4)
+    assert(records[0]['checksum'] is None)
+    assert(records[-1]['checksum'])
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'log', 'all', True, False, include_archive=True) == 0)
+    
+    # A write run adds the column, then compaction moves the checksums too
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'downgrade', 'r1.2.0', True, False) == 0)
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    assert(pydbvolve.check_archive_table(config))
+    assert(config['migration_archive_columns'] == pydbvolve.VALID_COLUMNS)
+    config['conn'].close()
+    
+    before = history(False)
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'compact', 'all', True, False) == 0)
+    archived = [r for r in history(True) if r['applied_ts'] == before[0]['applied_ts']]
+    assert(archived and archived[0]['checksum'] == before[0]['checksum'])
+    assert(len(history(False)) == 4)
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_32_legacy_archive_table
+
+
+def test_33_migration_lock_lost():
+    """Verify that a run stops applying migrations once another runner has taken its migration lock"""
+    import sqlite3
+    
+    def get_migration_lock_settings():
+        return {'lease': 0.3, 'poll_interval': 0.05, 'max_wait': 1.0}
+    
+    def pre_execution(config):
+        conn = sqlite3.connect(TEST_DB_FILE)
+        conn.execute('update "{}" set lock_owner = ?;'.format(config['migration_lock_table_name']), ('thief',))
+        conn.commit()
+        conn.close()
+        assert(config['lock_heartbeat'].lost.wait(2.0))
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_migration_lock_settings = get_migration_lock_settings
+    pydbvolve.pre_execution = pre_execution
+    
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, True, False)
+    assert(rc == 14)
+    
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'log', 'all', True, False)
+    assert(pydbvolve.get_migration_data(config) == [])
+    with config['conn'].cursor() as cur:
+        cur.execute('select lock_owner from "{}";'.format(config['migration_lock_table_name']))
+        assert(cur.fetchone()['lock_owner'] == 'thief')
+    config['conn'].close()
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_33_migration_lock_lost
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import sqlite3
+import importlib
+import tempfile
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_fleet_run_journal():
+    """Verify that a multi-target run records every target in the run journal"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    journalFileName = os.path.join(tempfile.mkdtemp(), 'run.journal')
+
+    rc = pydbvolve.run_fleet_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, journalFileName=journalFileName)
+    assert(rc != 0)  # No targets configured
+
+    pydbvolve.get_migration_targets = lambda config: ['db1', 'db2']
+    rc = pydbvolve.run_fleet_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, journalFileName=journalFileName)
+    assert(rc == 0)
+
+    journal = pydbvolve.load_run_journal(journalFileName)
+    assert([e['target'] for e in journal['targets']] == ['db1', 'db2'])
+    assert(all(e['state'] == 'done' and e['rc'] == 0 for e in journal['targets']))
+    assert(not any(f.endswith('.tmp') for f in os.listdir(os.path.dirname(journalFileName))))
+
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_01_fleet_run_journal
+
+
+def test_02_fleet_run_resume():
+    """Verify that resuming a run skips done targets and retries failed targets first"""
+    calls = []
+    def fake_run_migration(configFileName, action, version, sequential=True, verbose=False, chatty=False, **options):
+        calls.append(options['target'])
+        return 0
+
+    journalFileName = os.path.join(tempfile.mkdtemp(), 'run.journal')
+    journal = pydbvolve.new_run_journal('upgrade', 'r1.3.0', ['db1', 'db2', 'db3', 'db4'])
+    pydbvolve.set_journal_target_state(journal, journal['targets'][0], 'done', 0)
+    pydbvolve.set_journal_target_state(journal, journal['targets'][2], 'failed', 24)
+    pydbvolve.set_journal_target_state(journal, journal['targets'][3], 'running')
+    pydbvolve.save_run_journal(journal, journalFileName)
+
+    pydbvolve.run_migration = fake_run_migration
+
+    rc = pydbvolve.run_fleet_migration(TEST_CONFIG_FILE, 'upgrade', 'r1.2.0', journalFileName=journalFileName, resume=True)
+    assert(rc != 0)  # Mismatched run
+    assert(calls == [])
+
+    rc = pydbvolve.run_fleet_migration(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', journalFileName=journalFileName, resume=True)
+    assert(rc == 0)
+    assert(calls == ['db3', 'db4', 'db2'])
+
+    journal = pydbvolve.load_run_journal(journalFileName)
+    assert(all(e['state'] == 'done' for e in journal['targets']))
+
+    importlib.reload(pydbvolve)
+# End test_02_fleet_run_resume
+
+
+def test_03_fleet_run_closes_logs():
+    """Verify that every target run removes its log handlers from the shared logger and closes its connection"""
+    import logging
+    
+    def get_migration_targets(config):
+        return ['db1', 'db2', 'db3']
+    
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+    
+    pydbvolve.get_migration_targets = get_migration_targets
+    logger = logging.getLogger('pydbvolve')
+    handlers = list(logger.handlers)
+    
+    journalFileName = os.path.join(tempfile.mkdtemp(), 'run.journal')
+    rc = pydbvolve.run_fleet_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION, journalFileName=journalFileName)
+    assert(rc == 0)
+    assert(logger.handlers == handlers)
+    
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'nope', 'all') == 4)
+    assert(logger.handlers == handlers)
+    
+    # A failed pre-execution also closes the connection and the log
+    configs = []
+    def pre_execution(config):
+        configs.append(config)
+        raise Exception("Force a condition")
+    
+    pydbvolve.pre_execution = pre_execution
+    assert(pydbvolve.run_migration(TEST_CONFIG_FILE, 'upgrade', pydbvolve.LATEST_VERSION) == 7)
+    assert(logger.handlers == handlers)
+    exc = None
+    try:
+        configs[0]['conn'].cursor()
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, sqlite3.ProgrammingError))
+    
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_03_fleet_run_closes_logs
@@ -0,0 +1,287 @@
+import os
+import sys
+import sqlite3
+import importlib
+import tempfile
+from io import StringIO
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def _new_config(version, mode):
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', version, True, False)
+    config['transaction_mode'] = mode
+    if not pydbvolve.check_migration_table(config):
+        pydbvolve.create_migration_table(config)
+
+    return config
+# End _new_config
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_batch_mode():
+    """Verify that a chain of migrations can be applied in a single transaction"""
+    config = _new_config('r1.3.0', 'batch')
+    migrations = pydbvolve.setup_migrations(config)
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc)
+
+    curr = pydbvolve.get_current(config)
+    assert(curr['version'] == 'r1.3.0')
+
+    all_migrations = pydbvolve.get_migration_data(config)
+    assert([m['version'] for m in all_migrations] == [m['version'] for m in migrations[:target + 1]])
+    assert(sum(m['is_current'] for m in all_migrations) == 1)
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_01_batch_mode
+
+
+def test_02_batch_mode_rollback():
+    """Verify that a failure in batch mode rolls back the schema changes and migration records of the whole chain"""
+    def pre_script(config, migration):
+        if migration['version'] == 'r1.2.0':
+            raise Exception("Force a condition")
+
+    config = _new_config('r1.3.0', 'batch')
+    migrations = pydbvolve.setup_migrations(config)
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+
+    pydbvolve.pre_script = pre_script
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc == False)
+
+    assert(pydbvolve.get_current(config) == {})
+    assert(pydbvolve.get_migration_data(config) == [])
+    # The DDL of the migrations that ran before the failure is rolled back too
+    with config['conn'].cursor() as cur:
+        cur.execute("select name from sqlite_master where name in ('person', 'school', 'address');")
+        assert(cur.fetchall() == [])
+
+    config['transaction_mode'] = 'bogus'
+    exc = None
+    try:
+        pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    importlib.reload(pydbvolve)
+    os.unlink(TEST_DB_FILE)
+# End test_02_batch_mode_rollback
+
+
+def test_03_savepoint_mode():
+    """Verify that savepoint mode commits at the commit interval and keeps the work done before a failure"""
+    def pre_script(config, migration):
+        if migration['version'] == 'r1.2.0':
+            raise Exception("Force a condition")
+
+    config = _new_config('r1.3.0', 'savepoint')
+    config['commit_interval'] = (2, None)
+    migrations = pydbvolve.setup_migrations(config)
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+
+    pydbvolve.pre_script = pre_script
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc == False)
+
+    curr = pydbvolve.get_current(config)
+    assert(curr['version'] == 'r1.1.0')
+    all_migrations = pydbvolve.get_migration_data(config)
+    assert([m['version'] for m in all_migrations] == ['r0.0.0', 'r1.0.0', 'r1.1.0'])
+    assert(sum(m['is_current'] for m in all_migrations) == 1)
+
+    importlib.reload(pydbvolve)
+    config['conn'].close()
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['transaction_mode'] = 'savepoint'
+    config['commit_interval'] = (2, None)
+    rc = pydbvolve.run_migration_job(config, migrations, 3, target, 1)
+    assert(rc)
+
+    curr = pydbvolve.get_current(config)
+    assert(curr['version'] == 'r1.3.0')
+    all_migrations = pydbvolve.get_migration_data(config)
+    assert(len(all_migrations) == target + 1)
+    assert(sum(m['is_current'] for m in all_migrations) == 1)
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_03_savepoint_mode
+
+
+def _write_sql_file(dirName, fileName, content):
+    fileName = os.path.join(dirName, fileName)
+    with open(fileName, 'w') as f:
+        f.write(content)
+    return fileName
+# End _write_sql_file
+
+
+def test_04_sql_commit_points():
+    """Verify that '-- run commit' commits the statements before it and records a progress marker"""
+    sql = """
+create table backfill (id integer primary key, data text);
+-- run
+
+insert into backfill (id, data) values (1, 'a');
+-- run commit
+
+insert into backfill (id, data) values (2, 'b');
+-- run
+
+insert into no_such_table (id) values (1);
+-- run
+"""
+    stmts = list(pydbvolve.get_statement_chunks(StringIO(sql)))
+    assert([c for s, c, o in stmts] == [False, True, False, False])
+    assert(stmts[-1][2] == len(sql.encode('utf-8')))
+
+    config = _new_config('r1.3.0', 'script')
+    migration = pydbvolve.get_migration_filename_info(config, _write_sql_file(tempfile.mkdtemp(), 'r9.0.0_backfill.sql', sql))
+
+    exc = None
+    try:
+        pydbvolve.run_sql_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(exc is not None)
+    config['conn'].rollback()
+
+    assert(migration['commit_points'] == 1)
+    assert(migration['committed_statements'] == 2)
+    with config['conn'].cursor() as cur:
+        cur.execute("select id from backfill;")
+        assert([r['id'] for r in cur.fetchall()] == [1])
+
+    config['transaction_mode'] = 'batch'
+    migration = pydbvolve.get_migration_filename_info(config, _write_sql_file(os.path.dirname(migration['filename']), 'r9.0.1_commit.sql', "select 1;\n-- run commit\n"))
+    exc = None
+    try:
+        pydbvolve.run_sql_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_04_sql_commit_points
+
+
+def test_05_sql_checkpoint_resume():
+    """Verify that a failed SQL migration with commit points resumes from its last checkpoint"""
+    sql = """
+create table backfill (id integer primary key, data text);
+-- run commit
+
+insert into backfill (id, data) values (1, 'a');
+-- run commit
+
+insert into backfill (id, data) values (2, 'b');
+-- run
+
+insert into backfill_log (id) values (1);
+-- run
+"""
+    config = _new_config('r1.3.0', 'script')
+    sqlFileName = _write_sql_file(tempfile.mkdtemp(), 'r9.0.0_backfill.sql', sql)
+    migration = pydbvolve.get_migration_filename_info(config, sqlFileName)
+
+    exc = None
+    try:
+        pydbvolve.run_sql_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(exc is not None)
+    config['conn'].rollback()
+
+    checkpoint = pydbvolve.get_sql_checkpoint(config, migration)
+    assert(checkpoint['statement_index'] == 2)
+    assert(checkpoint['byte_offset'] == sql.index('insert into backfill (id, data) values (2') - 1)
+    assert(checkpoint['file_checksum'] == pydbvolve.get_file_checksum(config, sqlFileName))
+
+    with config['conn'].cursor() as cur:
+        cur.execute("create table backfill_log (id integer);")
+    config['conn'].commit()
+
+    migration = pydbvolve.get_migration_filename_info(config, sqlFileName)
+    rc = pydbvolve.run_sql_migration(config, migration)
+    assert(rc)
+    config['conn'].commit()
+
+    with config['conn'].cursor() as cur:
+        cur.execute("select id from backfill order by id;")
+        assert([r['id'] for r in cur.fetchall()] == [1, 2])
+    assert(pydbvolve.get_sql_checkpoint(config, migration) == {})
+
+    # A changed file cannot resume from a checkpoint
+    pydbvolve.save_sql_checkpoint(config, migration, 1, 10)
+    config['conn'].commit()
+    with open(sqlFileName, 'a') as f:
+        f.write("select 1;\n-- run\n")
+    migration = pydbvolve.get_migration_filename_info(config, sqlFileName)
+    exc = None
+    try:
+        pydbvolve.run_sql_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_05_sql_checkpoint_resume
+
+
+def test_06_savepoint_mode_visibility():
+    """Verify that savepoint mode work is only visible to other connections once the commit interval fires"""
+    seen = {}
+    def post_script(config, migration):
+        with sqlite3.connect(TEST_DB_FILE) as other:
+            tables = other.execute("select name from sqlite_master where type = 'table';").fetchall()
+            versions = other.execute('select version from "{}";'.format(config['migration_table_name'])).fetchall()
+        seen[migration['version']] = ({t[0] for t in tables}, [v[0] for v in versions])
+        other.close()
+
+    config = _new_config('r1.3.0', 'savepoint')
+    config['commit_interval'] = (2, None)
+    migrations = pydbvolve.setup_migrations(config)
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+
+    pydbvolve.post_script = post_script
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc)
+
+    assert('person' not in seen['r1.0.0'][0])
+    assert(seen['r1.0.0'][1] == [])
+    for version in ('r1.1.0', 'r1.2.0'):
+        assert('person' in seen[version][0])
+        assert('address' not in seen[version][0])
+        assert(seen[version][1] == ['r0.0.0', 'r1.0.0'])
+
+    importlib.reload(pydbvolve)
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_06_savepoint_mode_visibility
@@ -0,0 +1,154 @@
+import os
+import sys
+import importlib
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def _new_config(rows=250):
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.0.0', True, False)
+    with config['conn'].cursor() as cur:
+        cur.execute("create table measure (id integer primary key, reading integer, doubled integer);")
+        cur.executemany("insert into measure (id, reading) values (?, ?);", [(i, i * 3) for i in range(1, rows + 1)])
+    config['conn'].commit()
+
+    return config
+# End _new_config
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_keyset_batches():
+    """Verify that a table can be iterated and updated in keyset batches"""
+    def double(config, rows):
+        with config['conn'].cursor() as cur:
+            cur.executemany("update measure set doubled = ? where id = ?;", [(r['reading'] * 2, r['id']) for r in rows])
+
+    config = _new_config()
+
+    batches = list(pydbvolve.get_keyset_batches(config, 'measure', 'id', ['reading'], where='reading > ?', params=(30,), batch_size=40))
+    assert(len(batches[0]) == 40)
+    assert([r['id'] for b in batches for r in b] == list(range(11, 251)))
+
+    total = pydbvolve.run_keyset_batches(config, 'measure', 'id', double, batch_size=40)
+    assert(total == 250)
+
+    with config['conn'].cursor() as cur:
+        cur.execute("select count(*) as \"count\" from measure where doubled = reading * 2;")
+        assert(cur.fetchone()['count'] == 250)
+
+    config['transaction_mode'] = 'batch'
+    exc = None
+    try:
+        pydbvolve.run_keyset_batches(config, 'measure', 'id', double)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_01_keyset_batches
+
+
+def test_02_keyset_adaptive_batch_size():
+    """Verify that the keyset batch size adapts toward the target latency within its limits"""
+    config = _new_config(1000)
+    config['batch_settings'] = {'batch_size': 100, 'min_batch_size': 25, 'max_batch_size': 400, 'target_latency': 10.0}
+    sizes = [len(b) for b in pydbvolve.get_keyset_batches(config, 'measure', 'id')]
+    assert(sum(sizes) == 1000)
+    assert(sizes[:3] == [100, 200, 400])
+    assert(max(sizes) == 400)
+
+    config['batch_settings']['target_latency'] = 1e-9
+    sizes = [len(b) for b in pydbvolve.get_keyset_batches(config, 'measure', 'id')]
+    assert(sum(sizes) == 1000)
+    assert(sizes[:3] == [100, 50, 25])
+    assert(min(sizes[:-1]) == 25)
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_02_keyset_adaptive_batch_size
+
+
+def test_03_column_batches():
+    """Verify that derived columns can be backfilled with a columnar batch transform"""
+    def double(arrays):
+        return {'doubled': [v * 2 for v in arrays['reading']]}
+
+    config = _new_config()
+    config['batch_settings']['use_numpy'] = False
+
+    arrays = pydbvolve.get_column_arrays(config, [{'id': 1, 'x': 1.5, 'y': 'a'}, {'id': 2, 'x': 2.5, 'y': None}], ['id', 'x', 'y'])
+    assert(arrays['id'].typecode == 'q')
+    assert(arrays['x'].typecode == 'd')
+    assert(arrays['y'] == ['a', None])
+
+    total = pydbvolve.run_column_batches(config, 'measure', 'id', ['reading'], double, batch_size=64)
+    assert(total == 250)
+
+    with config['conn'].cursor() as cur:
+        cur.execute("select count(*) as \"count\" from measure where doubled = reading * 2;")
+        assert(cur.fetchone()['count'] == 250)
+
+    exc = None
+    try:
+        pydbvolve.run_column_batches(config, 'measure', 'id', ['reading'], lambda arrays: {'doubled': [1]})
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_03_column_batches
+
+
+def test_04_throttle():
+    """Verify that throttling honors the duty cycle, the statement rate and the pressure probe"""
+    probes = []
+    def check_database_pressure(config):
+        probes.append(1)
+        return len(probes) <= 2
+
+    config = _new_config(10)
+    config['throttle_settings'] = {'duty_cycle': 0.5}
+    assert(pydbvolve.throttle(config, 0.02) >= 0.02)
+    assert(pydbvolve.throttle(config, 0.0) == 0.0)
+
+    config['throttle_settings'] = {'max_statements_per_sec': 20}
+    pydbvolve.throttle(config)
+    assert(pydbvolve.throttle(config) > 0.0)
+
+    pydbvolve.check_database_pressure = check_database_pressure
+    config['throttle_settings'] = {'pressure_wait': 0.01}
+    assert(pydbvolve.throttle(config) == 0.02)
+    assert(len(probes) == 3)
+
+    del probes[:]
+    config['throttle_settings'] = {'pressure_wait': 0.01, 'max_pressure_wait': 0.01}
+    exc = None
+    try:
+        pydbvolve.throttle(config)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    importlib.reload(pydbvolve)
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_04_throttle
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import importlib
+import tempfile
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def _new_config():
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.0.0', True, False)
+    with config['conn'].cursor() as cur:
+        cur.execute("create table country (code text primary key, name text, population integer);")
+    config['conn'].commit()
+
+    return config
+# End _new_config
+
+
+def _write_data_file(dirName, fileName, content, header=None):
+    fileName = os.path.join(dirName, fileName)
+    with open(fileName, 'w') as f:
+        f.write(content)
+    if header is not None:
+        with open(fileName + '.json', 'w') as f:
+            json.dump(header, f)
+    return fileName
+# End _write_data_file
+
+
+def _get_countries(config):
+    with config['conn'].cursor() as cur:
+        cur.execute("select code, name, population from country order by code;")
+        return [(r['code'], r['name'], r['population']) for r in cur.fetchall()]
+# End _get_countries
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_csv_data_migration():
+    """Verify that a CSV data migration is discovered and loaded in batches"""
+    config = _new_config()
+    dirName = tempfile.mkdtemp()
+    config['migration_upgrade_dir'] = dirName
+    csvFileName = _write_data_file(dirName, 'r2.0.0_countries.csv',
+                                   "code,name,population\nCA,Canada,38\nFR,France,\nUS,United States,331\n",
+                                   {'table': 'country', 'batch_size': 2, 'null': ''})
+
+    assert(pydbvolve.get_migrations(config) == [csvFileName])
+    migration = pydbvolve.get_migration_filename_info(config, csvFileName)
+    assert(migration['filetype'] == 'csv')
+
+    batches = []
+    pydbvolve.load_data_batch = lambda config, migration, table, columns, rows: batches.append(len(rows))
+    assert(pydbvolve.run_migration_file(config, migration))
+    assert(batches == [2, 1])
+    importlib.reload(pydbvolve)
+
+    assert(pydbvolve.run_data_migration(config, migration))
+    config['conn'].commit()
+    assert(migration['rows_loaded'] == 3)
+    assert(_get_countries(config) == [('CA', 'Canada', 38), ('FR', 'France', None), ('US', 'United States', 331)])
+
+    # Bad row length
+    _write_data_file(dirName, 'r2.0.1_more.csv', "code,name\nDE\n", {'table': 'country'})
+    migration = pydbvolve.get_migration_filename_info(config, os.path.join(dirName, 'r2.0.1_more.csv'))
+    exc = None
+    try:
+        pydbvolve.run_data_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    # Missing header
+    migration = pydbvolve.get_migration_filename_info(config, _write_data_file(dirName, 'r2.0.2_none.csv', "code\nDE\n"))
+    exc = None
+    try:
+        pydbvolve.run_data_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_01_csv_data_migration
+
+
+def test_02_ndjson_data_migration():
+    """Verify that an NDJSON data migration is loaded and recorded like any other migration"""
+    config = _new_config()
+    dirName = tempfile.mkdtemp()
+    ndjson = '{"code": "JP", "name": "Japan", "population": 125}\n\n{"code": "MX", "name": "Mexico"}\n'
+    migration = pydbvolve.get_migration_filename_info(config, _write_data_file(dirName, 'r2.0.0_countries.ndjson', ndjson, {'table': 'country'}))
+    assert(migration['filetype'] == 'ndjson')
+
+    pydbvolve.create_migration_table(config)
+    rc = pydbvolve.run_migration_job(config, [migration], 0, 0, 1)
+    assert(rc)
+
+    assert(_get_countries(config) == [('JP', 'Japan', 125), ('MX', 'Mexico', None)])
+    curr = pydbvolve.get_current(config)
+    assert(curr['version'] == 'r2.0.0')
+    assert(curr['migration_type'] == 'ndjson')
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_02_ndjson_data_migration
+
+
+def test_03_compressed_migrations():
+    """Verify that compressed SQL and data migrations are discovered and stream-decompressed"""
+    import gzip
+    import bz2
+    import lzma
+
+    config = _new_config()
+    dirName = tempfile.mkdtemp()
+    config['migration_upgrade_dir'] = dirName
+    for version, suffix, opener in (('r2.0.0', 'gz', gzip.open), ('r2.0.1', 'bz2', bz2.open), ('r2.0.2', 'xz', lzma.open)):
+        fileName = os.path.join(dirName, '{}_packed.sql.{}'.format(version, suffix))
+        with opener(fileName, 'wt') as f:
+            f.write("insert into country (code, name) values ('{}', 'x');\n-- run\n".format(version))
+    with gzip.open(os.path.join(dirName, 'r2.0.3_countries.csv.gz'), 'wt') as f:
+        f.write("code,name\nZA,South Africa\n")
+    _write_data_file(dirName, 'r2.0.3_countries.csv', '', {'table': 'country'})
+    os.unlink(os.path.join(dirName, 'r2.0.3_countries.csv'))
+
+    migrations = pydbvolve.setup_migrations(config)
+    assert([(m['filetype'], m['compression']) for m in migrations] == [('sql', 'gz'), ('sql', 'bz2'), ('sql', 'xz'), ('csv', 'gz')])
+    for migration in migrations:
+        assert(pydbvolve.run_migration_file(config, migration))
+    config['conn'].commit()
+    assert([c[0] for c in _get_countries(config)] == ['ZA', 'r2.0.0', 'r2.0.1', 'r2.0.2'])
+
+    with pydbvolve.open_migration_file(config, migrations[0], 7) as f:
+        assert(f.read().startswith("into country"))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_03_compressed_migrations
+
+
+def test_04_migration_bundle():
+    """Verify that migrations are discovered and run from a zip bundle without extraction"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    pydbvolve.create_migration_table(config)
+    onDisk = pydbvolve.setup_migrations(config)
+
+    bundleFileName = os.path.join(tempfile.mkdtemp(), 'migrations.zip')
+    count = pydbvolve.write_migration_bundle(config, bundleFileName)
+    assert(count == 13)
+
+    config['migration_bundle_file'] = bundleFileName
+    migrations = pydbvolve.setup_migrations(config)
+    assert([m['version'] for m in migrations] == [m['version'] for m in onDisk])
+    assert(all(m['bundle'] == bundleFileName for m in migrations))
+    assert(migrations[0]['filename'] == 'upgrades/r0.0.0_baseline.sql')
+
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc)
+    assert(pydbvolve.get_current(config)['version'] == 'r1.3.0')
+    assert(pydbvolve.get_migration_checksum(config, migrations[0]) == pydbvolve.get_file_checksum(config, onDisk[0]['filename']))
+
+    pydbvolve.close_migration_bundle(config)
+    assert('migration_bundle' not in config)
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_04_migration_bundle
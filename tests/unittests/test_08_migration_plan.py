@@ -0,0 +1,232 @@
+import os
+import sys
+import importlib
+import tempfile
+import marshal
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_compile_plan():
+    """Verify that a migration plan can be compiled without a database and used to run migrations"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    planFileName = os.path.join(tempfile.mkdtemp(), 'migrations.plan')
+    rc = pydbvolve.run_migration(TEST_CONFIG_FILE, 'plan', 'all', plan_file=planFileName)
+    assert(rc == 0)
+    assert(not os.path.exists(TEST_DB_FILE))
+
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    onDisk = pydbvolve.setup_migrations(config)
+
+    config['migration_plan_file'] = planFileName
+    config.pop('migration_plan', None)
+    plan = pydbvolve.get_migration_plan(config)
+    assert(plan is not None)
+    assert(len(plan['downgrades']) == 6)
+
+    migrations = pydbvolve.setup_migrations(config)
+    assert([m['filename'] for m in migrations] == [m['filename'] for m in onDisk])
+    assert(all(m['file_checksum'] == pydbvolve.get_file_checksum(config, m['filename']) for m in migrations))
+    for migration in migrations:
+        if migration['filetype'] == 'sql':
+            with pydbvolve.open_migration_file(config, migration) as sqlFile:
+                expected = [s for s, c, o in pydbvolve.get_statement_chunks(sqlFile)]
+            assert([s for i, s, c, o in pydbvolve.get_migration_statements(config, migration)] == expected)
+        else:
+            assert(migration['code'] is not None)
+
+    pydbvolve.create_migration_table(config)
+    target = pydbvolve.find_migration_file_version(config, migrations, 'r1.3.0')
+    rc = pydbvolve.run_migration_job(config, migrations, 0, target, 1)
+    assert(rc)
+    assert(pydbvolve.get_current(config)['version'] == 'r1.3.0')
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_01_compile_plan
+
+
+def test_02_stale_plan():
+    """Verify that a stale or foreign plan is ignored in favor of the migration files"""
+    dirName = tempfile.mkdtemp()
+    planFileName = os.path.join(dirName, 'migrations.plan')
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['conn'].close()
+    config['migration_upgrade_dir'] = os.path.join(dirName, 'upgrades')
+    config['migration_downgrade_dir'] = os.path.join(dirName, 'downgrades')
+    os.makedirs(config['migration_upgrade_dir'])
+    sqlFileName = os.path.join(config['migration_upgrade_dir'], 'r1.0.0_first.sql')
+    with open(sqlFileName, 'w') as f:
+        f.write("select 1;\n-- run\n")
+
+    config['plan_file'] = config['migration_plan_file'] = planFileName
+    assert(pydbvolve.compile_migration_plan(config) == 0)
+    assert(pydbvolve.get_migration_plan(config) is not None)
+    assert(pydbvolve.setup_migrations(config)[0]['statements'] == [(0, 10, False, 17)])
+
+    # Changed content keeps the plan but fails the planned migration when it is executed
+    with open(sqlFileName, 'a') as f:
+        f.write("select 2;\n-- run\n")
+    config.pop('migration_plan', None)
+    assert(pydbvolve.get_migration_plan(config) is not None)
+    migration = pydbvolve.setup_migrations(config)[0]
+    exc = None
+    try:
+        pydbvolve.run_migration_file(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+    assert(pydbvolve.get_catalog_checksums(config, [migration])[migration['filename']] == pydbvolve.get_file_checksum(config, sqlFileName))
+
+    # A renamed file makes the plan stale
+    os.rename(sqlFileName, os.path.join(config['migration_upgrade_dir'], 'r1.0.0_renamed.sql'))
+    config.pop('migration_plan', None)
+    assert(pydbvolve.get_migration_plan(config) is None)
+    assert('statements' not in pydbvolve.setup_migrations(config)[0])
+
+    assert(pydbvolve.compile_migration_plan(config) == 0)
+    with open(planFileName, 'rb') as f:
+        plan = marshal.load(f)
+    plan['python'] = b'\x00\x00\r\n'
+    with open(planFileName, 'wb') as f:
+        marshal.dump(plan, f)
+    config.pop('migration_plan', None)
+    assert(pydbvolve.get_migration_plan(config) is None)
+
+    os.unlink(TEST_DB_FILE)
+# End test_02_stale_plan
+
+
+def test_03_bytecode_cache():
+    """Verify that Python migrations and config files are compiled once and then loaded from the code caches"""
+    def no_compile(*args, **kwargs):
+        raise Exception("compile() should not be called")
+
+    dirName = tempfile.mkdtemp()
+    pyFileName = os.path.join(dirName, 'r1.0.0_cached.py')
+    with open(pyFileName, 'w') as f:
+        f.write("def run_migration(config, migration):\n    return 42\n")
+    config = {'cache_dir': os.path.join(dirName, 'cache')}
+
+    mod = pydbvolve.import_arbitrary(pyFileName, 'pv_mg_r1.0.0', config=config)
+    assert(mod.run_migration(None, None) == 42)
+    assert(len(os.listdir(os.path.join(dirName, 'cache', 'bytecode'))) == 1)
+
+    # Cache hits from disk skip compilation
+    pydbvolve._CODE_CACHE.clear()
+    pydbvolve.compile = no_compile
+    try:
+        mod = pydbvolve.import_arbitrary(pyFileName, 'pv_mg_r1.0.0', config=config)
+        assert(mod.run_migration(None, None) == 42)
+    finally:
+        del pydbvolve.compile
+
+    # Changed source is recompiled
+    with open(pyFileName, 'a') as f:
+        f.write("VALUE = 1\n")
+    mod = pydbvolve.import_arbitrary(pyFileName, 'pv_mg_r1.0.0', config=config)
+    assert(mod.VALUE == 1)
+    assert(len(os.listdir(os.path.join(dirName, 'cache', 'bytecode'))) == 2)
+
+    # Without a cache dir, invalidate_caches is only called once per run
+    calls = []
+    invalidate_caches = importlib.invalidate_caches
+    importlib.invalidate_caches = lambda: calls.append(1)
+    try:
+        config = {}
+        pydbvolve.import_arbitrary(pyFileName, 'pv_mg_r1.0.0', config=config)
+        pydbvolve.import_arbitrary(pyFileName, 'pv_mg_r1.0.0', config=config)
+    finally:
+        importlib.invalidate_caches = invalidate_caches
+    assert(len(calls) == 1)
+
+    # The config file code is only cached in memory
+    pydbvolve._CODE_CACHE.clear()
+    pydbvolve.load_config(TEST_CONFIG_FILE)
+    assert(not os.path.exists(os.path.join(os.path.dirname(TEST_CONFIG_FILE), '__pycache__')))
+    pydbvolve.compile = no_compile
+    try:
+        pydbvolve.load_config(TEST_CONFIG_FILE)
+    finally:
+        del pydbvolve.compile
+    importlib.reload(pydbvolve)
+# End test_03_bytecode_cache
+
+
+def test_04_relocated_plan():
+    """Verify that a plan stays valid when the migrations and the plan are copied to another path"""
+    import shutil
+    import time
+
+    buildDir = tempfile.mkdtemp()
+    planFileName = os.path.join(buildDir, 'migrations.plan')
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['conn'].close()
+    config['plan_file'] = planFileName
+    assert(pydbvolve.compile_migration_plan(config) == 0)
+
+    # Deploy: another checkout path and new file modification times
+    time.sleep(0.01)
+    deployDir = tempfile.mkdtemp()
+    shutil.copytree(os.path.join('tests', 'migrations'), os.path.join(deployDir, 'migrations'), copy_function=shutil.copy)
+    shutil.copy(planFileName, os.path.join(deployDir, 'migrations.plan'))
+    config['migration_upgrade_dir'] = os.path.join(deployDir, 'migrations', 'upgrades')
+    config['migration_downgrade_dir'] = os.path.join(deployDir, 'migrations', 'downgrades')
+    config['migration_plan_file'] = os.path.join(deployDir, 'migrations.plan')
+    config['cache_dir'] = os.path.join(deployDir, 'cache')
+    config.pop('migration_plan', None)
+
+    # The plan is checked without reading any migration file
+    def no_checksum(*args, **kwargs):
+        raise Exception("migration files should not be hashed")
+    get_migration_checksum = pydbvolve.get_migration_checksum
+    pydbvolve.get_migration_checksum = no_checksum
+    try:
+        assert(pydbvolve.get_migration_plan(config) is not None)
+        migrations = pydbvolve.setup_migrations(config)
+    finally:
+        pydbvolve.get_migration_checksum = get_migration_checksum
+    assert(all(m['filename'].startswith(config['migration_upgrade_dir']) for m in migrations))
+    assert(all('statements' in m for m in migrations if m['filetype'] == 'sql'))
+
+    # Changed content is still detected when the migration is executed
+    with open(os.path.join(config['migration_upgrade_dir'], 'r1.1.0_add_address.sql'), 'a') as f:
+        f.write("-- changed\n")
+    migration = [m for m in migrations if m['version'] == 'r1.1.0'][0]
+    pydbvolve.check_plan_migration(config, migrations[0])
+    exc = None
+    try:
+        pydbvolve.check_plan_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    # So is an added migration file
+    shutil.copy(planFileName, config['migration_plan_file'])
+    shutil.copy(os.path.join('tests', 'migrations', 'upgrades', 'r1.1.0_add_address.sql'), config['migration_upgrade_dir'])
+    with open(os.path.join(config['migration_upgrade_dir'], 'r1.4.0_more.sql'), 'w') as f:
+        f.write("select 1;\n-- run\n")
+    config.pop('migration_plan', None)
+    assert(pydbvolve.get_migration_plan(config) is None)
+
+    shutil.rmtree(buildDir)
+    shutil.rmtree(deployDir)
+    os.unlink(TEST_DB_FILE)
+# End test_04_relocated_plan
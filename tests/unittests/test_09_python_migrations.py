@@ -0,0 +1,211 @@
+import os
+import sys
+import importlib
+import tempfile
+
+# Set path to force the import of the local module
+sys.path.insert(1, os.path.abspath('.'))
+import pydbvolve
+
+TEST_CONFIG_FILE = os.path.join('tests', 'pydbvolve.conf')
+TEST_DB_FILE = os.path.join('tests', 'test_db.sqlite')
+
+
+def _write_file(dirName, fileName, content):
+    fileName = os.path.join(dirName, fileName)
+    with open(fileName, 'w') as f:
+        f.write(content)
+    return fileName
+# End _write_file
+
+
+def test_00_local_module(capsys):
+    """Verify that we are using the local module."""
+    with capsys.disabled():
+        assert('site-packages' not in '|'.join(pydbvolve.__path__))
+        assert('dist-packages' not in '|'.join(pydbvolve.__path__))
+# End test_00_local_module
+
+
+def test_01_migration_support():
+    """Verify that the migration support module is imported once and shared with its run cache"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    dirName = tempfile.mkdtemp()
+    supportDir = os.path.join(dirName, 'pv_support')
+    os.makedirs(supportDir)
+    _write_file(supportDir, '__init__.py', "LOADS = []\nLOADS.append(1)\nfrom . import tables\n")
+    _write_file(supportDir, 'tables.py', "SQUARES = [i * i for i in range(10)]\n")
+    migration = """
+import pv_support.tables
+
+def run_migration(config, migration):
+    run_cache.setdefault('seen', []).append(migration['version'])
+    return migration_support.tables.SQUARES[3] == 9 and pv_support.tables is migration_support.tables
+"""
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['migration_support_path'] = supportDir
+    migrations = [pydbvolve.get_migration_filename_info(config, _write_file(dirName, fn, migration)) for fn in ('r9.0.0_a.py', 'r9.0.1_b.py')]
+
+    for migration in migrations:
+        assert(pydbvolve.run_python_migration(config, migration))
+
+    assert(config['migration_support'].LOADS == [1])
+    assert(config['run_cache']['seen'] == ['r9.0.0', 'r9.0.1'])
+    assert('pv_support' in sys.modules)
+
+    pydbvolve.unload_migration_support(config)
+    assert('pv_support' not in sys.modules)
+    assert('pv_support.tables' not in sys.modules)
+    assert('run_cache' not in config)
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_01_migration_support
+
+
+def test_02_isolated_python_migration():
+    """Verify that Python migrations can run in an isolated worker process with limits"""
+    import logging
+
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.messages = []
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    dirName = tempfile.mkdtemp()
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['python_migration_isolation'] = {'memory_limit': None, 'cpu_limit': 10, 'timeout': 30}
+    handler = ListHandler()
+    config['logger'].addHandler(handler)
+    with config['conn'].cursor() as cur:
+        cur.execute("create table worker (pid integer);")
+    config['conn'].commit()
+
+    migration = pydbvolve.get_migration_filename_info(config, _write_file(dirName, 'r9.0.0_worker.py', """
+import os
+
+def run_migration(config, migration):
+    config['write_log'](config, 'hello from the worker')
+    with config['conn'].cursor() as cur:
+        cur.execute("insert into worker (pid) values (?);", (os.getpid(),))
+    return True
+"""))
+    assert(pydbvolve.run_python_migration(config, migration))
+    assert('hello from the worker' in handler.messages)
+    with config['conn'].cursor() as cur:
+        cur.execute("select pid from worker;")
+        pids = [r['pid'] for r in cur.fetchall()]
+    assert(len(pids) == 1 and pids[0] != os.getpid())
+
+    # Exceptions in the worker fail the migration
+    migration = pydbvolve.get_migration_filename_info(config, _write_file(dirName, 'r9.0.1_fail.py', """
+def run_migration(config, migration):
+    raise ValueError('bad data')
+"""))
+    exc = None
+    try:
+        pydbvolve.run_python_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+    assert('bad data' in str(exc))
+
+    # Runaway workers are killed
+    config['python_migration_isolation']['timeout'] = 0.5
+    migration = pydbvolve.get_migration_filename_info(config, _write_file(dirName, 'r9.0.2_slow.py', """
+import time
+
+def run_migration(config, migration):
+    time.sleep(30)
+    return True
+"""))
+    exc = None
+    try:
+        pydbvolve.run_python_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    # Isolation needs the script transaction mode
+    config['transaction_mode'] = 'batch'
+    exc = None
+    try:
+        pydbvolve.run_python_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+
+    config['logger'].removeHandler(handler)
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_02_isolated_python_migration
+
+
+def test_03_isolated_memory_limit():
+    """Verify that the memory limit of an isolated worker fails the migration instead of the main process"""
+    try:
+        os.unlink(TEST_DB_FILE)
+    except:
+        pass
+
+    with open('/proc/self/statm') as f:
+        vsize = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+
+    dirName = tempfile.mkdtemp()
+    config = pydbvolve.initialize(TEST_CONFIG_FILE, 'upgrade', 'r1.3.0', True, False)
+    config['python_migration_isolation'] = {'memory_limit': vsize + 256 * 1024 * 1024}
+    migration = pydbvolve.get_migration_filename_info(config, _write_file(dirName, 'r9.0.0_leak.py', """
+def run_migration(config, migration):
+    data = bytearray(2 * 1024 * 1024 * 1024)
+    return True
+"""))
+    exc = None
+    try:
+        pydbvolve.run_python_migration(config, migration)
+    except Exception as e:
+        exc = e
+    assert(isinstance(exc, pydbvolve.MigrationError))
+    assert('MemoryError' in str(exc))
+
+    config['conn'].close()
+    os.unlink(TEST_DB_FILE)
+# End test_03_isolated_memory_limit
+
+
+def test_04_shadowing_migration_support():
+    """Verify that a support module named like an imported module does not replace it after the run"""
+    import json
+    import json.decoder
+
+    dirName = tempfile.mkdtemp()
+    config = {'migration_support_path': _write_file(dirName, 'json.py', "SUPPORT = True\n")}
+
+    mod = pydbvolve.get_migration_support(config)
+    assert(sys.modules['json'] is mod)
+    assert('json.decoder' not in sys.modules)
+
+    pydbvolve.unload_migration_support(config)
+    assert(sys.modules['json'] is json)
+    assert(sys.modules['json.decoder'] is json.decoder)
+    assert(json.loads('[1]') == [1])
+
+    # A support module that fails to load restores the shadowed modules as well
+    config = {'migration_support_path': _write_file(dirName, 'json.py', "raise ValueError('broken')\n")}
+    try:
+        pydbvolve.get_migration_support(config)
+    except ValueError:
+        pass
+    assert(sys.modules['json'] is json)
+    assert(sys.modules['json.decoder'] is json.decoder)
+# End test_04_shadowing_migration_support